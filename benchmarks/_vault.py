@@ -0,0 +1,30 @@
+"""Builds synthetic vaults for the benchmarks."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from controller.password_manager import PasswordManager  # noqa: E402
+from controller.vault_transfer import VaultTransfer  # noqa: E402
+from model.database import DatabaseManager  # noqa: E402
+
+MASTER_KEY = 'benchmark'
+
+
+def create_vault(path, size, master_key=MASTER_KEY, pragmas=None):
+    """Creates a vault with ``size`` synthetic entries and returns its unlocked password manager."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db_manager = DatabaseManager(path, pragmas)
+    db_manager.set_master_key_hash_and_salt(PasswordManager.hash_string(master_key), os.urandom(32))
+    password_manager = PasswordManager(master_key, db_manager)
+    password_manager.set_key_fernat()
+    entries = ((service_name(i), PasswordManager.generate_password(16)) for i in range(size))
+    VaultTransfer(password_manager, chunk_size=5000).import_entries(entries)
+    return password_manager
+
+
+def service_name(i):
+    return f'service-{i:07d}.example.com'
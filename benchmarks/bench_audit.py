@@ -0,0 +1,54 @@
+"""Compares a serial decrypt-everything audit with the streaming, parallel vault audit.
+
+Usage:
+    python benchmarks/bench_audit.py [--size 100000] [--workers 1 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _vault import create_vault  # noqa: E402
+from controller.audit import VaultAudit, score_password  # noqa: E402
+from controller.password_generator import PasswordPolicy  # noqa: E402
+
+
+def _serial(password_manager):
+    """The audit without the engine: every password decrypted and kept in memory."""
+    policy = PasswordPolicy()
+    rows = password_manager.db_manager.get_all_passwords()
+    passwords = {service: password_manager.decrypt_password(encrypted_password)
+                 for service, encrypted_password in rows}
+    weak = [service for service, password in passwords.items() if score_password(password, policy)[1]]
+    reused = [password for password, count in Counter(passwords.values()).items() if count > 1]
+    return weak, reused
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run(size, workers):
+    with tempfile.TemporaryDirectory() as directory:
+        password_manager = create_vault(os.path.join(directory, 'bench_db'), size)
+        print(f"{'audit':>10} {'workers':>7} {'seconds':>9} {'entries/s':>10} {'speedup':>8}")
+        baseline = _timed(_serial, password_manager)
+        print(f"{'serial':>10} {1:>7} {baseline:>9.3f} {size / baseline:>10.0f} {1:>7.2f}x")
+        for count in workers:
+            seconds = _timed(VaultAudit(password_manager, workers=count).run)
+            print(f"{'streaming':>10} {count:>7} {seconds:>9.3f} {size / seconds:>10.0f} {baseline / seconds:>7.2f}x")
+        password_manager.db_manager.close_connection()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+    run(args.size, args.workers)
@@ -0,0 +1,77 @@
+"""Compares the SQLite and the memory-mapped log store backends on lookups and resident memory.
+
+Each backend is measured in a fresh interpreter so resident memory is not shared between them.
+
+Usage:
+    python benchmarks/bench_backends.py [--size 100000] [--lookups 20000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from _vault import ROOT, create_vault
+
+from model.log_store import LogStoreManager, sqlite_to_log
+
+MEASURE_SNIPPET = """
+import json, random, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+from model.database import DatabaseManager
+from model.log_store import LogStoreManager
+
+backend, path, size, lookups = sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5])
+
+def rss_mib():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+baseline = rss_mib()
+start = time.perf_counter()
+store = DatabaseManager(path) if backend == 'sqlite' else LogStoreManager(path)
+opened = time.perf_counter() - start
+services = [f'service-{random.randrange(size):07d}.example.com' for _ in range(lookups)]
+start = time.perf_counter()
+for service in services:
+    store.get_password(service)
+lookup = (time.perf_counter() - start) / lookups
+start = time.perf_counter()
+store.get_all_passwords()
+scan = time.perf_counter() - start
+print(json.dumps({'open_ms': opened * 1000, 'get_password_us': lookup * 1e6, 'get_all_passwords_ms': scan * 1000,
+                  'rss_mib': rss_mib() - baseline}))
+"""
+
+
+def measure(backend, path, size, lookups):
+    output = subprocess.run([sys.executable, '-c', MEASURE_SNIPPET, ROOT, backend, path, str(size), str(lookups)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def run(size, lookups):
+    directory = tempfile.mkdtemp()
+    sqlite_path = os.path.join(directory, 'vault.db')
+    log_path = os.path.join(directory, 'vault.pmlog')
+    password_manager = create_vault(sqlite_path, size)
+    log_store = LogStoreManager(log_path)
+    sqlite_to_log(password_manager.db_manager, log_store)
+    log_store.close_connection()
+    password_manager.db_manager.close_connection()
+
+    results = {backend: measure(backend, path, size, lookups)
+               for backend, path in (('sqlite', sqlite_path), ('log', log_path))}
+    print(f"size={size} lookups={lookups}")
+    print(f"{'metric':>22} {'sqlite':>10} {'log store':>10}")
+    for metric in results['sqlite']:
+        print(f"{metric:>22} {results['sqlite'][metric]:>10.2f} {results['log'][metric]:>10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+    run(args.size, args.lookups)
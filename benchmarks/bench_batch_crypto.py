@@ -0,0 +1,52 @@
+"""Compares serial and parallel batch encryption/decryption against vault size.
+
+Usage:
+    python benchmarks/bench_batch_crypto.py [--sizes 1000 10000 100000] [--workers N]
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controller.password_manager import PasswordManager  # noqa: E402
+
+
+class _NoDatabase:
+    """Stands in for the DatabaseManager, the batch APIs never touch the database."""
+
+    def get_salt(self):
+        return os.urandom(32)
+
+    def get_kdf_params(self):
+        return None
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def run(sizes, workers):
+    password_manager = PasswordManager('benchmark', _NoDatabase())
+    password_manager.key = base64.urlsafe_b64encode(os.urandom(32))
+    print(f"{'size':>8} {'op':>8} {'serial s':>10} {'parallel s':>11} {'speedup':>8}")
+    for size in sizes:
+        passwords = [PasswordManager.generate_password(16) for _ in range(size)]
+        serial, tokens = _timed(password_manager.encrypt_many, passwords, 1)
+        parallel, _ = _timed(password_manager.encrypt_many, passwords, workers)
+        print(f"{size:>8} {'encrypt':>8} {serial:>10.3f} {parallel:>11.3f} {serial / parallel:>7.2f}x")
+        serial, _ = _timed(password_manager.decrypt_many, tokens, 1)
+        parallel, _ = _timed(password_manager.decrypt_many, tokens, workers)
+        print(f"{size:>8} {'decrypt':>8} {serial:>10.3f} {parallel:>11.3f} {serial / parallel:>7.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    run(args.sizes, args.workers)
@@ -0,0 +1,49 @@
+"""Reports memory per entry and lookup times of the in-memory service catalog.
+
+Usage:
+    python benchmarks/bench_catalog.py [--sizes 100000 1000000] [--lookups 10000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from _vault import service_name
+
+from controller.service_catalog import ServiceCatalog
+
+
+def _per_op_us(function, values):
+    start = time.perf_counter()
+    for value in values:
+        function(value)
+    return (time.perf_counter() - start) / len(values) * 1e6
+
+
+def run(sizes, lookups):
+    print(f"{'size':>8} {'bytes/entry':>12} {'build s':>8} {'prefix us':>10} {'contains us':>12} "
+          f"{'add us':>8} {'remove us':>10}")
+    for size in sizes:
+        tracemalloc.start()
+        start = time.perf_counter()
+        catalog = ServiceCatalog(service_name(i) for i in range(size))
+        build = time.perf_counter() - start
+        per_entry = tracemalloc.get_traced_memory()[0] / size
+        tracemalloc.stop()
+
+        prefixes = [service_name(random.randrange(size))[:14] for _ in range(lookups)]
+        services = [service_name(random.randrange(size)) for _ in range(lookups)]
+        new = [f'new-{i}' for i in range(min(lookups, 1000))]
+        prefix = _per_op_us(lambda query: catalog.search(query, limit=50), prefixes)
+        contains = _per_op_us(catalog.__contains__, services)
+        add = _per_op_us(catalog.add, new)
+        remove = _per_op_us(catalog.remove, new)
+        print(f"{size:>8} {per_entry:>12.1f} {build:>8.2f} {prefix:>10.2f} {contains:>12.2f} {add:>8.2f} {remove:>10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--lookups', type=int, default=10000)
+    args = parser.parse_args()
+    run(args.sizes, args.lookups)
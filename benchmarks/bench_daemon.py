@@ -0,0 +1,65 @@
+"""Measures requests per second and latency percentiles of the secret-serving daemon.
+
+Usage:
+    python benchmarks/bench_daemon.py [--size 10000] [--clients 32] [--requests 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from _vault import create_vault, service_name
+
+from controller.secret_server import SecretServer
+from model.async_database import AsyncDatabaseManager
+
+
+async def _client(path, size, requests, latencies):
+    reader, writer = await asyncio.open_unix_connection(path)
+    for _ in range(requests):
+        line = json.dumps({'op': 'get', 'service': service_name(random.randrange(size))}).encode() + b'\n'
+        start = time.perf_counter()
+        writer.write(line)
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        assert response['ok'], response
+    writer.close()
+
+
+async def run(size, clients, requests, batch_window):
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, 'vault.db')
+    socket_path = os.path.join(directory, 'daemon.sock')
+    password_manager = create_vault(db_path, size)
+
+    async with AsyncDatabaseManager(db_path) as db_manager:
+        secret_server = SecretServer(password_manager, db_manager, batch_window=batch_window)
+        server = await secret_server.start(path=socket_path)
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*(_client(socket_path, size, requests, latencies) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        server.close()
+        await server.wait_closed()
+        await secret_server.stop()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"size={size} clients={clients} batch_window={batch_window}")
+    print(f"  requests/s: {len(latencies) / elapsed:10.0f}")
+    print(f"  p50 ms:     {quantiles[49] * 1000:10.2f}")
+    print(f"  p99 ms:     {quantiles[98] * 1000:10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--batch-window', type=float, default=0.001)
+    args = parser.parse_args()
+    asyncio.run(run(args.size, args.clients, args.requests, args.batch_window))
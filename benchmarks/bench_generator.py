@@ -0,0 +1,49 @@
+"""Compares per-character secrets.choice generation with the batch password generator.
+
+Usage:
+    python benchmarks/bench_generator.py [--counts 1000 100000] [--length 16]
+"""
+import argparse
+import os
+import secrets
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controller.password_generator import PasswordGenerator, PasswordPolicy  # noqa: E402
+
+
+def _choice_loop(count, length):
+    all_characters = string.ascii_letters + string.digits + string.punctuation
+    return [''.join(secrets.choice(all_characters) for _ in range(length)) for _ in range(count)]
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run(counts, length):
+    policies = {
+        'batch': PasswordPolicy(length=length, require_each=False),
+        'batch+classes': PasswordPolicy(length=length),
+        'passphrase': PasswordPolicy(words=max(length // 3, 1)),
+    }
+    print(f"{'count':>8} {'generator':>14} {'seconds':>9} {'passwords/s':>12} {'speedup':>8}")
+    for count in counts:
+        baseline = _timed(_choice_loop, count, length)
+        print(f"{count:>8} {'secrets.choice':>14} {baseline:>9.3f} {count / baseline:>12.0f} {1:>7.2f}x")
+        for name, policy in policies.items():
+            seconds = _timed(PasswordGenerator(policy).generate_many, count)
+            print(f"{count:>8} {name:>14} {seconds:>9.3f} {count / seconds:>12.0f} {baseline / seconds:>7.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--length', type=int, default=16)
+    args = parser.parse_args()
+    run(args.counts, args.length)
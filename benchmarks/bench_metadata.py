@@ -0,0 +1,70 @@
+"""Compares the indexed metadata queries with full table scans answering the same questions.
+
+Every entry carries one of a hundred tags, ``--tagged`` entries carry one more and are changed last.
+
+Usage:
+    python benchmarks/bench_metadata.py [--size 100000] [--tagged 1000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _vault import create_vault, service_name  # noqa: E402
+
+# The scans are the same queries, a unary + keeps SQLite from using the index.
+_QUERIES = {
+    'tagged': ("""
+        SELECT service FROM password_tags WHERE tag = ? ORDER BY service;
+    """, """
+        SELECT service FROM password_tags WHERE +tag = ? ORDER BY service;
+    """),
+    'modified since': ("""
+        SELECT service, updated_at FROM passwords WHERE updated_at >= ? ORDER BY updated_at;
+    """, """
+        SELECT service, updated_at FROM passwords WHERE +updated_at >= ? ORDER BY updated_at;
+    """),
+}
+
+
+def _per_query(conn, sql, params, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(size, tagged, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        password_manager = create_vault(os.path.join(directory, 'bench_db'), size)
+        db_manager = password_manager.db_manager
+        with db_manager.bulk_load():
+            db_manager.set_metadata_many((service_name(i), None, None, [f'group-{i % 100}'], None, None)
+                                         for i in range(size))
+        services = random.sample(range(size), tagged)
+        for i in services:
+            db_manager.set_tags(service_name(i), [f'group-{i % 100}', 'team'])
+        since = db_manager.get_metadata(service_name(services[0]))['updated_at']
+        params = {'tagged': ('team',), 'modified since': (since,)}
+
+        print(f"{'query':>15} {'rows':>6} {'indexed ms':>11} {'scan ms':>9} {'speedup':>8}  plan")
+        for name, (indexed, scan) in _QUERIES.items():
+            rows = len(db_manager.conn.execute(indexed, params[name]).fetchall())
+            plan = db_manager.conn.execute('EXPLAIN QUERY PLAN ' + indexed, params[name]).fetchall()[-1][-1]
+            indexed_ms = _per_query(db_manager.conn, indexed, params[name], repeat)
+            scan_ms = _per_query(db_manager.conn, scan, params[name], repeat)
+            print(f"{name:>15} {rows:>6} {indexed_ms:>11.3f} {scan_ms:>9.3f} {scan_ms / indexed_ms:>7.1f}x  {plan}")
+        db_manager.close_connection()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--tagged', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    run(args.size, args.tagged, args.repeat)
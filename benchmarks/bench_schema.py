@@ -0,0 +1,61 @@
+"""Compares the default SQLite pragmas with the tuned ones applied by the schema manager.
+
+Usage:
+    python benchmarks/bench_schema.py [--sizes 10000 100000] [--writes 500] [--reads 5000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from _vault import create_vault, service_name
+
+from model.database import DatabaseManager
+from model.schema import DEFAULT_PRAGMAS, TUNED_PRAGMAS
+
+
+def _per_op(function, values):
+    start = time.perf_counter()
+    for value in values:
+        function(*value)
+    return (time.perf_counter() - start) / len(values) * 1000
+
+
+def measure(db_path, pragmas, size, writes, reads):
+    db_manager = DatabaseManager(db_path, pragmas)
+    lookups = [(service_name(random.randrange(size)),) for _ in range(reads)]
+    inserts = [(f'bench-{i}', 'token') for i in range(writes)]
+    results = {
+        'set_password_ms': _per_op(db_manager.set_password, inserts),
+        'get_password_ms': _per_op(db_manager.get_password, lookups),
+        'delete_password_ms': _per_op(db_manager.delete_password, [(service,) for service, _ in inserts]),
+    }
+    start = time.perf_counter()
+    db_manager.get_services()
+    results['get_services_ms'] = (time.perf_counter() - start) * 1000
+    db_manager.close_connection()
+    return results
+
+
+def run(sizes, writes, reads):
+    directory = tempfile.mkdtemp()
+    print(f"{'size':>8} {'metric':>20} {'default':>10} {'tuned':>10} {'speedup':>8}")
+    for size in sizes:
+        measured = {}
+        for name, pragmas in (('default', DEFAULT_PRAGMAS), ('tuned', TUNED_PRAGMAS)):
+            db_path = os.path.join(directory, f'vault-{name}-{size}.db')
+            create_vault(db_path, size, pragmas=pragmas).db_manager.close_connection()
+            measured[name] = measure(db_path, pragmas, size, writes, reads)
+        for metric, default in measured['default'].items():
+            tuned = measured['tuned'][metric]
+            print(f"{size:>8} {metric:>20} {default:>10.4f} {tuned:>10.4f} {default / tuned:>7.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--reads', type=int, default=5000)
+    args = parser.parse_args()
+    run(args.sizes, args.writes, args.reads)
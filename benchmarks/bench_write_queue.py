@@ -0,0 +1,150 @@
+"""Compares per-statement commits with the write-behind queue for set/update traffic.
+
+Before timing, checks that a rejected write fails alone and is reported to its own writer only.
+
+Usage:
+    python benchmarks/bench_write_queue.py [--writes 5000] [--threads 8] [--batches 1 10 100 1000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _vault import create_vault  # noqa: E402
+from model.database import DatabaseManager  # noqa: E402
+from model.write_queue import DURABILITY_MODES, WriteQueue  # noqa: E402
+
+
+def _traffic(db_manager, writes, threads):
+    """Sets then updates ``writes`` services, spread over ``threads`` threads."""
+    def worker(offset):
+        for i in range(offset, writes, threads):
+            db_manager.set_password(f'new-{i:07d}', 'token')
+            db_manager.update_password(f'new-{i:07d}', 'token2')
+
+    start = time.perf_counter()
+    if threads == 1:
+        worker(0)
+        threads = 0
+    workers = [threading.Thread(target=worker, args=(offset,)) for offset in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if isinstance(db_manager, WriteQueue):
+        db_manager.flush()
+    return time.perf_counter() - start
+
+
+def _direct(path, writes, threads):
+    # A single connection is not safe across threads, so the direct baseline writes from one.
+    db_manager = DatabaseManager(path)
+    try:
+        return _traffic(db_manager, writes, 1)
+    finally:
+        db_manager.close_connection()
+
+
+def _queued(path, writes, threads, max_batch, durability):
+    db_manager = WriteQueue(DatabaseManager(path), max_batch=max_batch, durability=durability)
+    try:
+        return _traffic(db_manager, writes, threads)
+    finally:
+        db_manager.close_connection()
+
+
+def check_failed_group(path, rounds=20):
+    """Fails a first group and commits a second one, and checks which writers see an error.
+
+    The flusher is held while both writes are queued, so they end up in two groups
+    committed back to back, before either writer wakes up.
+    """
+    create_vault(path, 0).db_manager.close_connection()
+    db_manager = DatabaseManager(path)
+    db_manager.conn.execute("""
+        CREATE TRIGGER reject_bad BEFORE INSERT ON passwords WHEN new.service LIKE 'bad-%'
+        BEGIN SELECT RAISE(ABORT, 'rejected'); END;
+    """)
+    db_manager.conn.commit()
+    write_queue = WriteQueue(db_manager, durability='commit')
+    try:
+        for i in range(rounds):
+            outcomes = {}
+
+            def write(service):
+                try:
+                    write_queue.set_password(service, 'token')
+                    outcomes[service] = 'ok'
+                except Exception as e:
+                    outcomes[service] = str(e)
+
+            with write_queue._commit_lock:
+                first = threading.Thread(target=write, args=(f'bad-{i}',))
+                first.start()
+                while write_queue.stats()['pending'] < 1:
+                    time.sleep(0.001)
+                time.sleep(0.01)  # the flusher has taken the first write as a group of its own
+                second = threading.Thread(target=write, args=(f'good-{i}',))
+                second.start()
+                while write_queue.stats()['pending'] < 2:
+                    time.sleep(0.001)
+            first.join()
+            second.join()
+            expected = {f'bad-{i}': 'rejected', f'good-{i}': 'ok'}
+            if outcomes != expected:
+                raise AssertionError(f"failed group reported to the wrong writer: {outcomes}")
+            if db_manager.get_password(f'good-{i}') is None:
+                raise AssertionError(f"good-{i} was reported written but is missing")
+    finally:
+        write_queue.close_connection()
+    print(f"failed groups reported to their own writers in {rounds} rounds")
+
+    # One group holding a rejected write between two valid ones keeps the valid ones.
+    write_queue = WriteQueue(DatabaseManager(path), max_delay=60)
+    try:
+        for service in ('good-first', 'bad-middle', 'good-last'):
+            write_queue.set_password(service, 'token')
+        try:
+            write_queue.flush()
+            raise AssertionError("the rejected write was not reported")
+        except sqlite3.IntegrityError:
+            pass
+        for service in ('good-first', 'good-last'):
+            if write_queue.get_password(service) is None:
+                raise AssertionError(f"{service} was lost with the rejected write of its group")
+        if write_queue.get_password('bad-middle') is not None:
+            raise AssertionError("the rejected write was stored")
+    finally:
+        write_queue.close_connection()
+    print("a rejected write fails alone in its group")
+
+
+def run(writes, threads, batches):
+    operations = 2 * writes
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench_db')
+        check_failed_group(path)
+        print(f"{'writer':>8} {'durability':>10} {'max_batch':>9} {'seconds':>9} {'writes/s':>10} {'speedup':>8}")
+        create_vault(path, 0).db_manager.close_connection()
+        baseline = _direct(path, writes, threads)
+        print(f"{'direct':>8} {'commit':>10} {'-':>9} {baseline:>9.3f} {operations / baseline:>10.0f} {1:>7.2f}x")
+        for durability in DURABILITY_MODES:
+            for max_batch in batches:
+                create_vault(path, 0).db_manager.close_connection()
+                seconds = _queued(path, writes, threads, max_batch, durability)
+                print(f"{'queue':>8} {durability:>10} {max_batch:>9} {seconds:>9.3f} "
+                      f"{operations / seconds:>10.0f} {baseline / seconds:>7.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writes', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+    run(args.writes, args.threads, args.batches)
@@ -0,0 +1,140 @@
+"""Hammers one vault from many processes and checks that no write is lost and no cache goes stale.
+
+Every worker process opens its own connection and mixes inserts, updates, deletes, reads and
+metadata changes on its own services, plus updates of a few services shared by all workers.
+Reader processes keep the secret cache and the service catalog enabled and compare what they
+serve with the database. At the end every worker's services are checked against the vault.
+
+Usage:
+    python benchmarks/stress_processes.py [--workers 16] [--readers 2] [--seconds 10] [--shared 4]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _vault import MASTER_KEY, create_vault  # noqa: E402
+from controller.password_manager import PasswordManager  # noqa: E402
+from model.database import DatabaseManager  # noqa: E402
+
+
+def _open(path, key):
+    password_manager = PasswordManager(MASTER_KEY, DatabaseManager(path))
+    password_manager.use_key(key)
+    return password_manager
+
+
+def _writer(index, path, key, seconds, shared):
+    password_manager = _open(path, key)
+    rng = random.Random(index)
+    expected = {}
+    ops = errors = 0
+    messages = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        roll = rng.random()
+        ops += 1
+        try:
+            if roll < 0.3 or not expected:
+                service = f'worker-{index}-{ops}'
+                password_manager.set_password(service, f'{index}:{ops}')
+                expected[service] = f'{index}:{ops}'
+            elif roll < 0.5:
+                service = rng.choice(list(expected))
+                password_manager.update_password(service, f'{index}:{ops}')
+                expected[service] = f'{index}:{ops}'
+            elif roll < 0.6:
+                service = rng.choice(list(expected))
+                password_manager.delete_passwords(service)
+                del expected[service]
+            elif roll < 0.7:
+                password_manager.update_password(f'shared-{rng.randrange(shared)}', f'{index}:{ops}')
+            elif roll < 0.75:
+                password_manager.set_metadata(rng.choice(list(expected)), username=f'user-{ops}', tags=[f'w{index}'])
+            else:
+                service = rng.choice(list(expected))
+                if password_manager.get_decrypted_password(service) != expected[service]:
+                    raise Exception(f"{service} does not hold the value written last")
+        except Exception as e:
+            errors += 1
+            messages.append(repr(e))
+    password_manager.db_manager.close_connection()
+    return {'ops': ops, 'errors': errors, 'messages': messages[:5], 'expected': expected}
+
+
+def _reader(index, path, key, seconds, shared):
+    password_manager = _open(path, key)
+    password_manager.enable_secret_cache(ttl=3600)
+    password_manager.enable_service_catalog()
+    direct = DatabaseManager(path)
+    ops = stale = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        service = f'shared-{ops % shared}'
+        before = direct.get_password(service)
+        cached = password_manager.get_decrypted_password(service)
+        after = direct.get_password(service)
+        if before == after and cached != password_manager.decrypt_password(after):
+            stale += 1
+        ops += 1
+    # The catalog must list what the vault holds once the writers are done.
+    time.sleep(0.5)
+    catalog = [service for service, in password_manager.get_services()]
+    missing = len(set(service for service, in direct.get_services()) ^ set(catalog))
+    direct.close_connection()
+    password_manager.db_manager.close_connection()
+    return {'ops': ops, 'stale': stale, 'catalog_mismatches': missing}
+
+
+def run(workers, readers, seconds, shared):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stress_db')
+        password_manager = create_vault(path, 1000)
+        for i in range(shared):
+            password_manager.set_password(f'shared-{i}', 'initial')
+        key = password_manager.key
+        password_manager.db_manager.close_connection()
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(workers + readers) as pool:
+            writing = [pool.apply_async(_writer, (i, path, key, seconds, shared)) for i in range(workers)]
+            reading = [pool.apply_async(_reader, (i, path, key, seconds + 1, shared)) for i in range(readers)]
+            written = [result.get() for result in writing]
+            read = [result.get() for result in reading]
+        elapsed = time.perf_counter() - start
+
+        password_manager = _open(path, key)
+        lost = 0
+        for result in written:
+            stored = password_manager.get_many(result['expected'])
+            lost += sum(1 for service, value in result['expected'].items() if stored[service] != value)
+        integrity = password_manager.db_manager.conn.execute('PRAGMA integrity_check;').fetchone()[0]
+        password_manager.db_manager.close_connection()
+
+    ops = sum(result['ops'] for result in written)
+    errors = sum(result['errors'] for result in written)
+    print(f"{workers} writers, {readers} readers, {elapsed:.1f} s")
+    print(f"writes       {ops} ops, {ops / elapsed:.0f} ops/s, {errors} errors, {lost} lost")
+    print(f"reads        {sum(result['ops'] for result in read)} ops, "
+          f"{sum(result['stale'] for result in read)} stale, "
+          f"{sum(result['catalog_mismatches'] for result in read)} catalog mismatches")
+    print(f"integrity    {integrity}")
+    for message in sorted({message for result in written for message in result['messages']})[:10]:
+        print(f"error        {message}")
+    failed = errors or lost or integrity != 'ok' or any(result['stale'] or result['catalog_mismatches'] for result in read)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--shared', type=int, default=4)
+    args = parser.parse_args()
+    sys.exit(run(args.workers, args.readers, args.seconds, args.shared))
@@ -0,0 +1,196 @@
+"""Benchmark suite covering the KDF, crypto, database and startup paths.
+
+Results are written as JSON so runs of different commits can be compared.
+
+Usage:
+    python benchmarks/suite.py run [--sizes 100 1000 10000] [--output results.json]
+    python benchmarks/suite.py compare baseline.json results.json [--threshold 0.1]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from _vault import MASTER_KEY, ROOT, create_vault, service_name
+
+from controller.password_manager import PasswordManager
+
+CRUD_SAMPLES = 200
+
+STARTUP_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import main
+from controller.password_manager import PasswordManager
+from model.database import DatabaseManager
+password_manager = PasswordManager(sys.argv[2], DatabaseManager(sys.argv[1]))
+password_manager.key_cache = None
+assert password_manager.verify_master_key()
+password_manager.set_key_fernat()
+print(time.perf_counter() - start)
+"""
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def _best_of(repeat, function, *args):
+    return min(_timed(function, *args) for _ in range(repeat))
+
+
+def bench_kdf(password_manager, repeat=3):
+    """Times set_key_fernat without the derived-key cache."""
+    key_cache, password_manager.key_cache = password_manager.key_cache, None
+    try:
+        return {'set_key_fernat_s': _best_of(repeat, password_manager.set_key_fernat)}
+    finally:
+        password_manager.key_cache = key_cache
+
+
+def bench_crypto(password_manager, size):
+    """Measures encrypt_password/decrypt_password throughput over the whole vault."""
+    passwords = [PasswordManager.generate_password(16) for _ in range(size)]
+    start = time.perf_counter()
+    tokens = [password_manager.encrypt_password(password) for password in passwords]
+    encrypt = time.perf_counter() - start
+    start = time.perf_counter()
+    for token in tokens:
+        password_manager.decrypt_password(token)
+    decrypt = time.perf_counter() - start
+    return {'encrypt_ops_per_s': size / encrypt, 'decrypt_ops_per_s': size / decrypt}
+
+
+def bench_crud(password_manager, size):
+    """Measures the mean latency of the DatabaseManager CRUD operations."""
+    db_manager = password_manager.db_manager
+    token = password_manager.encrypt_password('benchmark')
+    existing = [service_name(i * size // CRUD_SAMPLES) for i in range(CRUD_SAMPLES)]
+    new = [f'new-{i}' for i in range(CRUD_SAMPLES)]
+
+    def each(function, services, *args):
+        return _timed(lambda: [function(service, *args) for service in services]) / len(services)
+
+    return {
+        'get_password_ms': each(db_manager.get_password, existing) * 1000,
+        'set_password_ms': each(db_manager.set_password, new, token) * 1000,
+        'update_password_ms': each(db_manager.update_password, new, token) * 1000,
+        'delete_password_ms': each(db_manager.delete_password, new) * 1000,
+    }
+
+
+def bench_services(password_manager, repeat=3):
+    """Times the full get_services scan."""
+    return {'get_services_ms': _best_of(repeat, password_manager.db_manager.get_services) * 1000}
+
+
+def bench_startup(db_path, repeat=3):
+    """Times a fresh interpreter importing main.py and unlocking the vault."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_SNIPPET, db_path, MASTER_KEY],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        timings.append((time.perf_counter() - start, float(output)))
+    total, in_process = min(timings)
+    return {'startup_to_unlock_s': total, 'import_and_unlock_s': in_process}
+
+
+def bench_cli(db_path, repeat=5):
+    """Times cold starts of the headless CLI, which must not load the crypto stack for list."""
+    env = dict(os.environ, PM_DB=db_path, PM_MASTER_KEY=MASTER_KEY)
+    results = {}
+    for command in (['list', '--limit', '1'], ['get', service_name(0)]):
+        argv = [sys.executable, 'cli.py'] + command
+        results[f'cli_{command[0]}_s'] = _best_of(
+            repeat, lambda: subprocess.run(argv, cwd=ROOT, env=env, capture_output=True, check=True))
+    return results
+
+
+def run(sizes):
+    results = []
+    directory = tempfile.mkdtemp()
+    for size in sizes:
+        db_path = os.path.join(directory, f'vault-{size}.db')
+        start = time.perf_counter()
+        password_manager = create_vault(db_path, size)
+        print(f"vault of {size} entries built in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        benchmarks = {
+            'kdf': lambda: bench_kdf(password_manager),
+            'crypto': lambda: bench_crypto(password_manager, size),
+            'crud': lambda: bench_crud(password_manager, size),
+            'services': lambda: bench_services(password_manager),
+            'startup': lambda: bench_startup(db_path),
+            'cli': lambda: bench_cli(db_path),
+        }
+        for name, benchmark in benchmarks.items():
+            for metric, value in benchmark().items():
+                results.append({'benchmark': name, 'size': size, 'metric': metric, 'value': value})
+                print(f"{name:>9} {size:>8} {metric:>22} {value:14.4f}", file=sys.stderr)
+        password_manager.db_manager.close_connection()
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold):
+    """Prints the metrics that regressed by more than ``threshold`` and returns their number."""
+    def by_key(report):
+        return {(r['benchmark'], r['size'], r['metric']): r['value'] for r in report['results']}
+
+    old, new = by_key(baseline), by_key(current)
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        higher_is_better = key[2].endswith('_per_s')
+        change = (new[key] - old[key]) / old[key] if old[key] else 0.0
+        regressed = change < -threshold if higher_is_better else change > threshold
+        regressions += regressed
+        print(f"{'REGRESSION' if regressed else '':>10} {key[0]:>9} {key[1]:>8} {key[2]:>22} {change:+8.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the suite')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                            help='vault sizes, up to 10^6')
+    run_parser.add_argument('--output', help='JSON file, stdout when omitted')
+    compare_parser = commands.add_parser('compare', help='compare two runs')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='relative change tolerated')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.baseline) as baseline, open(args.current) as current:
+            sys.exit(1 if compare(json.load(baseline), json.load(current), args.threshold) else 0)
+
+    report = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'results': run(args.sizes),
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
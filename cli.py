@@ -0,0 +1,372 @@
+"""Non-interactive command line for scripts and shell pipelines.
+
+Usage:
+    python cli.py [--db PATH] [--json] get SERVICE [SERVICE ...]
+    python cli.py [--db PATH] [--json] set SERVICE [--password PASSWORD | --generate LENGTH] [--username U] [--url U] [--tag T]
+    python cli.py [--db PATH] [--json] list [PREFIX] [--substring] [--limit N] [--tag T] [--since ISO-TIME]
+    python cli.py [--db PATH] [--json] meta SERVICE [--username U] [--url U] [--tag T]
+    python cli.py [--db PATH] [--json] history SERVICE [--limit N]
+    python cli.py [--db PATH] [--json] rm SERVICE
+    python cli.py [--json] gen [--length N] [--count N] [--words N] [--no-symbols] [--exclude-ambiguous]
+    python cli.py [--db PATH] [--json] audit [--length N] [--words N] [--max-age DAYS] [--workers N]
+    python cli.py [--db PATH] [--json] kdf [--upgrade]
+    python cli.py [--json] calibrate [--target-ms N] [--algorithm pbkdf2-sha256|scrypt]
+    python cli.py [--db PATH] [--json] backup DIRECTORY [--full]
+    python cli.py [--json] snapshots DIRECTORY
+    python cli.py [--json] restore DIRECTORY TARGET [--until ISO-TIME]
+
+The master key is read from PM_MASTER_KEY, or prompted for. Modules are imported only by
+the commands that need them, so ``list`` never loads the crypto or TUI stack. When PM_KDF
+holds key derivation parameters, e.g. the output of ``calibrate``, vaults using weaker ones
+are upgraded to them when they are unlocked by a command, or by ``kdf --upgrade``.
+"""
+import argparse
+import json
+import os
+import sys
+
+
+class CliError(Exception):
+    """An error reported to the user with a non-zero exit status."""
+
+
+def _open_db(path):
+    from model.database import DatabaseManager
+
+    if not os.path.exists(path):
+        raise CliError(f"Vault not found: {path}")
+    return DatabaseManager(path)
+
+
+def _password_manager(args, unlock=True):
+    from controller.password_manager import PasswordManager
+
+    master_key = os.environ.get('PM_MASTER_KEY')
+    if master_key is None:
+        import getpass
+
+        master_key = getpass.getpass('Master Key: ')
+    password_manager = PasswordManager(master_key, _open_db(args.db))
+    if not password_manager.verify_master_key():
+        raise CliError('Wrong master key!')
+    if unlock:
+        password_manager.set_key_fernat()
+        _upgrade_kdf(password_manager)
+    return password_manager
+
+
+def _upgrade_kdf(password_manager):
+    from controller.kdf import configured_kdf
+
+    try:
+        target = configured_kdf()
+    except ValueError as e:
+        raise CliError(f"Invalid PM_KDF: {e}")
+    if target is not None and password_manager.kdf.needs_upgrade_to(target):
+        print(f"Upgrading the key derivation to {target}...", file=sys.stderr)
+        password_manager.upgrade_kdf(target)
+
+
+def _output(args, value, text):
+    if args.json:
+        print(json.dumps(value))
+    elif text:
+        print(text)
+
+
+def cmd_get(args):
+    password_manager = _password_manager(args)
+    passwords = password_manager.get_many(args.services)
+    missing = [service for service, password in passwords.items() if password is None]
+    if missing:
+        raise CliError(f"Password not found: {', '.join(missing)}")
+    _output(args, passwords, '\n'.join(passwords.values()))
+
+
+def cmd_set(args):
+    password_manager = _password_manager(args)
+    if args.generate:
+        password = password_manager.generate_password(args.generate)
+    elif args.password is not None:
+        password = args.password
+    else:
+        password = sys.stdin.readline().rstrip('\n')
+    if not args.service or not password:
+        raise CliError('Service and Password field must not empty!')
+    password_manager.set_passwords_many([args.service], [password], replace=True)
+    password_manager.set_metadata(args.service, args.username, args.url, args.tag)
+    _output(args, {'service': args.service, 'password': password if args.generate else None},
+            password if args.generate else '')
+
+
+def cmd_list(args):
+    db_manager = _open_db(args.db)
+    mode = 'substring' if args.substring else 'prefix'
+    if args.tag is None and args.since is None:
+        services = db_manager.search_services(args.prefix, mode, limit=args.limit)
+        _output(args, services, '\n'.join(services))
+        return
+    services = db_manager.get_services_tagged(args.tag) if args.tag is not None else None
+    if args.since is not None:
+        modified = [service for service, _ in db_manager.get_services_modified_since(_timestamp(args.since))]
+        services = modified if services is None else sorted(set(services).intersection(modified))
+    if args.substring:
+        services = [service for service in services if args.prefix.casefold() in service.casefold()]
+    else:
+        services = [service for service in services if service.startswith(args.prefix)]
+    services = services if args.limit < 0 else services[:args.limit]
+    _output(args, services, '\n'.join(services))
+
+
+def cmd_meta(args):
+    password_manager = _password_manager(args, unlock=False)
+    if password_manager.get_metadata(args.service) is None:
+        raise CliError(f"Password for {args.service} not found!")
+    password_manager.set_metadata(args.service, args.username, args.url, args.tag)
+    metadata = password_manager.get_metadata(args.service)
+    lines = [f"{name:<12}{_format_value(metadata[name])}"
+             for name in ('username', 'url', 'tags', 'created_at', 'updated_at')]
+    _output(args, metadata, '\n'.join(lines))
+
+
+def cmd_history(args):
+    password_manager = _password_manager(args)
+    history = password_manager.get_history(args.service, args.limit)
+    _output(args, [{'password': password, 'created_at': created_at, 'replaced_at': replaced_at}
+                   for password, created_at, replaced_at in history],
+            '\n'.join(f"{_format_value(replaced_at)}  {password}" for password, _, replaced_at in history))
+
+
+def _timestamp(text):
+    from datetime import datetime
+
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError as e:
+        raise CliError(f"Invalid time: {e}")
+
+
+def _format_value(value):
+    from datetime import datetime
+
+    if isinstance(value, float):
+        return datetime.fromtimestamp(value).isoformat(timespec='seconds')
+    if isinstance(value, list):
+        return ', '.join(value)
+    return '' if value is None else value
+
+
+def cmd_rm(args):
+    password_manager = _password_manager(args, unlock=False)
+    if password_manager.db_manager.get_many([args.service])[args.service] is None:
+        raise CliError(f"Password for {args.service} not found!")
+    password_manager.delete_passwords(args.service)
+    _output(args, {'deleted': args.service}, '')
+
+
+def cmd_gen(args):
+    from controller.password_generator import PasswordGenerator, PasswordPolicy
+
+    try:
+        policy = PasswordPolicy(length=args.length, lowercase=not args.no_lowercase,
+                                uppercase=not args.no_uppercase, digits=not args.no_digits,
+                                symbols=not args.no_symbols, require_each=not args.any_classes,
+                                exclude_ambiguous=args.exclude_ambiguous, exclude=args.exclude,
+                                words=args.words, separator=args.separator)
+    except ValueError as e:
+        raise CliError(str(e))
+    passwords = PasswordGenerator(policy).generate_many(args.count)
+    _output(args, passwords, '\n'.join(passwords))
+
+
+def cmd_audit(args):
+    from controller.audit import VaultAudit
+    from controller.password_generator import PasswordPolicy
+
+    try:
+        policy = PasswordPolicy(length=args.length, words=args.words)
+    except ValueError as e:
+        raise CliError(str(e))
+    report = VaultAudit(_password_manager(args), policy, args.max_age, workers=args.workers).run()
+    lines = [f"{report.total} entries audited in {report.seconds:.2f} s: {len(report.weak)} weak, "
+             f"{sum(len(services) for services in report.reused)} reused, {len(report.stale)} stale, "
+             f"{len(report.unreadable)} unreadable"]
+    lines += [f"weak        {service}: {', '.join(reasons)}" for service, _, reasons in report.weak]
+    lines += [f"reused      {', '.join(services)}" for services in report.reused]
+    lines += [f"stale       {service}: {days} days" for service, days in report.stale]
+    lines += [f"unreadable  {service}" for service in report.unreadable]
+    _output(args, report.as_dict(), '\n'.join(lines))
+
+
+def cmd_kdf(args):
+    from controller.kdf import KdfParams
+
+    if args.upgrade:
+        kdf = _password_manager(args).kdf  # unlocking upgrades the vault to PM_KDF
+    else:
+        kdf = KdfParams.from_row(_open_db(args.db).get_kdf_params())
+    seconds = kdf.estimate_seconds()
+    _output(args, {'kdf': str(kdf), 'estimated_ms': round(seconds * 1000)},
+            f"{kdf} (about {seconds * 1000:.0f} ms to unlock)")
+
+
+def cmd_calibrate(args):
+    from controller.kdf import calibrate
+
+    kdf = calibrate(args.target_ms / 1000, args.algorithm, args.max_memory, args.parallelism)
+    seconds = kdf.estimate_seconds()
+    _output(args, {'kdf': str(kdf), 'estimated_ms': round(seconds * 1000)},
+            f"PM_KDF={kdf}  # about {seconds * 1000:.0f} ms to unlock")
+
+
+def cmd_backup(args):
+    from controller.backup import BackupManager
+
+    path = BackupManager(_password_manager(args), args.directory).snapshot(full=args.full)
+    _output(args, {'snapshot': path}, path or 'Nothing changed since the previous snapshot.')
+
+
+def cmd_snapshots(args):
+    from datetime import datetime
+
+    from controller.backup import list_snapshots
+
+    snapshots = [{'path': snapshot['path'], 'kind': snapshot['kind'], 'seq': snapshot['seq'],
+                  'created': datetime.fromtimestamp(snapshot['created']).isoformat(timespec='seconds')}
+                 for snapshot in list_snapshots(args.directory)]
+    _output(args, snapshots, '\n'.join(f"{snapshot['created']}  {snapshot['kind']:<11}  {snapshot['path']}"
+                                       for snapshot in snapshots))
+
+
+def cmd_restore(args):
+    from datetime import datetime
+
+    from controller.backup import restore_snapshot
+
+    try:
+        until = datetime.fromisoformat(args.until).timestamp() if args.until else None
+    except ValueError as e:
+        raise CliError(f"Invalid time: {e}")
+    master_key = os.environ.get('PM_MASTER_KEY')
+    if master_key is None:
+        import getpass
+
+        master_key = getpass.getpass('Master Key: ')
+    try:
+        count = restore_snapshot(args.directory, master_key, args.target, until)
+    except Exception as e:
+        raise CliError(str(e))
+    _output(args, {'restored': args.target, 'rows': count}, f"Restored {count} changes into {args.target}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Headless password manager commands.')
+    parser.add_argument('--db', default=os.environ.get('PM_DB', 'passwords_db'), help='path to the vault')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of plain text')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    get_parser = commands.add_parser('get', help='print the passwords of services')
+    get_parser.add_argument('services', nargs='+')
+    get_parser.set_defaults(handler=cmd_get)
+
+    set_parser = commands.add_parser('set', help='store or replace the password of a service')
+    set_parser.add_argument('service')
+    source = set_parser.add_mutually_exclusive_group()
+    source.add_argument('--password', help='the password, read from stdin when omitted')
+    source.add_argument('--generate', type=int, metavar='LENGTH', help='store a generated password')
+    _add_metadata_arguments(set_parser)
+    set_parser.set_defaults(handler=cmd_set)
+
+    list_parser = commands.add_parser('list', help='list services')
+    list_parser.add_argument('prefix', nargs='?', default='')
+    list_parser.add_argument('--substring', action='store_true', help='match anywhere in the name')
+    list_parser.add_argument('--limit', type=int, default=-1, help='maximum number of services')
+    list_parser.add_argument('--tag', help='only the services carrying this tag')
+    list_parser.add_argument('--since', metavar='ISO-TIME', help='only the services changed since this time')
+    list_parser.set_defaults(handler=cmd_list)
+
+    meta_parser = commands.add_parser('meta', help='show or change the username, URL and tags of a service')
+    meta_parser.add_argument('service')
+    _add_metadata_arguments(meta_parser)
+    meta_parser.set_defaults(handler=cmd_meta)
+
+    history_parser = commands.add_parser('history', help='print the previous passwords of a service')
+    history_parser.add_argument('service')
+    history_parser.add_argument('--limit', type=int, default=-1, help='maximum number of versions')
+    history_parser.set_defaults(handler=cmd_history)
+
+    rm_parser = commands.add_parser('rm', help='delete the password of a service')
+    rm_parser.add_argument('service')
+    rm_parser.set_defaults(handler=cmd_rm)
+
+    gen_parser = commands.add_parser('gen', help='generate passwords without storing them')
+    gen_parser.add_argument('--length', type=int, default=12)
+    gen_parser.add_argument('--count', type=int, default=1)
+    gen_parser.add_argument('--no-lowercase', action='store_true', help='leave out lowercase letters')
+    gen_parser.add_argument('--no-uppercase', action='store_true', help='leave out uppercase letters')
+    gen_parser.add_argument('--no-digits', action='store_true', help='leave out digits')
+    gen_parser.add_argument('--no-symbols', action='store_true', help='leave out punctuation symbols')
+    gen_parser.add_argument('--any-classes', action='store_true',
+                            help='do not require one character of each class')
+    gen_parser.add_argument('--exclude-ambiguous', action='store_true', help='leave out characters like l, 1 and O')
+    gen_parser.add_argument('--exclude', default='', metavar='CHARS', help='other characters to leave out')
+    gen_parser.add_argument('--words', type=int, default=0, metavar='N', help='generate passphrases of N words')
+    gen_parser.add_argument('--separator', default='-', help='the separator of the passphrase words')
+    gen_parser.set_defaults(handler=cmd_gen)
+
+    audit_parser = commands.add_parser('audit', help='report weak, reused and stale passwords')
+    audit_parser.add_argument('--length', type=int, default=12, help='the minimum length of a password')
+    audit_parser.add_argument('--words', type=int, default=0, metavar='N',
+                              help='hold the passwords to passphrases of N words')
+    audit_parser.add_argument('--max-age', type=float, default=365, metavar='DAYS',
+                              help='the age from which a password is stale')
+    audit_parser.add_argument('--workers', type=int, help='the number of processes, one per CPU by default')
+    audit_parser.set_defaults(handler=cmd_audit)
+
+    kdf_parser = commands.add_parser('kdf', help='show the key derivation parameters of the vault')
+    kdf_parser.add_argument('--upgrade', action='store_true', help='unlock the vault, upgrading it to PM_KDF')
+    kdf_parser.set_defaults(handler=cmd_kdf)
+
+    calibrate_parser = commands.add_parser('calibrate', help='pick key derivation parameters for this host')
+    calibrate_parser.add_argument('--target-ms', type=float, default=500, help='the wanted unlock latency')
+    calibrate_parser.add_argument('--algorithm', choices=['pbkdf2-sha256', 'scrypt'], default='pbkdf2-sha256')
+    calibrate_parser.add_argument('--max-memory', type=int, default=1048576, metavar='KIB',
+                                  help='the maximum scrypt memory')
+    calibrate_parser.add_argument('--parallelism', type=int, default=1, help='the scrypt parallelism')
+    calibrate_parser.set_defaults(handler=cmd_calibrate)
+
+    backup_parser = commands.add_parser('backup', help='take an encrypted snapshot of the vault')
+    backup_parser.add_argument('directory')
+    backup_parser.add_argument('--full', action='store_true', help='start a new chain with a full snapshot')
+    backup_parser.set_defaults(handler=cmd_backup)
+
+    snapshots_parser = commands.add_parser('snapshots', help='list the snapshots of a directory')
+    snapshots_parser.add_argument('directory')
+    snapshots_parser.set_defaults(handler=cmd_snapshots)
+
+    restore_parser = commands.add_parser('restore', help='restore snapshots into a new vault')
+    restore_parser.add_argument('directory')
+    restore_parser.add_argument('target', help='the path of the restored vault, it must not exist')
+    restore_parser.add_argument('--until', metavar='ISO-TIME', help='restore the vault as it was at this time')
+    restore_parser.set_defaults(handler=cmd_restore)
+    return parser
+
+
+def _add_metadata_arguments(parser):
+    parser.add_argument('--username', help='the username of the service')
+    parser.add_argument('--url', help='the URL of the service')
+    parser.add_argument('--tag', action='append', help='a tag, repeat for several; replaces the current tags')
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.handler(args)
+    except CliError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
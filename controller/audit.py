@@ -0,0 +1,250 @@
+import base64
+import hashlib
+import hmac
+import math
+import os
+import string
+import struct
+import time
+from collections import deque
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from controller.password_generator import WORDS, PasswordPolicy
+
+_CLASSES = tuple((name, frozenset(characters)) for name, characters in (
+    ('lowercase', string.ascii_lowercase), ('uppercase', string.ascii_uppercase),
+    ('digits', string.digits), ('symbols', string.punctuation)))
+_PRINTABLE = frozenset(string.ascii_letters + string.digits + string.punctuation)
+_OTHER_POOL = 32  # alphabet size credited to characters outside the four classes
+_WORD_SET = frozenset(WORDS)
+_WORD_BITS = math.log2(len(WORDS))
+_DIGEST_SIZE = 16
+_TIMESTAMP = struct.Struct('>Q')
+_SLACK = 0.75  # share of the policy entropy a password must reach, room for the run penalty
+
+
+class AuditReport:
+    """The findings of a vault audit. Only service names are kept, never a password.
+
+    Atributes:
+        total (int): The number of entries audited.
+        weak (list): The (service, bits, reasons) of the passwords weaker than the policy.
+        reused (list): The groups of services sharing one password, each sorted by name.
+        stale (list): The (service, days) of the passwords not changed for too long.
+        unreadable (list): The services whose password could not be decrypted.
+        seconds (float): The duration of the audit.
+    """
+
+    def __init__(self):
+        """Initializes an empty report."""
+        self.total = 0
+        self.weak = []
+        self.reused = []
+        self.stale = []
+        self.unreadable = []
+        self.seconds = 0.0
+
+    def as_dict(self):
+        """Gets the report as plain values, ready for JSON.
+
+        Returns:
+            dict: The counts and findings of the report.
+        """
+        return {
+            'total': self.total,
+            'weak': [{'service': service, 'bits': round(bits, 1), 'reasons': reasons}
+                     for service, bits, reasons in self.weak],
+            'reused': self.reused,
+            'stale': [{'service': service, 'days': days} for service, days in self.stale],
+            'unreadable': self.unreadable,
+            'seconds': round(self.seconds, 3),
+        }
+
+
+class VaultAudit:
+    """Audits every entry of a vault for weak, reused and stale passwords.
+
+    The vault is streamed a chunk at a time and the chunks are decrypted and scored by a
+    pool of processes, with a few chunks in flight per worker, so memory is bounded by
+    the chunk size and not by the vault. Workers send back a keyed hash of each password
+    instead of the password: the HMAC key is random and lives for one audit, so reuse is
+    found by comparing digests and the digests are useless once the audit is over.
+
+    Strength is an entropy estimate, the pool of the character classes used times the
+    length, not counting the characters that continue a run like ``aaa``, ``abc`` or ``321``.
+    A password is weak when it is shorter than the policy or reaches less than three
+    quarters of the entropy of the passwords the policy generates, and the report lists
+    the rules of the policy it misses. A passphrase of the generator words is credited with the entropy of its words.
+
+    Age is the time since the entry was last changed. Entries older than the timestamps of
+    the schema, and vaults of the log store, fall back to the timestamp of the encrypted
+    password, which a rotation of the master key or an upgrade of the KDF resets.
+
+    Atributes:
+        password_manager (PasswordManager): The unlocked password manager of the vault.
+        policy (PasswordPolicy): The rules the passwords are held to.
+        max_age (float): The number of days after which a password is stale, None to skip the check.
+        chunk_size (int): The number of entries decrypted per task.
+        workers (int): The number of processes, defaults to the setting of the password manager.
+        progress (callable): Called with the running count of entries after every chunk.
+    """
+
+    def __init__(self, password_manager, policy=None, max_age=365, chunk_size=2000, workers=None, progress=None):
+        """Initializes the instance based on the unlocked password manager.
+
+        Args:
+            password_manager (PasswordManager): The unlocked password manager of the vault.
+            policy (PasswordPolicy): The rules the passwords are held to, the default policy when omitted.
+            max_age (float): The number of days after which a password is stale, None to skip the check.
+            chunk_size (int): The number of entries decrypted per task.
+            workers (int): The number of processes, defaults to the setting of the password manager.
+            progress (callable): Called with the running count of entries after every chunk.
+        """
+        self.password_manager = password_manager
+        self.policy = policy or PasswordPolicy()
+        self.max_age = max_age
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.progress = progress
+
+    def run(self):
+        """Audits the whole vault.
+
+        Returns:
+            AuditReport: The findings.
+        """
+        start = time.perf_counter()
+        report = AuditReport()
+        first_seen = {}  # digest -> first service with that password
+        groups = {}  # digest -> every service with that password, once it is reused
+        now = time.time()
+        task = (self.password_manager.key, os.urandom(32), self.policy, self.max_age, now)
+        chunks = self.password_manager.db_manager.iter_passwords(self.chunk_size, updated_at=True)
+        workers = self.workers or self.password_manager.workers or os.cpu_count() or 1
+
+        def collect(results):
+            for service, digest, bits, reasons, days in results:
+                report.total += 1
+                if digest is None:
+                    report.unreadable.append(service)
+                    continue
+                if reasons:
+                    report.weak.append((service, bits, reasons))
+                if days is not None:
+                    report.stale.append((service, days))
+                first = first_seen.setdefault(digest, service)
+                if first != service:
+                    groups.setdefault(digest, [first]).append(service)
+            if self.progress is not None:
+                self.progress(report.total)
+
+        if workers == 1:
+            for rows in chunks:
+                collect(_audit_chunk(task, rows))
+        else:
+            from concurrent.futures import ProcessPoolExecutor  # deferred, costly to import
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                in_flight = deque()
+                for rows in chunks:
+                    in_flight.append(pool.submit(_audit_chunk, task, rows))
+                    if len(in_flight) >= workers * 2:
+                        collect(in_flight.popleft().result())
+                while in_flight:
+                    collect(in_flight.popleft().result())
+
+        report.reused = sorted(sorted(services) for services in groups.values())
+        report.seconds = time.perf_counter() - start
+        return report
+
+
+def policy_bits(policy):
+    """Gets the entropy of the passwords a policy generates.
+
+    Args:
+        policy (PasswordPolicy): The policy.
+
+    Returns:
+        float: The entropy in bits.
+    """
+    if policy.words:
+        return policy.words * _WORD_BITS
+    return policy.length * math.log2(len(policy.alphabet))
+
+
+def score_password(password, policy):
+    """Scores a password against a policy.
+
+    Args:
+        password (str): The password to be scored.
+        policy (PasswordPolicy): The rules the password is held to.
+
+    Returns:
+        tuple: The estimated entropy in bits, and the list of reasons it is weak, empty if it is not.
+    """
+    required = policy_bits(policy) * _SLACK
+    words = password.split(policy.separator)
+    passphrase = len(words) > 1 and all(word in _WORD_SET for word in words)
+    if passphrase:
+        bits = len(words) * _WORD_BITS
+        short = len(words) < policy.words
+    else:
+        bits = _character_bits(password)
+        short = len(password) < policy.length
+    if bits >= required and not short:
+        return bits, []
+
+    reasons = []
+    if short:
+        reasons.append(f"fewer than {policy.words} words" if passphrase else f"shorter than {policy.length} characters")
+    if not passphrase and policy.require_each and not policy.words:
+        used = set(password)
+        reasons.extend(f"no {name}" for name, characters in _CLASSES
+                       if used.isdisjoint(characters) and any(not characters.isdisjoint(enabled)
+                                                              for enabled in policy.classes))
+    if bits < required:
+        reasons.append(f"{bits:.0f} bits of entropy, {required:.0f} expected")
+    return bits, reasons
+
+
+def _character_bits(password):
+    if not password:
+        return 0.0
+    used = set(password)
+    pool = sum(len(characters) for _, characters in _CLASSES if not used.isdisjoint(characters))
+    if not used <= _PRINTABLE:
+        pool += _OTHER_POOL
+    codes = [ord(c) for c in password]
+    effective = min(len(codes), 2)
+    for first, previous, current in zip(codes, codes[1:], codes[2:]):
+        step = current - previous
+        if step != previous - first or abs(step) > 1:
+            effective += 1
+    return effective * math.log2(pool)
+
+
+def _audit_chunk(task, rows):
+    """Decrypts and scores a chunk of (service, encrypted password, updated_at) rows in a worker."""
+    key, hash_key, policy, max_age, now = task
+    cipher_suite = Fernet(key)
+    results = []
+    for service, encrypted_password, updated_at in rows:
+        token = encrypted_password.encode()
+        try:
+            password = cipher_suite.decrypt(token).decode()
+        except (InvalidToken, UnicodeDecodeError):
+            results.append((service, None, 0.0, [], None))
+            continue
+        digest = hmac.new(hash_key, password.encode(), hashlib.sha256).digest()[:_DIGEST_SIZE]
+        bits, reasons = score_password(password, policy)
+        days = None
+        if max_age is not None:
+            if updated_at is None:
+                # The token is verified by now, its timestamp follows the version byte.
+                updated_at = _TIMESTAMP.unpack_from(base64.urlsafe_b64decode(token), 1)[0]
+            age = (now - updated_at) / 86400
+            if age > max_age:
+                days = int(age)
+        results.append((service, digest, bits, reasons, days))
+    return results
@@ -0,0 +1,247 @@
+import base64
+import json
+import os
+import secrets
+import struct
+import time
+import zlib
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from controller.kdf import KdfParams
+from model.database import DatabaseManager
+
+SNAPSHOT_MAGIC = b'PMSNAP1\n'
+SNAPSHOT_SUFFIX = '.pmsnap'
+
+_FRAME = struct.Struct('<I')  # length of the Fernet token that follows
+
+
+class BackupManager:
+    """Takes encrypted, compressed snapshots of a live vault into a directory.
+
+    The first snapshot of a chain is full. Later ones are incremental: triggers record
+    every changed service with a sequence number, and a snapshot holds only the current
+    state of the services changed since the previous one, deleted services included.
+    The rows are read inside one read transaction, so the snapshot is consistent while
+    the application keeps writing, and the saved changes are pruned afterwards.
+
+    A snapshot file is a plaintext header with the salt and KDF parameters, followed by
+    frames of rows, each compressed with zlib and encrypted with the vault key. Rows are
+    kept as stored, with their passwords still encrypted, along with their metadata; the
+    history of previous passwords is not part of the snapshots. A rotation of the master key
+    starts a new chain, so every snapshot of a chain opens with the same master key.
+
+    Atributes:
+        password_manager (PasswordManager): The unlocked password manager of a SQLite vault.
+        directory (str): The directory holding the snapshots.
+        chunk_size (int): The number of rows per frame.
+        level (int): The zlib compression level.
+    """
+
+    def __init__(self, password_manager, directory, chunk_size=5000, level=6):
+        """Initializes the instance based on the unlocked password manager.
+
+        Args:
+            password_manager (PasswordManager): The unlocked password manager of a SQLite vault.
+            directory (str): The directory holding the snapshots.
+            chunk_size (int): The number of rows per frame.
+            level (int): The zlib compression level.
+        """
+        self.password_manager = password_manager
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.level = level
+
+    def snapshot(self, full=False):
+        """Takes a snapshot, incremental when the directory holds the chain the vault follows.
+
+        Args:
+            full (bool): If True a full snapshot starting a new chain is taken.
+
+        Returns:
+            str: The path of the snapshot, or None if nothing changed since the previous one.
+        """
+        db_manager = self.password_manager.db_manager
+        salt = _salt_bytes(self.password_manager.salt)
+        os.makedirs(self.directory, exist_ok=True)
+        snapshots = list_snapshots(self.directory)
+        with db_manager.read_transaction():
+            seq = db_manager.get_change_seq()
+            state = db_manager.get_backup_state()
+            last = snapshots[-1] if snapshots else None
+            incremental = (not full and state is not None and last is not None
+                           and (last['chain'], last['seq']) == tuple(state) and last['salt'] == salt)
+            if incremental and seq == state[1]:
+                return None
+            header = {
+                'kind': 'incremental' if incremental else 'full',
+                'chain': state[0] if incremental else secrets.token_hex(8),
+                'base_seq': state[1] if incremental else 0,
+                'seq': seq,
+                'created': time.time(),
+                'salt': base64.b64encode(salt).decode(),
+                'kdf': list(self.password_manager.kdf.as_row()),
+            }
+            if incremental:
+                chunks = db_manager.iter_changes(state[1], seq, self.chunk_size)
+            else:
+                chunks = db_manager.iter_passwords(self.chunk_size)
+            chunks = _with_metadata(db_manager, chunks)
+            path = self._write(header, {'master_key_hash': db_manager.get_master_key_hash()}, chunks)
+        db_manager.mark_backup(header['chain'], seq)
+        return path
+
+    def _write(self, header, meta, chunks):
+        name = f"{header['seq']:012d}-{int(header['created'] * 1000)}-{header['kind']}{SNAPSHOT_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        cipher_suite = self.password_manager.cipher_suite
+        with open(path + '.tmp', 'wb') as file:
+            file.write(SNAPSHOT_MAGIC + json.dumps(header).encode() + b'\n')
+            for payload in _chain_frames(meta, chunks):
+                token = cipher_suite.encrypt(zlib.compress(json.dumps(payload).encode(), self.level))
+                file.write(_FRAME.pack(len(token)) + token)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)  # a crash never leaves a partial snapshot in the chain
+        return path
+
+
+def _with_metadata(db_manager, chunks):
+    """Appends the metadata to the rows, as [username, url, tags, created_at, updated_at] or None."""
+    for rows in chunks:
+        metadata = db_manager.get_metadata_many(service for service, password in rows if password is not None)
+        yield [(service, password, _metadata_row(metadata.get(service))) for service, password in rows]
+
+
+def _metadata_row(metadata):
+    if metadata is None:
+        return None
+    return [metadata['username'], metadata['url'], metadata['tags'], metadata['created_at'], metadata['updated_at']]
+
+
+def _chain_frames(meta, chunks):
+    yield meta
+    for rows in chunks:
+        yield rows
+
+
+def _salt_bytes(salt):
+    return salt.encode() if isinstance(salt, str) else bytes(salt)
+
+
+def _read_header(file):
+    if file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        return None
+    header = json.loads(file.readline())
+    header['salt'] = base64.b64decode(header['salt'])
+    return header
+
+
+def _read_frames(file):
+    while True:
+        prefix = file.read(_FRAME.size)
+        if not prefix:
+            return
+        token = file.read(_FRAME.unpack(prefix)[0])
+        yield token
+
+
+def list_snapshots(directory):
+    """Lists the snapshots of a directory, oldest first.
+
+    Args:
+        directory (str): The directory holding the snapshots.
+
+    Returns:
+        list: The header of each snapshot as a dict, with its ``path`` added.
+    """
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for file_name in os.listdir(directory):
+        if not file_name.endswith(SNAPSHOT_SUFFIX):
+            continue
+        path = os.path.join(directory, file_name)
+        with open(path, 'rb') as file:
+            header = _read_header(file)
+        if header is not None:
+            header['path'] = path
+            snapshots.append(header)
+    return sorted(snapshots, key=lambda header: (header['seq'], header['created']))
+
+
+def restore_snapshot(directory, master_key, target_path, until=None):
+    """Restores a vault as it was at a snapshot, into a new SQLite file.
+
+    The latest full snapshot taken at or before ``until`` is applied, then the
+    incremental snapshots of its chain up to ``until``, each frame in one transaction
+    and with the triggers of the new vault suspended until the end.
+
+    Args:
+        directory (str): The directory holding the snapshots.
+        master_key (str): The master key of the vault when the snapshots were taken.
+        target_path (str): The path of the restored vault, it must not exist.
+        until (float): The point in time to restore, as a Unix timestamp, the latest when omitted.
+
+    Returns:
+        int: The number of rows written.
+
+    Raise:
+        Exception: If the target exists, there is no snapshot to restore, the chain is broken or
+            the master key is wrong.
+    """
+    if os.path.exists(target_path):
+        raise Exception(f"{target_path} already exists!")
+    snapshots = [header for header in list_snapshots(directory) if until is None or header['created'] <= until]
+    fulls = [index for index, header in enumerate(snapshots) if header['kind'] == 'full']
+    if not fulls:
+        raise Exception("No full snapshot to restore from!")
+    chain = snapshots[fulls[-1]]['chain']
+    snapshots = [header for header in snapshots[fulls[-1]:] if header['chain'] == chain]
+    for previous, header in zip(snapshots, snapshots[1:]):
+        if header['base_seq'] != previous['seq']:
+            raise Exception(f"The snapshot chain is broken before {header['path']}!")
+
+    first = snapshots[0]
+    kdf = KdfParams.from_row(first['kdf'])
+    cipher_suite = Fernet(kdf.derive(master_key, first['salt']))
+    db_manager = DatabaseManager(target_path)
+    count = 0
+    try:
+        with db_manager.bulk_load():
+            count = _apply_snapshots(db_manager, snapshots, cipher_suite, kdf)
+        db_manager.mark_backup(None, db_manager.get_change_seq())  # the restored vault starts without a chain
+    except InvalidToken:
+        _discard(db_manager, target_path)
+        raise Exception("Wrong master key!")
+    except Exception:
+        _discard(db_manager, target_path)
+        raise
+    db_manager.close_connection()
+    return count
+
+
+def _apply_snapshots(db_manager, snapshots, cipher_suite, kdf):
+    count = 0
+    for header in snapshots:
+        with open(header['path'], 'rb') as file:
+            _read_header(file)
+            frames = (json.loads(zlib.decompress(cipher_suite.decrypt(token))) for token in _read_frames(file))
+            meta = next(frames)
+            if header is snapshots[0]:
+                db_manager.set_master_key_hash_and_salt(meta['master_key_hash'], header['salt'], kdf.as_row())
+            for rows in frames:
+                # Rows of snapshots taken before metadata was kept have no third item.
+                db_manager.set_passwords_many(((row[0], row[1]) for row in rows if row[1] is not None), replace=True)
+                db_manager.delete_passwords_many(row[0] for row in rows if row[1] is None)
+                db_manager.set_metadata_many([row[0]] + row[2] for row in rows if len(row) > 2 and row[2])
+                count += len(rows)
+    return count
+
+
+def _discard(db_manager, target_path):
+    db_manager.close_connection()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(target_path + suffix):
+            os.remove(target_path + suffix)
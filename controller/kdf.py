@@ -0,0 +1,214 @@
+import base64
+import os
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+PBKDF2 = 'pbkdf2-sha256'
+SCRYPT = 'scrypt'
+KEY_LENGTH = 32
+SCRYPT_BLOCK_SIZE = 8  # with r = 8 one unit of the scrypt cost N uses 1 KiB, so N is the memory in KiB
+CALIBRATION_ITERATIONS = 20000
+CALIBRATION_MEMORY = 4096
+
+
+class KdfParams:
+    """The parameters of the key derivation of a vault.
+
+    PBKDF2 is tuned with ``iterations`` alone. scrypt is tuned with ``memory``, the KiB
+    used per lane, which is also its cost parameter N, and ``parallelism``, the number
+    of lanes; ``iterations`` is unused and kept at 1.
+
+    Atributes:
+        algorithm (str): Either ``pbkdf2-sha256`` or ``scrypt``.
+        iterations (int): The number of PBKDF2 iterations.
+        memory (int): The scrypt memory in KiB, a power of two.
+        parallelism (int): The scrypt parallelism.
+    """
+
+    def __init__(self, algorithm=PBKDF2, iterations=100000, memory=0, parallelism=1):
+        """Initializes the instance based on the parameters.
+
+        Args:
+            algorithm (str): Either ``pbkdf2-sha256`` or ``scrypt``.
+            iterations (int): The number of PBKDF2 iterations.
+            memory (int): The scrypt memory in KiB, a power of two.
+            parallelism (int): The scrypt parallelism.
+
+        Raise:
+            ValueError: If the parameters are not valid.
+        """
+        if algorithm == PBKDF2:
+            memory, parallelism = 0, 1
+            if iterations < 1:
+                raise ValueError("PBKDF2 needs at least one iteration")
+        elif algorithm == SCRYPT:
+            iterations = 1
+            if memory < 2 or memory & (memory - 1) or parallelism < 1:
+                raise ValueError("scrypt needs a power of two memory and a positive parallelism")
+        else:
+            raise ValueError(f"Unknown key derivation algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.iterations = int(iterations)
+        self.memory = int(memory)
+        self.parallelism = int(parallelism)
+
+    @classmethod
+    def from_row(cls, row):
+        """Builds the parameters from a stored row.
+
+        Args:
+            row (tuple): The (algorithm, iterations, memory, parallelism) row, None for vaults
+                created before the parameters were stored.
+
+        Returns:
+            KdfParams: The parameters, the legacy defaults when the row is None.
+        """
+        return DEFAULT_KDF if row is None else cls(*row)
+
+    @classmethod
+    def parse(cls, text):
+        """Builds the parameters from their text form, e.g. ``scrypt:memory=65536,parallelism=1``.
+
+        Args:
+            text (str): The algorithm, optionally followed by a colon and comma separated settings.
+
+        Returns:
+            KdfParams: The parameters.
+
+        Raise:
+            ValueError: If the text is not valid.
+        """
+        algorithm, _, settings = text.strip().partition(':')
+        values = {}
+        for setting in filter(None, settings.split(',')):
+            name, _, value = setting.partition('=')
+            if name.strip() not in ('iterations', 'memory', 'parallelism'):
+                raise ValueError(f"Unknown key derivation setting: {name}")
+            values[name.strip()] = int(value)
+        if algorithm == SCRYPT:
+            values.setdefault('memory', 65536)
+        return cls(algorithm, **values)
+
+    def __str__(self):
+        if self.algorithm == SCRYPT:
+            return f'{SCRYPT}:memory={self.memory},parallelism={self.parallelism}'
+        return f'{PBKDF2}:iterations={self.iterations}'
+
+    def __repr__(self):
+        return f'KdfParams({str(self)!r})'
+
+    def __eq__(self, other):
+        return isinstance(other, KdfParams) and self.as_row() == other.as_row()
+
+    def __hash__(self):
+        return hash(self.as_row())
+
+    def as_row(self):
+        """Returns the parameters as the row stored with the master key.
+
+        Returns:
+            tuple: The (algorithm, iterations, memory, parallelism) row.
+        """
+        return self.algorithm, self.iterations, self.memory, self.parallelism
+
+    @property
+    def cache_key(self):
+        """tuple: The parameters identifying a derived key in the key cache."""
+        return self.as_row() + (KEY_LENGTH,)
+
+    def derive(self, master_key, salt):
+        """Derives the Fernet key from the master key.
+
+        Args:
+            master_key (str): The master key.
+            salt (bytes): The salt of the vault.
+
+        Returns:
+            bytes: The url-safe base64 encoded key.
+        """
+        if isinstance(salt, str):
+            salt = salt.encode()
+        if self.algorithm == SCRYPT:
+            kdf = Scrypt(salt=salt, length=KEY_LENGTH, n=self.memory, r=SCRYPT_BLOCK_SIZE,
+                         p=self.parallelism, backend=default_backend())
+        else:
+            kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=KEY_LENGTH, salt=salt,
+                             iterations=self.iterations, backend=default_backend())
+        return base64.urlsafe_b64encode(kdf.derive(master_key.encode()))
+
+    def estimate_seconds(self):
+        """Estimates how long a derivation takes on this host from a cheaper run.
+
+        Both algorithms scale about linearly with their cost, so a run with fewer iterations
+        or less memory is timed and scaled up.
+
+        Returns:
+            float: The estimated number of seconds.
+        """
+        if self.algorithm == SCRYPT:
+            sample = KdfParams(SCRYPT, memory=min(self.memory, CALIBRATION_MEMORY), parallelism=1)
+            scale = self.memory / sample.memory * self.parallelism
+        else:
+            sample = KdfParams(PBKDF2, min(self.iterations, CALIBRATION_ITERATIONS))
+            scale = self.iterations / sample.iterations
+        salt = os.urandom(16)
+        KdfParams(sample.algorithm, 1, 2).derive('calibration', salt)  # the first call pays for loading the backend
+        start = time.perf_counter()
+        sample.derive('calibration', salt)
+        return (time.perf_counter() - start) * scale
+
+    def needs_upgrade_to(self, target):
+        """Checks if a vault using these parameters should be upgraded to the target ones.
+
+        Args:
+            target (KdfParams): The parameters wanted for the deployment.
+
+        Returns:
+            bool: True if the algorithm differs or any target cost is higher.
+        """
+        if self.algorithm != target.algorithm:
+            return True
+        return (target.iterations > self.iterations or target.memory > self.memory
+                or target.parallelism > self.parallelism)
+
+
+DEFAULT_KDF = KdfParams(PBKDF2, 100000)
+
+
+def calibrate(target_seconds, algorithm=PBKDF2, max_memory=1048576, parallelism=1):
+    """Picks the strongest parameters whose derivation fits in a target latency on this host.
+
+    Args:
+        target_seconds (float): The wanted unlock latency.
+        algorithm (str): Either ``pbkdf2-sha256`` or ``scrypt``.
+        max_memory (int): The maximum scrypt memory in KiB.
+        parallelism (int): The scrypt parallelism.
+
+    Returns:
+        KdfParams: The calibrated parameters, never weaker than the defaults of their algorithm.
+    """
+    if algorithm == SCRYPT:
+        params = KdfParams(SCRYPT, memory=16384, parallelism=parallelism)
+        while params.memory * 2 <= max_memory:
+            candidate = KdfParams(SCRYPT, memory=params.memory * 2, parallelism=parallelism)
+            if candidate.estimate_seconds() > target_seconds:
+                break
+            params = candidate
+        return params
+    seconds_per_iteration = KdfParams(PBKDF2, CALIBRATION_ITERATIONS).estimate_seconds() / CALIBRATION_ITERATIONS
+    iterations = int(target_seconds / seconds_per_iteration) // 10000 * 10000
+    return KdfParams(PBKDF2, max(iterations, DEFAULT_KDF.iterations))
+
+
+def configured_kdf():
+    """Gets the parameters wanted for this deployment, set in the PM_KDF environment variable.
+
+    Returns:
+        KdfParams: The parameters, or None when PM_KDF is not set.
+    """
+    text = os.environ.get('PM_KDF')
+    return KdfParams.parse(text) if text else None
@@ -0,0 +1,124 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+
+class DerivedKeyCache:
+    """An in-process, time-bounded cache of derived vault keys.
+
+    Entries are keyed by the salt, the KDF parameters and a verifier of the master key,
+    an HMAC under a random per-process secret, so the master key itself is never kept.
+    Keys live in memory only and expire after ``ttl`` seconds.
+
+    Atributes:
+        ttl (float): The number of seconds a derived key stays valid.
+        max_entries (int): The maximum number of cached keys, the oldest is dropped first.
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups that had to run the KDF.
+    """
+
+    def __init__(self, ttl=300, max_entries=64):
+        """Initializes the instance based on the TTL and the size bound.
+
+        Args:
+            ttl (float): The number of seconds a derived key stays valid.
+            max_entries (int): The maximum number of cached keys.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _cache_key(self, master_key, salt, params):
+        if isinstance(salt, str):
+            salt = salt.encode()
+        verifier = hmac.new(self._secret, salt + master_key.encode(), hashlib.sha256).digest()
+        return salt, tuple(params), verifier
+
+    def get(self, master_key, salt, params):
+        """Gets a cached key.
+
+        Args:
+            master_key (str): The master key the key was derived from.
+            salt (bytes): The salt used by the KDF.
+            params (tuple): The KDF parameters.
+
+        Returns:
+            bytes: The derived key, or None if it is not cached or has expired.
+        """
+        cache_key = self._cache_key(master_key, salt, params)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[cache_key]
+            self.misses += 1
+            return None
+
+    def put(self, master_key, salt, params, key):
+        """Caches a derived key.
+
+        Args:
+            master_key (str): The master key the key was derived from.
+            salt (bytes): The salt used by the KDF.
+            params (tuple): The KDF parameters.
+            key (bytes): The derived key.
+        """
+        cache_key = self._cache_key(master_key, salt, params)
+        with self._lock:
+            self._entries.pop(cache_key, None)
+            while len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[cache_key] = (key, time.monotonic() + self.ttl)
+
+    def get_or_derive(self, master_key, salt, params, derive):
+        """Gets a cached key, deriving and caching it on a miss.
+
+        Args:
+            master_key (str): The master key the key is derived from.
+            salt (bytes): The salt used by the KDF.
+            params (tuple): The KDF parameters.
+            derive (callable): Called without arguments to run the KDF on a miss.
+
+        Returns:
+            bytes: The derived key.
+        """
+        key = self.get(master_key, salt, params)
+        if key is None:
+            key = derive()
+            self.put(master_key, salt, params, key)
+        return key
+
+    def evict(self, salt=None):
+        """Evicts cached keys.
+
+        Args:
+            salt (bytes): Only the keys derived with this salt are evicted, all of them when omitted.
+        """
+        if isinstance(salt, str):
+            salt = salt.encode()
+        with self._lock:
+            if salt is None:
+                self._entries.clear()
+            else:
+                for cache_key in [cache_key for cache_key in self._entries if cache_key[0] == salt]:
+                    del self._entries[cache_key]
+
+    def stats(self):
+        """Gets the cache counters.
+
+        Returns:
+            dict: The hits, misses and number of cached keys.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+key_cache = DerivedKeyCache()
@@ -0,0 +1,96 @@
+import os
+
+from controller.kdf import KdfParams
+from controller.password_manager import PasswordManager
+
+
+class KeyRotation:
+    """Rotates the master key and salt, re-encrypting the vault a chunk at a time.
+
+    The new key is derived once. Rows are streamed in service order, each chunk is
+    decrypted and re-encrypted with the batch APIs and written back in its own
+    transaction together with the previous passwords of its services and the rotation
+    cursor, so the database is never locked for the whole run and an interrupted
+    rotation resumes where it stopped.
+    Other writers must be stopped while a rotation is running.
+
+    Atributes:
+        password_manager (PasswordManager): The password manager unlocked with the current master key.
+        chunk_size (int): The number of rows re-encrypted per transaction.
+        progress (callable): Called with the running count of rows after every chunk.
+    """
+
+    def __init__(self, password_manager, chunk_size=1000, progress=None):
+        """Initializes the instance based on the unlocked password manager.
+
+        Args:
+            password_manager (PasswordManager): The password manager unlocked with the current master key.
+            chunk_size (int): The number of rows re-encrypted per transaction.
+            progress (callable): Called with the running count of rows after every chunk.
+        """
+        self.password_manager = password_manager
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+    def rotate(self, new_master_key, kdf=None):
+        """Rotates the vault to a new master key, resuming an interrupted rotation if there is one.
+
+        Args:
+            new_master_key (str): The new master key.
+            kdf (KdfParams): The key derivation parameters of the new key, the current ones when omitted.
+                A resumed rotation keeps the parameters it was started with.
+
+        Returns:
+            int: The number of rows re-encrypted by this run.
+
+        Raise:
+            Exception: If a rotation to a different master key is already in progress.
+        """
+        db_manager = self.password_manager.db_manager
+        new_hash = PasswordManager.hash_string(new_master_key)
+        state = db_manager.get_rotation_state()
+        if state is None:
+            salt, last_service = os.urandom(32), None
+            kdf = kdf or self.password_manager.kdf
+            db_manager.begin_rotation(new_hash, salt, kdf.as_row())
+        elif state[0] != new_hash:
+            raise Exception("A rotation to a different master key is in progress!")
+        else:
+            _, salt, last_service = state
+            kdf = KdfParams.from_row(db_manager.get_kdf_params(rotation=True))
+
+        target = PasswordManager(new_master_key, db_manager)
+        target.salt = salt
+        target.kdf = kdf
+        target.workers = self.password_manager.workers
+        target.set_key_fernat()
+
+        count = 0
+        for rows in db_manager.iter_passwords(self.chunk_size, after=last_service):
+            services = [service for service, _ in rows]
+            decrypted = self.password_manager.decrypt_many(password for _, password in rows)
+            encrypted = target.encrypt_many(decrypted)
+            history = db_manager.get_history_many(services)
+            history_ids = [history_id for history_id, _ in history]
+            encrypted_history = target.encrypt_many(
+                self.password_manager.decrypt_many(password for _, password in history))
+            db_manager.rotate_chunk(list(zip(services, encrypted)), services[-1],
+                                    list(zip(history_ids, encrypted_history)))
+            count += len(rows)
+            if self.progress is not None:
+                self.progress(count)
+
+        db_manager.finish_rotation()
+        if self.password_manager.key_cache is not None:
+            self.password_manager.key_cache.evict(self.password_manager.salt)
+        self._switch_to(target)
+        return count
+
+    def _switch_to(self, target):
+        """Points the password manager at the rotated key so it stays usable."""
+        self.password_manager.master_key = target.master_key
+        self.password_manager.master_key_hash = target.master_key_hash
+        self.password_manager.salt = target.salt
+        self.password_manager.kdf = target.kdf
+        self.password_manager.key = target.key
+        self.password_manager.cipher_suite = target.cipher_suite
@@ -0,0 +1,159 @@
+import os
+import string
+
+AMBIGUOUS_CHARACTERS = 'Il1|O0o'
+
+# Exactly 256 distinct words, so one random byte picks one word without any bias.
+WORDS = """
+able acid acorn actor adapt agent alarm album alert alpha amber angle ankle apple april arena argue
+armor arrow atlas audio autumn avoid awake badge bagel baker bamboo banjo barn basil basin beach
+beard beast bench berry bike birch bison blade blank blaze bloom board boat bonus book boost booth
+brain brass brave bread brick bride brook broom brush bucket buddy bugle cabin cable cactus camel
+canal candy canoe canvas cargo carpet castle cedar chalk charm chart chess chief chili choir cider
+cinema circle citrus clamp claw clay cliff climb clock cloud clover coast cobra cocoa comet coral
+cotton couch crane crate creek crisp crown crumb crystal cube curry daisy dance delta denim desert
+diary dime dingo disco dock dolphin donut dragon drift drum dune eagle earth easel echo eclipse
+elbow elder ember emerald engine epoch equal fable falcon fancy farm feast fence fern ferry fiber
+field fig flame flask fleet flint flute focus forest fossil fox frost fruit galaxy garden garlic
+gecko gem ginger glacier globe glove goat gold grape gravel guitar habit hammer harbor hazel heron
+hiker honey hotel husky igloo index ink iris island ivory jacket jade jaguar jazz jelly jewel jungle
+kayak kettle kiosk kite koala ladder lagoon lake lantern laser lava lemon lentil lily linen lion
+lobster locket lotus lunar magnet mango maple marble meadow melon mint moose mosaic motor nectar
+needle noble noodle novel nugget oasis ocean olive onion opera orbit orchid otter oxygen paddle
+panda parrot pebble pepper piano pilot planet plum polar pony poppy quartz quill rabbit radar
+""".split()
+
+
+class PasswordPolicy:
+    """The rules the generated passwords must follow.
+
+    Atributes:
+        length (int): The number of characters of each password.
+        classes (list): The enabled character classes, as strings of characters.
+        require_each (bool): Whether every password must contain at least one character of each class.
+        words (int): The number of words of a passphrase, 0 to generate characters instead.
+        separator (str): The string joining the words of a passphrase.
+    """
+
+    def __init__(self, length=12, lowercase=True, uppercase=True, digits=True, symbols=True,
+                 require_each=True, exclude_ambiguous=False, exclude='', words=0, separator='-'):
+        """Initializes the instance based on the rules.
+
+        Args:
+            length (int): The number of characters of each password.
+            lowercase (bool): Whether lowercase letters are used.
+            uppercase (bool): Whether uppercase letters are used.
+            digits (bool): Whether digits are used.
+            symbols (bool): Whether punctuation symbols are used.
+            require_each (bool): Whether every password must contain at least one character of each class.
+            exclude_ambiguous (bool): Whether characters easily mistaken for each other are left out.
+            exclude (str): Other characters to leave out.
+            words (int): The number of words of a passphrase, 0 to generate characters instead.
+            separator (str): The string joining the words of a passphrase.
+
+        Raise:
+            ValueError: If the policy cannot be satisfied.
+        """
+        if exclude_ambiguous:
+            exclude += AMBIGUOUS_CHARACTERS
+        enabled = [(lowercase, string.ascii_lowercase), (uppercase, string.ascii_uppercase),
+                   (digits, string.digits), (symbols, string.punctuation)]
+        self.classes = [''.join(c for c in characters if c not in exclude)
+                        for enabled_class, characters in enabled if enabled_class]
+        self.classes = [characters for characters in self.classes if characters]
+        self.length = length
+        self.require_each = require_each
+        self.words = words
+        self.separator = separator
+
+        if words < 0 or length < 0:
+            raise ValueError("The length of a password cannot be negative")
+        if not words and not self.classes:
+            raise ValueError("The policy leaves no characters to generate passwords from")
+        if not words and require_each and length < len(self.classes):
+            raise ValueError(f"A password of {length} characters cannot contain all the {len(self.classes)} classes")
+
+    @property
+    def alphabet(self):
+        """str: Every character a password may contain."""
+        return ''.join(self.classes)
+
+
+class PasswordGenerator:
+    """Generates passwords in batches from a single entropy buffer.
+
+    Each batch reads one ``os.urandom`` buffer and maps it to characters with a
+    ``bytes.translate`` table, so the per-character work runs in C. Bytes at or above the
+    largest multiple of the alphabet size are deleted by the same call instead of being
+    folded with a modulo, which would favour the first characters of the alphabet. Passwords
+    missing a required class are discarded and drawn again, so the accepted ones stay
+    uniform over every password the policy allows.
+
+    Atributes:
+        policy (PasswordPolicy): The rules the generated passwords follow.
+    """
+
+    def __init__(self, policy=None, entropy=os.urandom):
+        """Initializes the instance based on the policy.
+
+        Args:
+            policy (PasswordPolicy): The rules the generated passwords follow, the default policy when omitted.
+            entropy (callable): Returns the given number of random bytes.
+        """
+        self.policy = policy or PasswordPolicy()
+        self._entropy = entropy
+        alphabet = self.policy.alphabet.encode()
+        size = len(alphabet)
+        self._accepted = 256 - 256 % size if size else 0
+        self._table = bytes(alphabet[b % size] if b < self._accepted else 0 for b in range(256)) if size else None
+        self._rejected = bytes(range(self._accepted, 256))
+        self._required = [frozenset(characters) for characters in self.policy.classes]
+
+    def generate(self):
+        """Generates one password.
+
+        Return:
+            result (str): The generated password.
+        """
+        return self.generate_many(1)[0]
+
+    def generate_many(self, count):
+        """Generates many passwords in one call.
+
+        Args:
+            count (int): The number of passwords generated.
+
+        Return:
+            results (list): The generated passwords.
+        """
+        if self.policy.words:
+            return self._passphrases(count)
+        length = self.policy.length
+        if not length:
+            return [''] * count
+
+        passwords = []
+        while len(passwords) < count:
+            missing = count - len(passwords)
+            characters = self._characters(missing * length)
+            candidates = [characters[i:i + length] for i in range(0, len(characters), length)]
+            if self.policy.require_each:
+                candidates = [password for password in candidates
+                              if all(not required.isdisjoint(password) for required in self._required)]
+            passwords.extend(candidates)
+        return passwords
+
+    def _characters(self, count):
+        # Ask for the expected number of bytes plus a margin, then top up the rare shortfall.
+        characters = b''
+        while len(characters) < count:
+            missing = count - len(characters)
+            buffer = self._entropy(missing * 256 // self._accepted + 64)
+            characters += buffer.translate(self._table, self._rejected)
+        return characters[:count].decode()
+
+    def _passphrases(self, count):
+        words = self.policy.words
+        buffer = self._entropy(count * words)
+        return [self.policy.separator.join(WORDS[b] for b in buffer[i:i + words])
+                for i in range(0, len(buffer), words)]
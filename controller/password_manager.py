@@ -1,12 +1,15 @@
-import base64
 import hashlib
-import secrets
-import string
+import os
+from itertools import repeat
 
 from cryptography.fernet import Fernet
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+from controller.kdf import DEFAULT_KDF, KdfParams
+from controller.key_cache import key_cache
+from controller.password_generator import PasswordGenerator, PasswordPolicy
+from controller.secret_cache import SecretCache
+from controller.service_catalog import ServiceCatalog
+from instrumentation import instrumented
 
 
 class PasswordManager:
@@ -19,8 +22,18 @@ class PasswordManager:
         master_key_hash (str): The hash of the master key.
         cipher_suite (Fernet): The cipher suite used to encrypt and decrypt the passwords.
         key (bytes): The key used to encrypt and decrypt the passwords.
+        kdf (KdfParams): The key derivation parameters of the vault.
+        workers (int): The number of workers used by the batch APIs, defaults to the number of CPUs.
+        parallel_threshold (int): The batch size below which batches are processed serially.
+        process_threshold (int): The batch size from which a process pool is used instead of threads.
+        key_cache (DerivedKeyCache): The cache of derived keys, None to always run the KDF.
+        secret_cache (SecretCache): The opt-in cache of decrypted passwords, None when disabled.
+        service_catalog (ServiceCatalog): The opt-in in-memory index of the services, None when disabled.
     """
 
+    parallel_threshold = 256
+    process_threshold = 20000
+
     def __init__(self, master_key, db_manager):
         """Initializes the instance based on the master key and the database manager.
 
@@ -31,20 +44,42 @@ class PasswordManager:
         self.master_key = master_key
         self.db_manager = db_manager
         self.salt = db_manager.get_salt()
+        self.kdf = KdfParams.from_row(db_manager.get_kdf_params())
         self.master_key_hash = self.hash_string(self.master_key)
         self.cipher_suite = None
         self.key = None
+        self.workers = None
+        self.key_cache = key_cache
+        self.secret_cache = None
+        self.service_catalog = None
+        self._change_seq = 0
 
     @staticmethod  # static method because it doesn't need to access any instance attributes
+    @instrumented
     def hash_string(input_string):
         return hashlib.sha256(input_string.encode()).hexdigest()
 
     @staticmethod  # static method because it doesn't need to access any instance attributes
+    @instrumented
     def generate_password(length=12):
-        all_characters = string.ascii_letters + string.digits + string.punctuation
-        password = ''.join(secrets.choice(all_characters) for _ in range(length))
-        return password
+        policy = PasswordPolicy(length=length, require_each=length >= 4)
+        return PasswordGenerator(policy).generate()
+
+    @staticmethod  # static method because it doesn't need to access any instance attributes
+    @instrumented
+    def generate_passwords(count, policy=None):
+        """Generates many passwords from a single entropy buffer.
+
+        Args:
+            count (int): The number of passwords generated.
+            policy (PasswordPolicy): The rules the passwords follow, the default policy when omitted.
+
+        Return:
+            results (list): The generated passwords.
+        """
+        return PasswordGenerator(policy).generate_many(count)
 
+    @instrumented
     def set_password(self, service, password):
         """Sets a password for a given service.
 
@@ -54,7 +89,27 @@ class PasswordManager:
         """
         encrypted_password = self.encrypt_password(password)
         self.db_manager.set_password(service, encrypted_password)
+        self._invalidate(service)
+        if self.service_catalog is not None:
+            self.service_catalog.add(service)
 
+    @instrumented
+    def set_passwords_many(self, services, passwords, replace=False):
+        """Sets the passwords of many services in a single transaction.
+
+        Args:
+            services (list): The services for which the passwords are set.
+            passwords (iterable): The passwords to be set, in the same order.
+            replace (bool): If True existing services are overwritten, otherwise they are kept.
+        """
+        encrypted_passwords = self.encrypt_many(passwords)
+        self.db_manager.set_passwords_many(zip(services, encrypted_passwords), replace)
+        for service in services:
+            self._invalidate(service)
+            if self.service_catalog is not None:
+                self.service_catalog.add(service)
+
+    @instrumented
     def update_password(self, service, password):
         """Updates a password for a given service in the database.
 
@@ -64,7 +119,9 @@ class PasswordManager:
         """
         encrypted_password = self.encrypt_password(password)
         self.db_manager.update_password(service, encrypted_password)
+        self._invalidate(service)
 
+    @instrumented
     def encrypt_password(self, password):
         """Encrypts a password.
 
@@ -76,6 +133,7 @@ class PasswordManager:
         """
         return self.cipher_suite.encrypt(password.encode()).decode()
 
+    @instrumented
     def decrypt_password(self, encrypted_password):
         """Decrypts a password.
 
@@ -87,6 +145,49 @@ class PasswordManager:
         """
         return self.cipher_suite.decrypt(encrypted_password.encode()).decode()
 
+    @instrumented
+    def encrypt_many(self, passwords, workers=None):
+        """Encrypts many passwords, fanning out across a pool of workers.
+
+        Args:
+            passwords (iterable): The passwords to be encrypted.
+            workers (int): The number of workers, overrides the instance setting.
+
+        Returns:
+            list: The encrypted passwords, in the same order.
+        """
+        return self._map_batch(_encrypt_chunk, passwords, workers)
+
+    @instrumented
+    def decrypt_many(self, encrypted_passwords, workers=None):
+        """Decrypts many passwords, fanning out across a pool of workers.
+
+        Args:
+            encrypted_passwords (iterable): The passwords to be decrypted.
+            workers (int): The number of workers, overrides the instance setting.
+
+        Returns:
+            list: The decrypted passwords, in the same order.
+        """
+        return self._map_batch(_decrypt_chunk, encrypted_passwords, workers)
+
+    def _map_batch(self, function, values, workers):
+        """Splits a batch in chunks and runs them on threads, or processes for large batches."""
+        values = list(values)
+        workers = workers or self.workers or os.cpu_count() or 1
+        if workers == 1 or len(values) < self.parallel_threshold:
+            return function(self.key, values)
+
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor  # deferred, costly to import
+
+        size = -(-len(values) // (workers * 4))  # a few chunks per worker to balance the load
+        chunks = [values[i:i + size] for i in range(0, len(values), size)]
+        executor = ProcessPoolExecutor if len(values) >= self.process_threshold else ThreadPoolExecutor
+        with executor(max_workers=workers) as pool:
+            results = pool.map(function, repeat(self.key), chunks)
+            return [value for chunk in results for value in chunk]
+
+    @instrumented
     def delete_passwords(self, service):
         """Deletes a password for a given service.
 
@@ -94,7 +195,11 @@ class PasswordManager:
             service (str): The service for which the password is deleted.
         """
         self.db_manager.delete_password(service)
+        self._invalidate(service)
+        if self.service_catalog is not None:
+            self.service_catalog.remove(service)
 
+    @instrumented
     def get_decrypted_password(self, service):
         """Gets the decrypted password for a given service.
 
@@ -104,12 +209,117 @@ class PasswordManager:
         Returns:
             str: The decrypted password.
         """
+        if self.secret_cache is not None:
+            self._refresh_caches()
+            password = self.secret_cache.get(service)
+            if password is not None:
+                return password
+
         encrypted_password = self.db_manager.get_password(service)
         if encrypted_password is not None:
-            return self.decrypt_password(encrypted_password)
+            password = self.decrypt_password(encrypted_password)
+            if self.secret_cache is not None:
+                self.secret_cache.put(service, password)
+            return password
         else:
             return None
 
+    @instrumented
+    def get_many(self, services):
+        """Gets the decrypted passwords for many services in one round trip.
+
+        Args:
+            services (iterable): The services for which the passwords are retrieved.
+
+        Returns:
+            dict: The decrypted password of each requested service, None for the services not found.
+        """
+        result = dict.fromkeys(services)
+        missing = list(result)
+        if self.secret_cache is not None:
+            self._refresh_caches()
+            for service in missing:
+                result[service] = self.secret_cache.get(service)
+            missing = [service for service, password in result.items() if password is None]
+
+        found = [(service, encrypted_password)
+                 for service, encrypted_password in self.db_manager.get_many(missing).items()
+                 if encrypted_password is not None]
+        decrypted = self.decrypt_many(encrypted_password for _, encrypted_password in found)
+        for (service, _), password in zip(found, decrypted):
+            result[service] = password
+            if self.secret_cache is not None:
+                self.secret_cache.put(service, password)
+        return result
+
+    def enable_secret_cache(self, max_entries=1024, ttl=60):
+        """Enables the cache of decrypted passwords.
+
+        Args:
+            max_entries (int): The maximum number of cached passwords.
+            ttl (float): The number of seconds a cached password stays valid.
+        """
+        self.disable_secret_cache()
+        if self.service_catalog is None:
+            self._watch_changes()
+        self.secret_cache = SecretCache(max_entries, ttl)
+
+    def disable_secret_cache(self):
+        """Disables the cache of decrypted passwords, wiping its content."""
+        if self.secret_cache is not None:
+            self.secret_cache.clear()
+            self.secret_cache = None
+
+    def enable_service_catalog(self):
+        """Loads the in-memory service catalog, the service listing and searches are then served from it."""
+        if self.secret_cache is None:
+            self._watch_changes()
+        self.service_catalog = ServiceCatalog.load(self.db_manager)
+
+    def disable_service_catalog(self):
+        """Drops the in-memory service catalog."""
+        self.service_catalog = None
+
+    def _invalidate(self, service):
+        if self.secret_cache is not None:
+            self.secret_cache.invalidate(service)
+
+    def _watch_changes(self):
+        # Read before the caches are filled, a change committed meanwhile is then applied twice, never missed.
+        self.db_manager.has_changed()
+        self._change_seq = self.db_manager.get_change_seq()
+
+    def _refresh_caches(self):
+        """Drops from the caches the services other processes changed since the last check.
+
+        The data version of the connection tells cheaply whether anything changed; only then
+        the change log is read, from the last sequence number seen. If a backup pruned part
+        of those changes the caches are rebuilt instead.
+        """
+        if not self.db_manager.has_changed():
+            return
+        # One snapshot, a backup pruning the log between the reads would otherwise hide its changes.
+        with self.db_manager.read_transaction():
+            seq = self.db_manager.get_change_seq()
+            state = self.db_manager.get_backup_state()
+            if state is not None and state[1] > self._change_seq:
+                if self.secret_cache is not None:
+                    self.secret_cache.clear()
+                if self.service_catalog is not None:
+                    self.service_catalog = ServiceCatalog.load(self.db_manager)
+            else:
+                for rows in self.db_manager.iter_changes(self._change_seq, seq):
+                    for service, encrypted_password in rows:
+                        self._invalidate(service)
+                        if self.service_catalog is None:
+                            continue
+                        if encrypted_password is None:
+                            self.service_catalog.remove(service)
+                        else:
+                            self.service_catalog.add(service)
+        self._change_seq = seq
+
+    @instrumented
     def verify_master_key(self):
         """Verifies the master key.
 
@@ -123,24 +333,194 @@ class PasswordManager:
         else:
             return True
 
+    @staticmethod
+    @instrumented
+    def derive_key(master_key, salt, kdf=DEFAULT_KDF):
+        """Derives the Fernet key from the master key.
+
+        Args:
+            master_key (str): The master key.
+            salt (bytes): The salt of the vault.
+            kdf (KdfParams): The key derivation parameters.
+
+        Returns:
+            bytes: The url-safe base64 encoded key.
+        """
+        return kdf.derive(master_key, salt)
+
+    @instrumented
     def set_key_fernat(self):
-        """Sets the key and the cipher suite used to encrypt and decrypt the passwords."""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=self.salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        self.key = base64.urlsafe_b64encode(kdf.derive(self.master_key.encode()))
+        """Sets the key and the cipher suite used to encrypt and decrypt the passwords.
+
+        The derived key is taken from the key cache when the same vault was unlocked recently.
+        """
+        if self.key_cache is None:
+            self.key = self.derive_key(self.master_key, self.salt, self.kdf)
+        else:
+            self.key = self.key_cache.get_or_derive(self.master_key, self.salt, self.kdf.cache_key,
+                                                    lambda: self.derive_key(self.master_key, self.salt, self.kdf))
         self.cipher_suite = Fernet(self.key)
 
+    def use_key(self, key):
+        """Sets a key derived elsewhere, e.g. in a background process, and its cipher suite.
+
+        Args:
+            key (bytes): The url-safe base64 encoded key.
+        """
+        self.key = key
+        self.cipher_suite = Fernet(key)
+
+    def lock(self):
+        """Forgets the master key and the derived key, and empties the caches holding secrets.
+
+        Python cannot overwrite the key bytes in place, so they are only dereferenced; the
+        decrypted passwords of the secret cache are zeroed.
+        """
+        if self.key_cache is not None and self.salt is not None:
+            self.key_cache.evict(self.salt)
+        if self.secret_cache is not None:
+            self.secret_cache.clear()
+        self.master_key = None
+        self.key = None
+        self.cipher_suite = None
+
+    def reload_key_params(self):
+        """Reloads the salt and the KDF parameters, e.g. after the master key was created."""
+        self.salt = self.db_manager.get_salt()
+        self.kdf = KdfParams.from_row(self.db_manager.get_kdf_params())
+
+    @instrumented
+    def upgrade_kdf(self, target, chunk_size=1000, progress=None):
+        """Re-keys an unlocked vault with stronger KDF parameters, keeping the master key.
+
+        The vault is rotated to a new salt and key derived with the target parameters, so
+        every password is re-encrypted; an interrupted upgrade resumes on the next call.
+
+        Args:
+            target (KdfParams): The parameters wanted for the deployment.
+            chunk_size (int): The number of rows re-encrypted per transaction.
+            progress (callable): Called with the running count of rows after every chunk.
+
+        Returns:
+            bool: True if the vault was upgraded, False if it already met the target.
+        """
+        from controller.key_rotation import KeyRotation  # imported here, it depends on this module
+
+        if self.db_manager.get_rotation_state() is None and not self.kdf.needs_upgrade_to(target):
+            return False
+        KeyRotation(self, chunk_size, progress).rotate(self.master_key, target)
+        return True
+
+    @instrumented
     def get_services(self):
         """Gets all the services from the database.
 
         Returns:
             list: A list of tuples containing the service and the password.
         """
+        if self.service_catalog is not None:
+            self._refresh_caches()
+            return [(service,) for service in self.service_catalog.services]
         results = self.db_manager.get_services()
         return results
 
+    @instrumented
+    def search_services(self, query, mode='prefix', limit=50, after=None):
+        """Searches the services without scanning the whole table.
+
+        Args:
+            query (str): The text to look for.
+            mode (str): Either ``prefix`` or ``substring``.
+            limit (int): The maximum number of services returned.
+            after (str): Only services sorted after this one are returned, to fetch the next page.
+
+        Prefix searches are served from the service catalog when it is enabled. Substring
+        searches always go to the trigram index of the database, the catalog would scan.
+
+        Returns:
+            list: The matching services, ordered by name.
+        """
+        if self.service_catalog is not None and mode == 'prefix':
+            self._refresh_caches()
+            return self.service_catalog.search(query, mode, limit, after)
+        return self.db_manager.search_services(query, mode, limit, after)
+
+    @instrumented
+    def set_metadata(self, service, username=None, url=None, tags=None):
+        """Sets the metadata of a service. Metadata is stored in clear, only the passwords are encrypted.
+
+        Args:
+            service (str): The service for which the metadata is set.
+            username (str): The username, None to keep the current one.
+            url (str): The URL, None to keep the current one.
+            tags (iterable): The tags replacing the current ones, None to keep them.
+        """
+        if username is not None or url is not None:
+            self.db_manager.set_metadata(service, username, url)
+        if tags is not None:
+            self.db_manager.set_tags(service, {tag.strip() for tag in tags if tag.strip()})
+
+    @instrumented
+    def get_metadata(self, service):
+        """Gets the metadata of a service without decrypting its password.
+
+        Args:
+            service (str): The service for which the metadata is retrieved.
+
+        Returns:
+            dict: The username, url, tags, created_at and updated_at of the service, or None if it is not found.
+        """
+        return self.db_manager.get_metadata(service)
+
+    @instrumented
+    def get_history(self, service, limit=-1):
+        """Gets the decrypted previous passwords of a service.
+
+        Args:
+            service (str): The service for which the history is retrieved.
+            limit (int): The maximum number of versions returned, negative for no limit.
+
+        Returns:
+            list: The (password, created_at, replaced_at) tuples, latest version first.
+        """
+        history = self.db_manager.get_history(service, limit)
+        passwords = self.decrypt_many(password for password, _, _ in history)
+        return [(password, created_at, replaced_at)
+                for password, (_, created_at, replaced_at) in zip(passwords, history)]
+
+    @instrumented
+    def get_services_tagged(self, tag, limit=-1, after=None):
+        """Gets the services carrying a tag.
+
+        Args:
+            tag (str): The tag to look for.
+            limit (int): The maximum number of services returned, negative for no limit.
+            after (str): Only services sorted after this one are returned, to fetch the next page.
+
+        Returns:
+            list: The services, ordered by name.
+        """
+        return self.db_manager.get_services_tagged(tag, limit, after)
+
+    @instrumented
+    def get_services_modified_since(self, since, limit=-1):
+        """Gets the services changed since a point in time.
+
+        Args:
+            since (float): The point in time, as a Unix timestamp.
+            limit (int): The maximum number of services returned, negative for no limit.
+
+        Returns:
+            list: The (service, updated_at) tuples, oldest change first.
+        """
+        return self.db_manager.get_services_modified_since(since, limit)
+
+
+def _encrypt_chunk(key, passwords):
+    cipher_suite = Fernet(key)
+    return [cipher_suite.encrypt(password.encode()).decode() for password in passwords]
+
+
+def _decrypt_chunk(key, encrypted_passwords):
+    cipher_suite = Fernet(key)
+    return [cipher_suite.decrypt(encrypted_password.encode()).decode() for encrypted_password in encrypted_passwords]
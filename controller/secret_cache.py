@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SecretCache:
+    """A size-bounded LRU cache of decrypted passwords with a per-entry TTL.
+
+    Plaintext is held in a ``bytearray`` that is overwritten with zeros when the entry
+    is evicted, expires or is invalidated. The strings returned to callers are copies
+    Python cannot wipe, so the zeroing only covers the cache's own storage.
+
+    Atributes:
+        max_entries (int): The maximum number of cached passwords.
+        ttl (float): The number of seconds a cached password stays valid.
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups that missed or found an expired entry.
+        evictions (int): The number of entries dropped because the cache was full or they expired.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        """Initializes the instance based on the size bound and the TTL.
+
+        Args:
+            max_entries (int): The maximum number of cached passwords.
+            ttl (float): The number of seconds a cached password stays valid.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, service):
+        """Gets a cached password.
+
+        Args:
+            service (str): The service for which the password is retrieved.
+
+        Returns:
+            str: The password, or None if it is not cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(service)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= time.monotonic():
+                self._drop(service)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(service)
+            self.hits += 1
+            return entry[0].decode()
+
+    def put(self, service, password):
+        """Caches a password, evicting the least recently used one if the cache is full.
+
+        Args:
+            service (str): The service of the password.
+            password (str): The decrypted password.
+        """
+        with self._lock:
+            if service in self._entries:
+                self._drop(service)
+            while len(self._entries) >= self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[service] = (bytearray(password.encode()), time.monotonic() + self.ttl)
+
+    def invalidate(self, service):
+        """Drops the cached password of a service.
+
+        Args:
+            service (str): The service of the password.
+        """
+        with self._lock:
+            if service in self._entries:
+                self._drop(service)
+
+    def clear(self):
+        """Drops every cached password."""
+        with self._lock:
+            for service in list(self._entries):
+                self._drop(service)
+
+    def stats(self):
+        """Gets the cache counters.
+
+        Returns:
+            dict: The hits, misses, evictions, size and hit rate of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _drop(self, service):
+        plaintext, _ = self._entries.pop(service)
+        plaintext[:] = bytes(len(plaintext))  # overwrites the buffer in place
@@ -0,0 +1,166 @@
+import asyncio
+import hmac
+import json
+import os
+import secrets
+
+
+class SecretServer:
+    """Serves secrets of an unlocked vault to local clients.
+
+    Clients send one JSON request per line and get one JSON response per line, over a
+    Unix socket only its owner can open, or a localhost TCP port. Any local user can
+    connect to the port, so over TCP every request must carry the ``token`` of the server:
+
+        {"op": "get", "service": "github"}         ->  {"ok": true, "password": "..."}
+        {"op": "get_many", "services": ["a", "b"]}  ->  {"ok": true, "passwords": {"a": "...", "b": null}}
+        {"op": "services"}                         ->  {"ok": true, "services": ["github", ...]}
+        {"op": "get", "service": "github", "token": "..."}  over TCP
+
+    Concurrent ``get`` requests are batched: they are collected for ``batch_window``
+    seconds, their ciphertexts are read with one ``get_many`` query and decrypted in a
+    single ``decrypt_many`` call, off the event loop.
+
+    Atributes:
+        password_manager (PasswordManager): The password manager, unlocked once at startup.
+        db_manager (AsyncDatabaseManager): The asyncio data-access layer used for reads.
+        batch_window (float): The number of seconds requests are collected before a batch is resolved.
+        max_batch (int): The maximum number of requests resolved in one batch.
+        token (str): The secret TCP clients must send, None when serving on a Unix socket.
+    """
+
+    def __init__(self, password_manager, db_manager, batch_window=0.001, max_batch=256):
+        """Initializes the instance based on the unlocked password manager and the asyncio database.
+
+        Args:
+            password_manager (PasswordManager): The password manager, unlocked with set_key_fernat.
+            db_manager (AsyncDatabaseManager): The asyncio data-access layer used for reads.
+            batch_window (float): The number of seconds requests are collected before a batch is resolved.
+            max_batch (int): The maximum number of requests resolved in one batch.
+        """
+        self.password_manager = password_manager
+        self.db_manager = db_manager
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.token = None
+        self._queue = None
+        self._batcher = None
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        """Starts listening.
+
+        Args:
+            path (str): The Unix socket path, when omitted a TCP port is used instead.
+            host (str): The TCP host, only localhost should be used.
+            port (int): The TCP port, 0 picks a free one.
+
+        Returns:
+            asyncio.Server: The listening server. Over TCP, ``token`` is set to the secret clients must send.
+        """
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run_batches())
+        if path is not None:
+            # The socket is created without access for others, there is no window before a chmod.
+            umask = os.umask(0o077)
+            try:
+                server = await asyncio.start_unix_server(self._handle_client, path)
+            finally:
+                os.umask(umask)
+        else:
+            self.token = secrets.token_urlsafe(32)
+            server = await asyncio.start_server(self._handle_client, host, port)
+        return server
+
+    async def stop(self):
+        """Stops the batching task."""
+        if self._batcher is not None:
+            self._batcher.cancel()
+
+    async def get_password(self, service):
+        """Gets the decrypted password for a given service through the batching queue.
+
+        Args:
+            service (str): The service for which the password is retrieved.
+
+        Returns:
+            str: The decrypted password, or None if it is not found.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((service, future))
+        return await future
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # a line longer than the stream limit, the framing is lost
+                    writer.write(json.dumps({'ok': False, 'error': 'request too long'}).encode() + b'\n')
+                    await writer.drain()
+                    return
+                if not line:
+                    return
+                try:
+                    response = await self._dispatch(line)
+                except Exception as e:  # a failed request is answered, the connection stays usable
+                    response = {'ok': False, 'error': str(e) or type(e).__name__}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, line):
+        try:
+            request = json.loads(line)
+            op = request['op']
+        except (ValueError, TypeError, KeyError):
+            return {'ok': False, 'error': 'invalid request'}
+        if self.token is not None:
+            token = request.get('token')
+            if not isinstance(token, str) or not hmac.compare_digest(token.encode(), self.token.encode()):
+                return {'ok': False, 'error': 'unauthorized'}
+
+        if op == 'get':
+            if not isinstance(request.get('service'), str):
+                return {'ok': False, 'error': 'invalid request'}
+            password = await self.get_password(request['service'])
+            if password is None:
+                return {'ok': False, 'error': 'not found'}
+            return {'ok': True, 'password': password}
+        if op == 'get_many':
+            services = request.get('services')
+            if not isinstance(services, list) or not all(isinstance(service, str) for service in services):
+                return {'ok': False, 'error': 'invalid request'}
+            passwords = await asyncio.gather(*(self.get_password(service) for service in services))
+            return {'ok': True, 'passwords': dict(zip(services, passwords))}
+        if op == 'services':
+            services = await self.db_manager.get_services()
+            return {'ok': True, 'services': [service[0] for service in services]}
+        return {'ok': False, 'error': f'unknown op: {op}'}
+
+    async def _run_batches(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                results = await self._resolve({service for service, _ in batch})
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for service, future in batch:
+                if not future.done():
+                    future.set_result(results.get(service))
+
+    async def _resolve(self, services):
+        encrypted = await self.db_manager.get_many(services)
+        found = [(service, password) for service, password in encrypted.items() if password is not None]
+        decrypted = await asyncio.get_running_loop().run_in_executor(
+            None, self.password_manager.decrypt_many, [password for _, password in found])
+        return dict(zip((service for service, _ in found), decrypted))
@@ -0,0 +1,98 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
+_PREFIX_END = '\U0010ffff'  # sorts after any character, closes the prefix range
+
+
+class ServiceCatalog:
+    """A compact, sorted in-memory index of the service names.
+
+    Names are kept in one sorted list, a single pointer per entry on top of the string
+    itself, so prefix searches and pages are bisections instead of queries. The catalog
+    is loaded once and then kept in sync incrementally by the password manager.
+
+    Atributes:
+        services (list): The service names, sorted.
+    """
+
+    __slots__ = ('services', '_lock')
+
+    def __init__(self, services=()):
+        """Initializes the instance based on the service names.
+
+        Args:
+            services (iterable): The service names, in any order.
+        """
+        self.services = sorted(set(services))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, db_manager):
+        """Builds the catalog from the services of a database.
+
+        Args:
+            db_manager (DatabaseManager): The database to read the services from.
+
+        Returns:
+            ServiceCatalog: The loaded catalog.
+        """
+        return cls(service for service, in db_manager.get_services())
+
+    def __len__(self):
+        return len(self.services)
+
+    def __contains__(self, service):
+        index = bisect_left(self.services, service)
+        return index < len(self.services) and self.services[index] == service
+
+    def add(self, service):
+        """Adds a service, nothing happens if it is already there.
+
+        Args:
+            service (str): The service to be added.
+        """
+        with self._lock:
+            if service not in self:
+                insort(self.services, service)
+
+    def remove(self, service):
+        """Removes a service, nothing happens if it is not there.
+
+        Args:
+            service (str): The service to be removed.
+        """
+        with self._lock:
+            index = bisect_left(self.services, service)
+            if index < len(self.services) and self.services[index] == service:
+                del self.services[index]
+
+    def search(self, query, mode='prefix', limit=50, after=None):
+        """Searches the services, with the same contract as the database search.
+
+        Args:
+            query (str): The text to look for.
+            mode (str): Either ``prefix``, a bisection, or ``substring``, a scan of every name; the
+                password manager sends substring searches to the trigram index of the database.
+            limit (int): The maximum number of services returned, negative for no limit.
+            after (str): Only services sorted after this one are returned.
+
+        Returns:
+            list: The matching services, ordered by name.
+        """
+        services = self.services
+        start = bisect_right(services, after) if after is not None else 0
+        if mode == 'prefix':
+            start = max(start, bisect_left(services, query))
+            end = bisect_left(services, query + _PREFIX_END, start)
+            return services[start:end if limit < 0 else min(end, start + limit)]
+        if mode == 'substring':
+            query = query.casefold()
+            matches = []
+            for service in islice(services, start, None):
+                if query in service.casefold():
+                    matches.append(service)
+                    if len(matches) == limit:
+                        break
+            return matches
+        raise ValueError(f"Unknown search mode: {mode}")
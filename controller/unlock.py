@@ -0,0 +1,134 @@
+import multiprocessing
+import time
+
+from controller.password_manager import PasswordManager
+from instrumentation import instrumented
+
+
+def _derive_key(master_key, salt, kdf):
+    return PasswordManager.derive_key(master_key, salt, kdf)
+
+
+def _estimate_seconds(kdf):
+    return kdf.estimate_seconds()
+
+
+class BackgroundUnlock:
+    """Derives the vault key in a worker process while the caller keeps running.
+
+    The KDF gives no feedback while it runs, so the progress is estimated from the time the
+    previous unlock took, recorded in the vault. Until one is recorded, a cheaper run is timed
+    in a second worker, never on the calling thread. The worker is a process rather than a
+    thread so the derivation can really be cancelled, by terminating it. While the key is derived the
+    service catalog is loaded on the calling thread, so the vault is ready as soon as the
+    key is.
+
+    Atributes:
+        password_manager (PasswordManager): The password manager to unlock, with its master key set.
+        preload (bool): Whether the service catalog is loaded while the key is derived.
+        expected_seconds (float): The estimated duration of the derivation, None until it is known.
+    """
+
+    def __init__(self, password_manager, preload=True):
+        """Initializes the instance based on the password manager.
+
+        Args:
+            password_manager (PasswordManager): The password manager to unlock, with its master key set.
+            preload (bool): Whether the service catalog is loaded while the key is derived.
+        """
+        self.password_manager = password_manager
+        self.preload = preload
+        self.expected_seconds = None
+        self._pool = None
+        self._result = None
+        self._key = None
+        self._started = None
+        self._estimate = None
+        self._seconds = None
+
+    def start(self):
+        """Starts the derivation, then preloads the vault while it runs.
+
+        Nothing is started when the key cache already holds the key.
+        """
+        password_manager = self.password_manager
+        if password_manager.key_cache is not None:
+            self._key = password_manager.key_cache.get(password_manager.master_key, password_manager.salt,
+                                                      password_manager.kdf.cache_key)
+        if self._key is None:
+            self.expected_seconds = password_manager.db_manager.get_kdf_seconds()
+            self._started = time.monotonic()
+            self._pool = multiprocessing.Pool(1 if self.expected_seconds else 2)
+            self._result = self._pool.apply_async(
+                _derive_key, (password_manager.master_key, password_manager.salt, password_manager.kdf),
+                callback=self._derived)
+            if not self.expected_seconds:
+                self._estimate = self._pool.apply_async(_estimate_seconds, (password_manager.kdf,))
+        if self.preload and password_manager.service_catalog is None:
+            password_manager.enable_service_catalog()
+
+    @property
+    def progress(self):
+        """float: The estimated fraction of the derivation done, 1.0 once the key is ready."""
+        if self._key is not None or (self._result is not None and self._result.ready()):
+            return 1.0
+        if self._started is None:
+            return 0.0
+        if self.expected_seconds is None and self._estimate is not None and self._estimate.ready():
+            self.expected_seconds = self._estimate.get()
+        if not self.expected_seconds:
+            return 0.0
+        elapsed = time.monotonic() - self._started
+        return min(elapsed / self.expected_seconds, 0.99)
+
+    def done(self):
+        """Checks if the key is ready, without waiting.
+
+        Returns:
+            bool: True once the key is derived.
+        """
+        return self._key is not None or (self._result is not None and self._result.ready())
+
+    @instrumented
+    def finish(self, timeout=None):
+        """Waits for the key and unlocks the password manager with it.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait, None to wait as long as needed.
+
+        Raise:
+            multiprocessing.TimeoutError: If the key is not ready within the timeout.
+            RuntimeError: If the derivation was cancelled.
+        """
+        password_manager = self.password_manager
+        if self._key is None:
+            if self._result is None:
+                raise RuntimeError("The unlock was cancelled")
+            self._key = self._result.get(timeout)
+            self._close()
+            try:  # the next unlock shows its progress from this duration
+                password_manager.db_manager.set_kdf_seconds(self._seconds)
+            except Exception as e:
+                print(e)
+            if password_manager.key_cache is not None:
+                password_manager.key_cache.put(password_manager.master_key, password_manager.salt,
+                                               password_manager.kdf.cache_key, self._key)
+        password_manager.use_key(self._key)
+
+    def cancel(self):
+        """Stops the derivation, terminating the worker process."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._result = None
+        self._estimate = None
+
+    def _derived(self, key):
+        self._seconds = time.monotonic() - self._started
+
+    def _close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,206 @@
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from controller.password_manager import PasswordManager
+from model.database import DatabaseManager
+
+
+class VaultRegistry:
+    """Opens many vault files at once while keeping connections and keys bounded.
+
+    Vaults are registered by name and nothing is opened until one is used. An opened
+    vault holds its own connection and, once unlocked, its own derived key. At most
+    ``max_open`` vaults are open: opening one more closes the least recently used.
+    Vaults unused for ``idle_timeout`` seconds are closed on the next access, or when
+    ``evict_idle`` is called. Closing a vault drops its key, empties its caches and
+    closes its connection, so callers should get the password manager from ``open`` for
+    each use rather than keep it.
+
+    SQLite connections belong to the thread that opened them, so a registry must be
+    used from a single thread; there is no background reaper for that reason.
+
+    Atributes:
+        max_open (int): The maximum number of open vaults.
+        idle_timeout (float): The number of seconds an unused vault stays open, None to keep it open.
+        opener (callable): Opens the database manager of a vault from its path.
+    """
+
+    def __init__(self, max_open=8, idle_timeout=300, opener=DatabaseManager):
+        """Initializes the instance based on the bounds.
+
+        Args:
+            max_open (int): The maximum number of open vaults.
+            idle_timeout (float): The number of seconds an unused vault stays open, None to keep it open.
+            opener (callable): Opens the database manager of a vault from its path.
+        """
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.opener = opener
+        self._paths = {}
+        self._open = OrderedDict()  # name -> (password manager, last use), least recently used first
+        self._lock = threading.RLock()
+
+    def register(self, name, path):
+        """Registers a vault file, without opening it.
+
+        Args:
+            name (str): The name of the vault.
+            path (str): The path to the vault file.
+
+        Raise:
+            Exception: If another vault is already registered with the name.
+        """
+        with self._lock:
+            if self._paths.get(name, path) != path:
+                raise Exception(f"Vault {name} is already registered!")
+            self._paths[name] = path
+
+    def register_directory(self, directory, suffix='.db'):
+        """Registers every vault file of a directory, named after the file.
+
+        Args:
+            directory (str): The directory holding one vault file per team.
+            suffix (str): The extension of the vault files.
+
+        Returns:
+            list: The names of the registered vaults.
+        """
+        names = []
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith(suffix):
+                name = file_name[:-len(suffix)] if suffix else file_name
+                self.register(name, os.path.join(directory, file_name))
+                names.append(name)
+        return names
+
+    def unregister(self, name):
+        """Closes a vault if it is open and forgets it.
+
+        Args:
+            name (str): The name of the vault.
+        """
+        with self._lock:
+            self.close(name)
+            self._paths.pop(name, None)
+
+    def names(self):
+        """Gets the names of the registered vaults.
+
+        Returns:
+            list: The names, sorted.
+        """
+        return sorted(self._paths)
+
+    def __contains__(self, name):
+        return name in self._open
+
+    def __len__(self):
+        return len(self._open)
+
+    def open(self, name):
+        """Gets the password manager of a vault, opening its connection if needed.
+
+        The returned password manager is locked unless the vault was unlocked before and
+        has not been closed since.
+
+        Args:
+            name (str): The name of the vault.
+
+        Returns:
+            PasswordManager: The password manager of the vault.
+
+        Raise:
+            KeyError: If no vault is registered with the name.
+        """
+        with self._lock:
+            self.evict_idle()
+            if name in self._open:
+                password_manager = self._open.pop(name)[0]
+            else:
+                path = self._paths[name]
+                while len(self._open) >= self.max_open:
+                    self.close(next(iter(self._open)))
+                password_manager = PasswordManager('none', self.opener(path))
+            self._open[name] = (password_manager, time.monotonic())
+            return password_manager
+
+    def unlock(self, name, master_key):
+        """Opens a vault and derives its key, if it is not unlocked yet.
+
+        Args:
+            name (str): The name of the vault.
+            master_key (str): The master key of the vault.
+
+        Returns:
+            PasswordManager: The unlocked password manager of the vault.
+
+        Raise:
+            Exception: If the master key is wrong.
+        """
+        password_manager = self.open(name)
+        # The hex digests are ASCII, compare_digest rejects str holding other characters.
+        verifier = PasswordManager.hash_string(master_key)
+        if password_manager.cipher_suite is not None and hmac.compare_digest(
+                verifier, PasswordManager.hash_string(password_manager.master_key)):
+            return password_manager
+        if not hmac.compare_digest(verifier, password_manager.db_manager.get_master_key_hash() or ''):
+            raise Exception("Wrong master key!")
+        password_manager.master_key = master_key
+        password_manager.reload_key_params()
+        password_manager.set_key_fernat()
+        return password_manager
+
+    def close(self, name):
+        """Locks a vault and closes its connection, nothing happens if it is not open.
+
+        Args:
+            name (str): The name of the vault.
+        """
+        with self._lock:
+            entry = self._open.pop(name, None)
+        if entry is not None:
+            password_manager = entry[0]
+            password_manager.lock()
+            password_manager.disable_service_catalog()
+            password_manager.db_manager.close_connection()
+
+    def close_all(self):
+        """Closes every open vault."""
+        with self._lock:
+            for name in list(self._open):
+                self.close(name)
+
+    def evict_idle(self, now=None):
+        """Closes the vaults unused for longer than the idle timeout.
+
+        Args:
+            now (float): The current ``time.monotonic()``, read when omitted.
+
+        Returns:
+            int: The number of vaults closed.
+        """
+        if self.idle_timeout is None:
+            return 0
+        now = time.monotonic() if now is None else now
+        closed = 0
+        with self._lock:
+            while self._open:
+                name, (_, last_use) = next(iter(self._open.items()))
+                if now - last_use < self.idle_timeout:
+                    break
+                self.close(name)
+                closed += 1
+        return closed
+
+    def stats(self):
+        """Gets the registry counters.
+
+        Returns:
+            dict: The number of registered, open and unlocked vaults.
+        """
+        with self._lock:
+            unlocked = sum(1 for password_manager, _ in self._open.values() if password_manager.cipher_suite is not None)
+            return {'registered': len(self._paths), 'open': len(self._open), 'unlocked': unlocked}
@@ -0,0 +1,202 @@
+import csv
+import json
+import os
+import re
+from itertools import islice
+
+
+FORMATS = ('csv', 'json', 'jsonl')
+
+_JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+class VaultTransfer:
+    """Streams vault dumps in and out of the database.
+
+    Imports and exports go through the password manager, so secrets are only stored
+    encrypted, and are processed a chunk at a time: every chunk is written with a
+    single ``executemany`` and one commit, and memory stays flat whatever the size
+    of the dump.
+
+    Atributes:
+        password_manager (PasswordManager): The unlocked password manager used to encrypt and decrypt.
+        chunk_size (int): The number of entries processed per transaction.
+        progress (callable): Called with the running count of entries after every chunk.
+    """
+
+    def __init__(self, password_manager, chunk_size=1000, progress=None):
+        """Initializes the instance based on the password manager.
+
+        Args:
+            password_manager (PasswordManager): The unlocked password manager used to encrypt and decrypt.
+            chunk_size (int): The number of entries processed per transaction.
+            progress (callable): Called with the running count of entries after every chunk.
+        """
+        self.password_manager = password_manager
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+    @staticmethod
+    def detect_format(path):
+        """Detects the dump format from the file extension.
+
+        Args:
+            path (str): The path of the dump.
+
+        Returns:
+            str: One of ``csv``, ``json`` or ``jsonl``.
+        """
+        extension = os.path.splitext(path)[1].lower().lstrip('.')
+        if extension == 'ndjson':
+            extension = 'jsonl'
+        if extension not in FORMATS:
+            raise ValueError(f"Unknown dump format: {path}")
+        return extension
+
+    def import_file(self, path, fmt=None, replace=False):
+        """Imports a plaintext dump into the vault.
+
+        Args:
+            path (str): The path of the dump.
+            fmt (str): The dump format, detected from the extension when omitted.
+            replace (bool): If True existing services are overwritten, otherwise they are kept.
+
+        Returns:
+            int: The number of entries read from the dump.
+        """
+        fmt = fmt or self.detect_format(path)
+        with open(path, newline='', encoding='utf-8') as file:
+            entries = _READERS[fmt](file)
+            return self.import_entries(entries, replace)
+
+    def import_entries(self, entries, replace=False):
+        """Imports (service, password) pairs into the vault in chunked transactions.
+
+        Args:
+            entries (iterable): The plaintext (service, password) pairs.
+            replace (bool): If True existing services are overwritten, otherwise they are kept.
+
+        Returns:
+            int: The number of entries processed.
+        """
+        count = 0
+        for chunk in _chunks(entries, self.chunk_size):
+            services = [service for service, _ in chunk]
+            self.password_manager.set_passwords_many(services, (password for _, password in chunk), replace)
+            count += len(chunk)
+            self._report(count)
+        return count
+
+    def export_file(self, path, fmt=None):
+        """Exports the vault as a plaintext dump.
+
+        Args:
+            path (str): The path of the dump.
+            fmt (str): The dump format, detected from the extension when omitted.
+
+        Returns:
+            int: The number of entries written.
+        """
+        fmt = fmt or self.detect_format(path)
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            return _WRITERS[fmt](file, self.export_entries())
+
+    def export_entries(self):
+        """Decrypts the vault a chunk at a time.
+
+        Returns:
+            generator: The plaintext (service, password) pairs, ordered by service.
+        """
+        count = 0
+        for rows in self.password_manager.db_manager.iter_passwords(self.chunk_size):
+            decrypted = self.password_manager.decrypt_many(password for _, password in rows)
+            yield from zip((service for service, _ in rows), decrypted)
+            count += len(rows)
+            self._report(count)
+
+    def _report(self, count):
+        if self.progress is not None:
+            self.progress(count)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _entry(record):
+    try:
+        return record['service'], record['password']
+    except (KeyError, TypeError):
+        raise ValueError(f"Invalid vault entry: {record!r}")
+
+
+def _read_csv(file):
+    for record in csv.DictReader(file):
+        yield _entry(record)
+
+
+def _read_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield _entry(json.loads(line))
+
+
+def _read_json(file, read_size=65536):
+    """Incrementally decodes a JSON array of entries without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(read_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("JSON dump must be an array of entries")
+    position = 1
+    eof = False
+    while True:
+        position = _JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            record, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield _entry(record)
+
+
+def _write_csv(file, entries):
+    writer = csv.writer(file)
+    writer.writerow(('service', 'password'))
+    count = 0
+    for count, entry in enumerate(entries, 1):
+        writer.writerow(entry)
+    return count
+
+
+def _write_jsonl(file, entries):
+    count = 0
+    for count, (service, password) in enumerate(entries, 1):
+        file.write(json.dumps({'service': service, 'password': password}) + '\n')
+    return count
+
+
+def _write_json(file, entries):
+    file.write('[')
+    count = 0
+    for count, (service, password) in enumerate(entries, 1):
+        if count > 1:
+            file.write(',')
+        file.write('\n' + json.dumps({'service': service, 'password': password}))
+    file.write('\n]\n')
+    return count
+
+
+_READERS = {'csv': _read_csv, 'json': _read_json, 'jsonl': _read_jsonl}
+_WRITERS = {'csv': _write_csv, 'json': _write_json, 'jsonl': _write_jsonl}
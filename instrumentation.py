@@ -0,0 +1,236 @@
+"""Timings and counts for the controller and model operations.
+
+Instrumentation is off by default and costs a single global lookup per call. It is
+turned on with ``enable()`` or through environment variables:
+
+    PM_METRICS=<path>   records timings and dumps them as JSON to <path> at exit
+    PM_PROFILE=<path>   captures a cProfile of the whole process into <path> at exit
+
+The collected metrics are shown with:
+
+    python instrumentation.py show <metrics.json> [--profile <path>]
+"""
+import atexit
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+_BUCKETS_PER_OCTAVE = 8  # log-spaced buckets, percentiles are accurate to about 9%
+
+_recorder = None
+
+
+class Histogram:
+    """A log-bucketed histogram of durations with approximate percentiles.
+
+    Atributes:
+        count (int): The number of recorded durations.
+        total (float): The sum of the recorded durations, in seconds.
+        min (float): The shortest recorded duration, in seconds.
+        max (float): The longest recorded duration, in seconds.
+    """
+
+    def __init__(self):
+        """Initializes an empty histogram."""
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, duration):
+        """Records a duration.
+
+        Args:
+            duration (float): The duration in seconds.
+        """
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        bucket = math.floor(math.log2(max(duration, 1e-9)) * _BUCKETS_PER_OCTAVE)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent):
+        """Gets an approximate percentile.
+
+        Args:
+            percent (float): The percentile, between 0 and 100.
+
+        Returns:
+            float: The upper bound of the bucket holding the percentile, in seconds.
+        """
+        if not self.count:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** ((bucket + 1) / _BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+    def summary(self):
+        """Gets the statistics of the histogram.
+
+        Returns:
+            dict: The count, total, mean, min, p50, p90, p99 and max, durations in seconds.
+        """
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class MetricsRecorder:
+    """Aggregates the durations of the instrumented operations, one histogram per operation."""
+
+    def __init__(self):
+        """Initializes an empty recorder."""
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration):
+        """Records the duration of an operation.
+
+        Args:
+            name (str): The name of the operation.
+            duration (float): The duration in seconds.
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(duration)
+
+    def snapshot(self):
+        """Gets the statistics of every operation.
+
+        Returns:
+            dict: The summary of each operation, by name.
+        """
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+
+def instrumented(function):
+    """Decorates a function so its calls are timed when instrumentation is enabled."""
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        recorder = _recorder
+        if recorder is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            recorder.record(name, time.perf_counter() - start)
+
+    return wrapper
+
+
+def enable(recorder=None):
+    """Turns instrumentation on.
+
+    Args:
+        recorder (MetricsRecorder): The recorder to use, a new one when omitted.
+
+    Returns:
+        MetricsRecorder: The active recorder.
+    """
+    global _recorder
+    _recorder = recorder or MetricsRecorder()
+    return _recorder
+
+
+def disable():
+    """Turns instrumentation off."""
+    global _recorder
+    _recorder = None
+
+
+def get_recorder():
+    """Gets the active recorder.
+
+    Returns:
+        MetricsRecorder: The active recorder, None when instrumentation is off.
+    """
+    return _recorder
+
+
+def dump(path):
+    """Writes the collected metrics as JSON.
+
+    Args:
+        path (str): The path of the JSON file.
+    """
+    metrics = _recorder.snapshot() if _recorder is not None else {}
+    with open(path, 'w') as file:
+        json.dump(metrics, file, indent=2)
+
+
+def show(metrics, out=None):
+    """Prints metrics as a table, slowest total first.
+
+    Args:
+        metrics (dict): The metrics, as returned by MetricsRecorder.snapshot.
+        out: The stream to print to, stdout when omitted.
+    """
+    print(f"{'operation':<42} {'count':>8} {'total s':>9} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9}", file=out)
+    for name, stats in sorted(metrics.items(), key=lambda item: -item[1]['total']):
+        print(f"{name:<42} {stats['count']:>8} {stats['total']:>9.3f} {stats['mean'] * 1000:>9.3f} "
+              f"{stats['p50'] * 1000:>9.3f} {stats['p99'] * 1000:>9.3f} {stats['max'] * 1000:>9.3f}", file=out)
+
+
+def _start_from_environment():
+    metrics_path = os.environ.get('PM_METRICS')
+    if metrics_path:
+        enable()
+        atexit.register(dump, metrics_path)
+
+    profile_path = os.environ.get('PM_PROFILE')
+    if profile_path:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def save_profile():
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+
+        atexit.register(save_profile)
+
+
+_start_from_environment()
+
+
+if __name__ == '__main__':
+    import argparse
+    import pstats
+
+    parser = argparse.ArgumentParser(description='Shows the metrics collected with PM_METRICS and PM_PROFILE.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    show_parser = commands.add_parser('show', help='print collected metrics')
+    show_parser.add_argument('metrics', nargs='?', help='JSON file written through PM_METRICS')
+    show_parser.add_argument('--profile', help='cProfile file written through PM_PROFILE')
+    show_parser.add_argument('--limit', type=int, default=25, help='number of profile entries printed')
+    args = parser.parse_args()
+
+    if args.metrics:
+        with open(args.metrics) as file:
+            show(json.load(file))
+    if args.profile:
+        pstats.Stats(args.profile).sort_stats('cumulative').print_stats(args.limit)
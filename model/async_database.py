@@ -0,0 +1,188 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from model.concurrency import backoff_delays, is_busy
+from model.schema import SchemaManager
+
+
+class AsyncDatabaseManager:
+    """An asyncio data-access layer with the same CRUD surface as the DatabaseManager.
+
+    The database is switched to WAL mode so one writer and many readers can work at the
+    same time. Reads borrow a connection from a bounded pool, writes are serialized on a
+    single writer connection, and the blocking SQLite calls run on a thread pool so the
+    event loop is never blocked. Every connection waits for the locks of other processes,
+    and writes are retried with backoff like those of the DatabaseManager.
+
+    Atributes:
+        db_path (str): The path to the SQLite database.
+        readers (int): The number of pooled reader connections.
+    """
+
+    def __init__(self, db_path, readers=4):
+        """Initializes the instance based on the database path.
+
+        Args:
+            db_path (str): The path to the SQLite database.
+            readers (int): The number of pooled reader connections.
+        """
+        self.db_path = db_path
+        self.readers = readers
+        self._executor = ThreadPoolExecutor(max_workers=readers + 1, thread_name_prefix='db')
+        self._writer = self._connect()
+        schema_manager = SchemaManager(self._writer)
+        schema_manager.apply_pragmas()  # WAL, so readers never wait for the writer
+        schema_manager.migrate()
+        self._write_lock = asyncio.Lock()
+        self._reader_pool = asyncio.Queue(maxsize=readers)
+        for _ in range(readers):
+            reader = self._connect()
+            SchemaManager(reader).apply_pragmas()
+            reader.execute('PRAGMA query_only=ON;')
+            self._reader_pool.put_nowait(reader)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close_connection()
+
+    async def close_connection(self):
+        """Closes the writer and the pooled reader connections, waiting for the readers in use."""
+        async with self._write_lock:
+            self._writer.close()
+        for _ in range(self.readers):
+            reader = await self._reader_pool.get()
+            reader.close()
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _read(self, function, *args):
+        conn = await self._reader_pool.get()
+        try:
+            return await self._run(function, conn, *args)
+        finally:
+            self._reader_pool.put_nowait(conn)
+
+    async def _write(self, query, params):
+        async with self._write_lock:
+            return await self._run(_execute_write, self._writer, query, params)
+
+    async def set_password(self, service, password):
+        """Sets a password for a given service.
+
+        Args:
+            service (str): The service for which the password is set.
+            password (str): The password to be set.
+        """
+        await self._write("""
+            INSERT INTO passwords (service, password)
+            VALUES (?, ?)
+        """, (service, password))
+
+    async def update_password(self, service, password):
+        """Updates the password for a given service.
+
+        Args:
+            service (str): The service for which the password is updated.
+            password (str): The new password.
+        """
+        await self._write("""
+            UPDATE passwords
+            SET password = ?
+            WHERE service = ?;
+        """, (password, service))
+
+    async def delete_password(self, service):
+        """Deletes a password for a given service.
+
+        Args:
+            service (str): The service for which the password is deleted.
+        """
+        await self._write("""
+            DELETE FROM passwords WHERE service = ?
+        """, (service,))
+
+    async def get_password(self, service):
+        """Gets the password for a given service.
+
+        Args:
+            service (str): The service for which the password is retrieved.
+
+        Return:
+            result (str): The password for the given service, or None if it is not found.
+        """
+        return await self._read(_fetch_password, service)
+
+    async def get_many(self, services, chunk_size=500):
+        """Gets the passwords for many services with one query per chunk.
+
+        Args:
+            services (iterable): The services for which the passwords are retrieved.
+            chunk_size (int): The number of services bound per query.
+
+        Return:
+            result (dict): The password of each requested service, None for the services not found.
+        """
+        return await self._read(_fetch_many, list(services), chunk_size)
+
+    async def get_services(self):
+        """Gets all the services from the database.
+
+        Return:
+            results (list): A list of tuples containing the service.
+        """
+        return await self._read(_fetch_services)
+
+
+def _execute_write(conn, query, params):
+    for delay in backoff_delays():
+        try:
+            return _execute_write_once(conn, query, params)
+        except sqlite3.OperationalError:  # only busy errors get here
+            time.sleep(delay)
+    return _execute_write_once(conn, query, params)
+
+
+def _execute_write_once(conn, query, params):
+    try:
+        conn.execute(query, params)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()  # a failed write must not keep holding the write lock
+        if is_busy(e):
+            raise
+        print(e)
+
+
+def _fetch_password(conn, service):
+    result = conn.execute("""
+        SELECT password FROM passwords
+        WHERE service = ?;
+    """, (service,)).fetchone()
+    return result[0] if result is not None else None
+
+
+def _fetch_many(conn, services, chunk_size):
+    result = dict.fromkeys(services)
+    keys = list(result)
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        result.update(conn.execute(f"""
+            SELECT service, password FROM passwords
+            WHERE service IN ({', '.join('?' * len(chunk))});
+        """, chunk).fetchall())
+    return result
+
+
+def _fetch_services(conn):
+    return conn.execute("""
+        SELECT service FROM passwords;
+    """).fetchall()
@@ -0,0 +1,61 @@
+import functools
+import random
+import sqlite3
+import time
+from collections.abc import Iterator
+
+BUSY_TIMEOUT = 5000  # milliseconds SQLite itself waits for a lock before giving up
+BUSY_RETRIES = 5  # retries once SQLite gave up, for writers holding the lock longer than the timeout
+BUSY_BACKOFF = 0.05  # seconds before the first retry, doubled for each one
+BUSY_BACKOFF_MAX = 2.0
+
+
+def is_busy(error):
+    """Tells whether an error means another connection holds the lock.
+
+    Args:
+        error (Exception): The error raised by SQLite.
+
+    Returns:
+        bool: True for ``database is locked`` and ``database is busy`` errors.
+    """
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+def backoff_delays(retries=BUSY_RETRIES, base=BUSY_BACKOFF, cap=BUSY_BACKOFF_MAX):
+    """Yields the waits between retries, exponential with full jitter so processes do not retry in step.
+
+    Args:
+        retries (int): The number of waits.
+        base (float): The upper bound of the first wait, in seconds.
+        cap (float): The largest upper bound, in seconds.
+
+    Returns:
+        generator: The waits, in seconds.
+    """
+    for attempt in range(retries):
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_busy(method):
+    """Decorates a write method of a database manager so it is retried while the database is locked.
+
+    The transaction of ``self.conn`` is rolled back before each retry. Arguments given as
+    iterators are read into lists first, so a retry writes the same rows as the first attempt.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        args = [list(arg) if isinstance(arg, Iterator) else arg for arg in args]
+        kwargs = {name: list(arg) if isinstance(arg, Iterator) else arg for name, arg in kwargs.items()}
+        for delay in backoff_delays():
+            try:
+                return method(self, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy(e):
+                    raise
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                time.sleep(delay)
+        return method(self, *args, **kwargs)
+
+    return wrapper
@@ -1,4 +1,10 @@
 import sqlite3
+from contextlib import contextmanager
+
+from instrumentation import instrumented
+from model.concurrency import is_busy, retry_busy
+from model.schema import SchemaManager
+from model.service_search import ServiceSearch
 
 
 class DatabaseManager:
@@ -8,16 +14,26 @@ class DatabaseManager:
     to set a password for a given service, to delete a password for a given service,
 
     Atributes:
+        db_path (str): The path to the SQLite database.
         conn: The connection object to the database.
+        service_search (ServiceSearch): The indexed service search, created on first use.
     """
-    def __init__(self, db_path):
-        """Initializes the instance based on the database path.
+    def __init__(self, db_path, pragmas=None):
+        """Initializes the instance based on the database path, creating or migrating the schema.
 
         Args:
             db_path (str): The path to the SQLite database.
+            pragmas (dict): The connection pragmas, the tuned ones when omitted.
         """
+        self.db_path = db_path
         self.conn = self.create_connection(db_path)
+        schema_manager = SchemaManager(self.conn)
+        schema_manager.apply_pragmas(pragmas)
+        schema_manager.migrate()
+        self.service_search = None
+        self._data_version = self.get_data_version()
 
+    @instrumented
     def create_connection(self, db_path):
         """Creates a connection to the database.
 
@@ -33,11 +49,14 @@ class DatabaseManager:
         except Exception as e:
             print(e)
 
+    @instrumented
     def close_connection(self):
         """Closes the connection to the database."""
         if self.conn:
             self.conn.close()
 
+    @instrumented
+    @retry_busy
     def set_password(self, service, password):
         """Sets a password for a given service.
 
@@ -53,8 +72,13 @@ class DatabaseManager:
             """, (service, password))
             self.conn.commit()
         except Exception as e:
+            self.conn.rollback()  # a failed write must not keep holding the write lock
+            if is_busy(e):
+                raise
             print(e)
 
+    @instrumented
+    @retry_busy
     def delete_password(self, service):
         """Deletes a password for a given service.
 
@@ -68,8 +92,12 @@ class DatabaseManager:
             """, (service,))
             self.conn.commit()
         except Exception as e:
+            self.conn.rollback()  # a failed write must not keep holding the write lock
+            if is_busy(e):
+                raise
             print(e)
 
+    @instrumented
     def get_all_passwords(self):
         """Gets all the passwords from the database.
 
@@ -83,6 +111,228 @@ class DatabaseManager:
         result = cursor.fetchall()
         return result
 
+    @instrumented
+    @retry_busy
+    def set_passwords_many(self, rows, replace=False):
+        """Sets the passwords for many services in a single transaction.
+
+        Args:
+            rows (iterable): The (service, password) tuples to be set.
+            replace (bool): If True existing services are overwritten, otherwise they are kept.
+
+        Return:
+            result (int): The number of rows written.
+
+        Raise:
+            Exception: If the query fails, after rolling back the whole batch.
+        """
+        # An upsert rather than INSERT OR REPLACE, so updates fire UPDATE triggers instead of deleting rows.
+        conflict = 'DO UPDATE SET password = excluded.password' if replace else 'DO NOTHING'
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany(f"""
+                INSERT INTO passwords (service, password)
+                VALUES (?, ?)
+                ON CONFLICT (service) {conflict}
+            """, rows)
+            self.conn.commit()
+            return cursor.rowcount
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def iter_passwords(self, chunk_size=1000, after=None, updated_at=False):
+        """Iterates over all the passwords in the database, ordered by service.
+
+        Rows are fetched a chunk at a time with keyset pagination, so memory stays
+        bounded by the chunk size no matter how big the vault is.
+
+        Args:
+            chunk_size (int): The number of rows fetched per query.
+            after (str): Only services sorted after this one are returned.
+            updated_at (bool): If True the time each entry was last changed is added to its row.
+
+        Return:
+            result (generator): Lists of (service, password) tuples, one list per chunk, or of
+                (service, password, updated_at) tuples with ``updated_at``.
+        """
+        columns = 'service, password, updated_at' if updated_at else 'service, password'
+        cursor = self.conn.cursor()
+        while True:
+            if after is None:
+                cursor.execute(f"""
+                    SELECT {columns} FROM passwords
+                    ORDER BY service
+                    LIMIT ?;
+                """, (chunk_size,))
+            else:
+                cursor.execute(f"""
+                    SELECT {columns} FROM passwords
+                    WHERE service > ?
+                    ORDER BY service
+                    LIMIT ?;
+                """, (after, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    @instrumented
+    @retry_busy
+    def delete_passwords_many(self, services):
+        """Deletes the passwords of many services in a single transaction.
+
+        Args:
+            services (iterable): The services for which the passwords are deleted.
+
+        Return:
+            result (int): The number of rows deleted.
+
+        Raise:
+            Exception: If the query fails, after rolling back the whole batch.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany("""
+                DELETE FROM passwords WHERE service = ?
+            """, ((service,) for service in services))
+            self.conn.commit()
+            return cursor.rowcount
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @contextmanager
+    def read_transaction(self):
+        """Holds a read transaction, so the reads made inside see one consistent state of the vault.
+
+        With WAL, writers of other connections are not blocked meanwhile.
+        """
+        self.conn.execute('BEGIN;')
+        try:
+            yield
+        finally:
+            self.conn.rollback()
+
+    def bulk_load(self):
+        """Suspends the triggers of the passwords table while a new vault is loaded in bulk.
+
+        Return:
+            result (contextmanager): Creates the triggers again and rebuilds the search index on exit.
+        """
+        return SchemaManager(self.conn).bulk_load()
+
+    @instrumented
+    def get_change_seq(self):
+        """Gets the sequence number of the latest change of the passwords.
+
+        Return:
+            result (int): The sequence number, 0 if nothing changed since the vault was created.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT seq FROM sqlite_sequence
+            WHERE name = 'passwords_changes';
+        """)
+        result = cursor.fetchone()
+        return result[0] if result is not None else 0
+
+    def get_data_version(self):
+        """Gets the counter SQLite bumps whenever another connection commits to the vault.
+
+        Return:
+            result (int): The counter, only meaningful compared with an earlier value of this connection.
+        """
+        return self.conn.execute('PRAGMA data_version;').fetchone()[0]
+
+    def has_changed(self):
+        """Tells whether another connection, of this process or of another one, committed since the last call.
+
+        Reading the counter costs a pragma and no page of the vault, so caches can check it
+        before every read and only then look up what changed with ``iter_changes``.
+
+        Return:
+            result (bool): True if the vault may have changed.
+        """
+        data_version = self.get_data_version()
+        changed = data_version != self._data_version
+        self._data_version = data_version
+        return changed
+
+    def iter_changes(self, since, until, chunk_size=1000):
+        """Iterates over the services changed between two sequence numbers, ordered by service.
+
+        Args:
+            since (int): Only changes after this sequence number are returned.
+            until (int): Only changes up to this sequence number are returned.
+            chunk_size (int): The number of services fetched per query.
+
+        Return:
+            result (generator): Lists of (service, password) tuples, the password is None for deleted services.
+        """
+        cursor = self.conn.cursor()
+        after = None
+        while True:
+            cursor.execute(f"""
+                SELECT changed.service, passwords.password
+                FROM (
+                    SELECT DISTINCT service FROM passwords_changes
+                    WHERE seq > ? AND seq <= ? {'' if after is None else 'AND service > ?'}
+                    ORDER BY service
+                    LIMIT ?
+                ) AS changed
+                LEFT JOIN passwords ON passwords.service = changed.service
+                ORDER BY changed.service;
+            """, (since, until) + (() if after is None else (after,)) + (chunk_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    @instrumented
+    def get_backup_state(self):
+        """Gets the backup chain the tracked changes follow.
+
+        Return:
+            result (tuple): The (chain, seq) of the latest backup, or None if there is none.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT chain, seq FROM backup_state
+            WHERE id = 1;
+        """)
+        return cursor.fetchone()
+
+    @instrumented
+    @retry_busy
+    def mark_backup(self, chain, seq):
+        """Records a backup and prunes the changes it saved.
+
+        Args:
+            chain (str): The identifier of the backup chain, None to detach the vault from any chain.
+            seq (int): The sequence number of the last change saved by the backup.
+
+        Raise:
+            Exception: If the query fails, after rolling back.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO backup_state (id, chain, seq)
+                VALUES (1, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET chain = excluded.chain, seq = excluded.seq;
+            """, (chain, seq))
+            cursor.execute("""
+                DELETE FROM passwords_changes WHERE seq <= ?;
+            """, (seq,))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @instrumented
     def get_password(self, service):
         """Gets the password for a given service.
 
@@ -103,12 +353,39 @@ class DatabaseManager:
         else:
             print("Password for the service not found!")
 
-    def set_master_key_hash_and_salt(self, hash_master_key, salt):
+    @instrumented
+    def get_many(self, services, chunk_size=500):
+        """Gets the passwords for many services with one query per chunk.
+
+        Args:
+            services (iterable): The services for which the passwords are retrieved.
+            chunk_size (int): The number of services bound per query, below SQLite's variable limit.
+
+        Return:
+            result (dict): The password of each requested service, None for the services not found.
+        """
+        result = dict.fromkeys(services)
+        keys = list(result)
+        cursor = self.conn.cursor()
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            cursor.execute(f"""
+                SELECT service, password FROM passwords
+                WHERE service IN ({', '.join('?' * len(chunk))});
+            """, chunk)
+            result.update(cursor.fetchall())
+        return result
+
+    @instrumented
+    @retry_busy
+    def set_master_key_hash_and_salt(self, hash_master_key, salt, kdf=None):
         """Sets the hash of the master key and the salt.
 
         Args:
             hash_master_key (str): The hash of the master key.
             salt (bytes): The salt.
+            kdf (tuple): The (algorithm, iterations, memory, parallelism) of the key derivation,
+                None for the legacy defaults.
 
         Raise:
             Exception: If the query fails.
@@ -116,13 +393,17 @@ class DatabaseManager:
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
-                INSERT INTO master_key (hash, salt)
-                VALUES ( ?,? );
-            """, (hash_master_key, salt))
+                INSERT INTO master_key (hash, salt, kdf_algorithm, kdf_iterations, kdf_memory, kdf_parallelism)
+                VALUES ( ?,?,?,?,?,? );
+            """, (hash_master_key, salt) + (kdf or (None,) * 4))
             self.conn.commit()
         except Exception as e:
+            self.conn.rollback()  # a failed write must not keep holding the write lock
+            if is_busy(e):
+                raise
             print(e)
 
+    @instrumented
     def get_master_key_hash(self):
         """Gets the hash of the master key.
 
@@ -143,6 +424,7 @@ class DatabaseManager:
         else:
             return result[0]
 
+    @instrumented
     def get_salt(self):
         """Gets the salt.
 
@@ -163,6 +445,163 @@ class DatabaseManager:
         else:
             return print("Salt not found!")
 
+    @instrumented
+    def get_kdf_params(self, rotation=False):
+        """Gets the key derivation parameters of the master key.
+
+        Args:
+            rotation (bool): If True, the parameters of the rotation in progress are returned instead.
+
+        Return:
+            result (tuple): The (algorithm, iterations, memory, parallelism), or None for the legacy defaults.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            SELECT kdf_algorithm, kdf_iterations, kdf_memory, kdf_parallelism
+            FROM {'key_rotation' if rotation else 'master_key'}
+            LIMIT 1;
+        """)
+        result = cursor.fetchone()
+        return result if result is not None and result[0] is not None else None
+
+    @instrumented
+    def get_kdf_seconds(self):
+        """Gets how long the last derivation of the master key took.
+
+        Return:
+            result (float): The number of seconds, or None if it was not measured since the master key was set.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT kdf_seconds FROM master_key
+            LIMIT 1;
+        """)
+        result = cursor.fetchone()
+        return result[0] if result is not None else None
+
+    @instrumented
+    @retry_busy
+    def set_kdf_seconds(self, seconds):
+        """Records how long a derivation of the master key took.
+
+        Args:
+            seconds (float): The number of seconds.
+
+        Raise:
+            Exception: If the query fails, after rolling back.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE master_key SET kdf_seconds = ?;
+            """, (seconds,))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @instrumented
+    def get_rotation_state(self):
+        """Gets the state of an interrupted master key rotation.
+
+        Return:
+            result (tuple): The (hash, salt, cursor) of the rotation in progress, or None.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT hash, salt, cursor FROM key_rotation
+            WHERE id = 1;
+        """)
+        return cursor.fetchone()
+
+    @instrumented
+    @retry_busy
+    def begin_rotation(self, hash_master_key, salt, kdf=None):
+        """Records the start of a master key rotation.
+
+        Args:
+            hash_master_key (str): The hash of the new master key.
+            salt (bytes): The new salt.
+            kdf (tuple): The (algorithm, iterations, memory, parallelism) of the new key derivation,
+                None for the legacy defaults.
+
+        Raise:
+            Exception: If the query fails, after rolling back.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO key_rotation (id, hash, salt, cursor, kdf_algorithm, kdf_iterations, kdf_memory, kdf_parallelism)
+                VALUES (1, ?, ?, NULL, ?, ?, ?, ?);
+            """, (hash_master_key, salt) + (kdf or (None,) * 4))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @instrumented
+    @retry_busy
+    def rotate_chunk(self, rows, last_service, history=()):
+        """Writes back a re-encrypted chunk and advances the rotation cursor in the same transaction.
+
+        Args:
+            rows (list): The (service, password) tuples encrypted with the new key.
+            last_service (str): The last service of the chunk.
+            history (list): The (id, password) tuples of the previous versions of the chunk, encrypted with the new key.
+
+        Raise:
+            Exception: If the query fails, after rolling back the chunk.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany("""
+                UPDATE passwords
+                SET password = ?
+                WHERE service = ?;
+            """, ((password, service) for service, password in rows))
+            cursor.executemany("""
+                UPDATE password_history
+                SET password = ?
+                WHERE id = ?;
+            """, ((password, history_id) for history_id, password in history))
+            cursor.execute("""
+                UPDATE key_rotation
+                SET cursor = ?
+                WHERE id = 1;
+            """, (last_service,))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @instrumented
+    @retry_busy
+    def finish_rotation(self):
+        """Replaces the master key hash, salt and KDF parameters by the rotated ones and clears the rotation state.
+
+        Raise:
+            Exception: If the query fails, after rolling back.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                DELETE FROM master_key;
+            """)
+            cursor.execute("""
+                INSERT INTO master_key (hash, salt, kdf_algorithm, kdf_iterations, kdf_memory, kdf_parallelism)
+                SELECT hash, salt, kdf_algorithm, kdf_iterations, kdf_memory, kdf_parallelism FROM key_rotation
+                WHERE id = 1;
+            """)
+            cursor.execute("""
+                DELETE FROM key_rotation;
+            """)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @instrumented
+    @retry_busy
     def update_password(self, service, password):
         """Updates the password for a given service.
 
@@ -182,8 +621,12 @@ class DatabaseManager:
             """, (password, service))
             self.conn.commit()
         except Exception as e:
+            self.conn.rollback()  # a failed write must not keep holding the write lock
+            if is_busy(e):
+                raise
             print(e)
 
+    @instrumented
     def get_services(self):
         """Gets all the services from the database.
 
@@ -202,3 +645,289 @@ class DatabaseManager:
             return results
         except Exception as e:
             print(e)
+
+    @instrumented
+    def search_services(self, query, mode='prefix', limit=50, after=None):
+        """Searches the services through the service index.
+
+        Args:
+            query (str): The text to look for.
+            mode (str): Either ``prefix`` or ``substring``.
+            limit (int): The maximum number of services returned.
+            after (str): Only services sorted after this one are returned.
+
+        Return:
+            results (list): The matching services, ordered by name.
+        """
+        if self.service_search is None:
+            self.service_search = ServiceSearch(self.conn)
+        return self.service_search.search(query, mode, limit, after)
+
+    @instrumented
+    @retry_busy
+    def set_metadata(self, service, username=None, url=None):
+        """Sets the username and URL of a service.
+
+        Args:
+            service (str): The service for which the metadata is set.
+            username (str): The username, None to keep the current one.
+            url (str): The URL, None to keep the current one.
+
+        Raise:
+            Exception: If the query fails, after rolling back.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE passwords
+                SET username = coalesce(?, username), url = coalesce(?, url)
+                WHERE service = ?;
+            """, (username, url, service))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @instrumented
+    @retry_busy
+    def set_tags(self, service, tags):
+        """Replaces the tags of a service.
+
+        Args:
+            service (str): The service for which the tags are set.
+            tags (iterable): The new tags.
+
+        Raise:
+            Exception: If the query fails, after rolling back.
+        """
+        tags = set(tags)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT tag FROM password_tags
+                WHERE service = ?;
+            """, (service,))
+            current = {tag for tag, in cursor.fetchall()}
+            cursor.executemany("""
+                DELETE FROM password_tags WHERE tag = ? AND service = ?;
+            """, ((tag, service) for tag in current - tags))
+            cursor.executemany("""
+                INSERT INTO password_tags (tag, service)
+                SELECT ?, service FROM passwords WHERE service = ?;
+            """, ((tag, service) for tag in tags - current))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @instrumented
+    def get_metadata(self, service):
+        """Gets the metadata of a service.
+
+        Args:
+            service (str): The service for which the metadata is retrieved.
+
+        Return:
+            result (dict): The username, url, tags, created_at and updated_at of the service, or None if
+                it is not found. Timestamps are Unix times, None for entries stored before they were kept.
+        """
+        return self.get_metadata_many([service])[service]
+
+    @instrumented
+    def get_metadata_many(self, services, chunk_size=500):
+        """Gets the metadata of many services with two queries per chunk, without reading the passwords.
+
+        Args:
+            services (iterable): The services for which the metadata is retrieved.
+            chunk_size (int): The number of services bound per query.
+
+        Return:
+            result (dict): The metadata of each requested service as returned by ``get_metadata``,
+                None for the services not found.
+        """
+        result = dict.fromkeys(services)
+        keys = list(result)
+        cursor = self.conn.cursor()
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(f"""
+                SELECT service, username, url, created_at, updated_at FROM passwords
+                WHERE service IN ({placeholders});
+            """, chunk)
+            for service, username, url, created_at, updated_at in cursor.fetchall():
+                result[service] = {'username': username, 'url': url, 'tags': [],
+                                   'created_at': created_at, 'updated_at': updated_at}
+            cursor.execute(f"""
+                SELECT service, tag FROM password_tags
+                WHERE service IN ({placeholders})
+                ORDER BY service, tag;
+            """, chunk)
+            for service, tag in cursor.fetchall():
+                result[service]['tags'].append(tag)
+        return result
+
+    @instrumented
+    @retry_busy
+    def set_metadata_many(self, rows):
+        """Writes the metadata of many services as is, timestamps included, in a single transaction.
+
+        Meant for restores, the timestamps are only kept when the triggers are suspended by ``bulk_load``.
+
+        Args:
+            rows (iterable): The (service, username, url, tags, created_at, updated_at) tuples.
+
+        Raise:
+            Exception: If the query fails, after rolling back the whole batch.
+        """
+        rows = list(rows)
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany("""
+                DELETE FROM password_tags WHERE service = ?;
+            """, ((row[0],) for row in rows))
+            cursor.executemany("""
+                INSERT INTO password_tags (tag, service)
+                VALUES (?, ?);
+            """, ((tag, row[0]) for row in rows for tag in set(row[3])))
+            cursor.executemany("""
+                UPDATE passwords
+                SET username = ?, url = ?, created_at = ?, updated_at = ?
+                WHERE service = ?;
+            """, ((username, url, created_at, updated_at, service)
+                  for service, username, url, _, created_at, updated_at in rows))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @instrumented
+    def get_tags(self):
+        """Gets every tag with the number of services carrying it, from the tag index alone.
+
+        Return:
+            results (list): The (tag, count) tuples, ordered by tag.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT tag, count(*) FROM password_tags
+            GROUP BY tag
+            ORDER BY tag;
+        """)
+        return cursor.fetchall()
+
+    @instrumented
+    def get_services_tagged(self, tag, limit=-1, after=None):
+        """Gets the services carrying a tag, scanning the tag index.
+
+        Args:
+            tag (str): The tag to look for.
+            limit (int): The maximum number of services returned, negative for no limit.
+            after (str): Only services sorted after this one are returned.
+
+        Return:
+            results (list): The services, ordered by name.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            SELECT service FROM password_tags
+            WHERE tag = ? {'' if after is None else 'AND service > ?'}
+            ORDER BY service
+            LIMIT ?;
+        """, (tag,) + (() if after is None else (after,)) + (limit,))
+        return [service for service, in cursor.fetchall()]
+
+    @instrumented
+    def get_services_modified_since(self, since, limit=-1):
+        """Gets the services changed since a point in time, scanning the timestamp index.
+
+        Entries stored before timestamps were kept are never returned.
+
+        Args:
+            since (float): The point in time, as a Unix timestamp.
+            limit (int): The maximum number of services returned, negative for no limit.
+
+        Return:
+            results (list): The (service, updated_at) tuples, oldest change first.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT service, updated_at FROM passwords
+            WHERE updated_at >= ?
+            ORDER BY updated_at
+            LIMIT ?;
+        """, (since, limit))
+        return cursor.fetchall()
+
+    @instrumented
+    def get_history(self, service, limit=-1):
+        """Gets the previous passwords of a service.
+
+        Args:
+            service (str): The service for which the history is retrieved.
+            limit (int): The maximum number of versions returned, negative for no limit.
+
+        Return:
+            results (list): The (password, created_at, replaced_at) tuples, latest version first.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT password, created_at, replaced_at FROM password_history
+            WHERE service = ?
+            ORDER BY id DESC
+            LIMIT ?;
+        """, (service, limit))
+        return cursor.fetchall()
+
+    def get_history_many(self, services, chunk_size=500):
+        """Gets the previous passwords of many services, for a rotation of the master key.
+
+        Args:
+            services (list): The services for which the history is retrieved.
+            chunk_size (int): The number of services bound per query.
+
+        Return:
+            results (list): The (id, password) tuples of every previous version.
+        """
+        results = []
+        cursor = self.conn.cursor()
+        for start in range(0, len(services), chunk_size):
+            chunk = services[start:start + chunk_size]
+            cursor.execute(f"""
+                SELECT id, password FROM password_history
+                WHERE service IN ({', '.join('?' * len(chunk))});
+            """, chunk)
+            results.extend(cursor.fetchall())
+        return results
+
+    @instrumented
+    @retry_busy
+    def prune_history(self, keep):
+        """Deletes the oldest previous passwords, keeping the latest versions of each service.
+
+        Args:
+            keep (int): The number of previous versions kept per service.
+
+        Return:
+            result (int): The number of versions deleted.
+
+        Raise:
+            Exception: If the query fails, after rolling back.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                DELETE FROM password_history
+                WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, row_number() OVER (PARTITION BY service ORDER BY id DESC) AS version
+                        FROM password_history
+                    )
+                    WHERE version > ?
+                );
+            """, (keep,))
+            self.conn.commit()
+            return cursor.rowcount
+        except Exception:
+            self.conn.rollback()
+            raise
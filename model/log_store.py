@@ -0,0 +1,699 @@
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+
+from instrumentation import instrumented
+
+_MAGIC = b'PMVAULT1'
+_HEADER = struct.Struct('<BHII')  # record type, key length, value length, crc32 of key and value
+
+_PUT = 1
+_DELETE = 2
+_MASTER_KEY = 3
+_ROTATION = 4
+_ROTATION_END = 5
+_BATCH = 6  # the value holds several records, applied all together or not at all
+_KDF = 7  # the key derivation parameters of the master key, or of the rotation in progress
+
+_NO_METADATA = "Usernames, URLs and tags are not supported by the log store backend!"
+
+
+class LogStoreManager:
+    """An append-only, memory-mapped vault file with the interface of the DatabaseManager.
+
+    Every change is appended as a record of encrypted data, nothing is rewritten in
+    place. Reads go through an ``mmap`` of the file and a hash index mapping a 64-bit
+    digest of each service to the offset of its latest record, so a lookup is one
+    dictionary access and one slice of the mapping, with no row objects or page parsing.
+    Writes made of several records are appended as one batch record, and a torn record
+    at the end of the file after a crash is dropped when the file is opened.
+
+    Superseded records are only reclaimed by ``compact``, which must run while no other
+    process uses the file.
+
+    Atributes:
+        path (str): The path to the vault file.
+        sync (bool): If True every write is flushed to disk with fsync.
+    """
+
+    def __init__(self, path, sync=True):
+        """Initializes the instance based on the file path, creating the file if needed.
+
+        Args:
+            path (str): The path to the vault file.
+            sync (bool): If True every write is flushed to disk with fsync.
+        """
+        self.path = path
+        self.sync = sync
+        self._open()
+
+    def _open(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, 'wb') as file:
+                file.write(_MAGIC)
+        self._file = open(self.path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(_MAGIC)] != _MAGIC:
+            self.close_connection()
+            raise Exception(f"{self.path} is not a vault file!")
+        self._index = {}  # digest of the service -> offset of its latest record
+        self._overflow = {}  # service -> offset, for the rare services whose digest collides
+        self._master_key = None
+        self._rotation = None
+        self._kdf = {}  # b'master' or b'rotation' -> (algorithm, iterations, memory, parallelism)
+        self._load()
+
+    def _load(self):
+        offset = len(_MAGIC)
+        end = len(self._map)
+        while offset < end:
+            record = self._read_record(offset, end)
+            if record is None:  # torn write at the tail, left by a crash
+                self._file.truncate(offset)
+                self._remap()
+                break
+            self._apply(offset, *record)
+            offset = record[-1]
+
+    def _read_record(self, offset, end):
+        if offset + _HEADER.size > end:
+            return None
+        kind, key_length, value_length, crc = _HEADER.unpack_from(self._map, offset)
+        key_start = offset + _HEADER.size
+        value_start = key_start + key_length
+        next_offset = value_start + value_length
+        if next_offset > end or zlib.crc32(self._map[key_start:next_offset]) != crc:
+            return None
+        return kind, key_start, value_start, next_offset
+
+    def _apply(self, offset, kind, key_start, value_start, next_offset):
+        if kind == _BATCH:
+            position = value_start
+            while position < next_offset:
+                record = self._read_record(position, next_offset)
+                self._apply(position, *record)
+                position = record[-1]
+        elif kind == _PUT:
+            self._index_put(self._map[key_start:value_start].decode(), offset)
+        elif kind == _DELETE:
+            self._index_remove(self._map[key_start:value_start].decode())
+        elif kind == _MASTER_KEY:
+            self._master_key = (self._map[key_start:value_start].decode(), self._map[value_start:next_offset])
+        elif kind == _ROTATION:
+            salt_length = self._map[value_start]
+            salt_end = value_start + 1 + salt_length
+            cursor = self._map[salt_end:next_offset].decode() if next_offset > salt_end else None
+            self._rotation = (self._map[key_start:value_start].decode(), self._map[value_start + 1:salt_end], cursor)
+        elif kind == _ROTATION_END:
+            self._rotation = None
+            self._kdf.pop(b'rotation', None)
+        elif kind == _KDF:
+            self._kdf[self._map[key_start:value_start]] = _decode_kdf(self._map[value_start:next_offset])
+
+    def _remap(self):
+        self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def _digest(service):
+        return int.from_bytes(hashlib.blake2b(service.encode(), digest_size=8).digest(), 'little')
+
+    def _key_at(self, offset):
+        _, key_length, _, _ = _HEADER.unpack_from(self._map, offset)
+        key_start = offset + _HEADER.size
+        return self._map[key_start:key_start + key_length].decode()
+
+    def _value_at(self, offset):
+        _, key_length, value_length, _ = _HEADER.unpack_from(self._map, offset)
+        value_start = offset + _HEADER.size + key_length
+        return self._map[value_start:value_start + value_length].decode()
+
+    def _index_get(self, service):
+        if self._overflow and service in self._overflow:
+            return self._overflow[service]
+        offset = self._index.get(self._digest(service))
+        if offset is not None and self._key_at(offset) == service:
+            return offset
+        return None
+
+    def _index_put(self, service, offset):
+        if service in self._overflow:
+            self._overflow[service] = offset
+            return
+        digest = self._digest(service)
+        existing = self._index.get(digest)
+        if existing is None or self._key_at(existing) == service:
+            self._index[digest] = offset
+        else:
+            self._overflow[service] = offset
+
+    def _index_remove(self, service):
+        if service in self._overflow:
+            del self._overflow[service]
+            return
+        digest = self._digest(service)
+        existing = self._index.get(digest)
+        if existing is not None and self._key_at(existing) == service:
+            del self._index[digest]
+
+    def _offsets(self):
+        yield from self._index.values()
+        yield from self._overflow.values()
+
+    def _append(self, records):
+        """Appends records, as a single batch record when there are several, and indexes them."""
+        encoded = [_encode(kind, key, value) for kind, key, value in records]
+        data = encoded[0] if len(encoded) == 1 else _encode(_BATCH, b'', b''.join(encoded))
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(data)
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+        self._remap()
+        self._apply(offset, *self._read_record(offset, offset + len(data)))
+
+    def close_connection(self):
+        """Closes the vault file."""
+        self._map.close()
+        self._file.close()
+
+    @instrumented
+    def set_password(self, service, password):
+        """Sets a password for a given service.
+
+        Args:
+            service (str): The service for which the password is set.
+            password (str): The password to be set.
+        """
+        if self._index_get(service) is not None:
+            print("UNIQUE constraint failed: passwords.service")
+            return
+        self._append([(_PUT, service.encode(), password.encode())])
+
+    @instrumented
+    def set_passwords_many(self, rows, replace=False):
+        """Sets the passwords for many services in a single batch record.
+
+        Args:
+            rows (iterable): The (service, password) tuples to be set.
+            replace (bool): If True existing services are overwritten, otherwise they are kept.
+
+        Return:
+            result (int): The number of rows written.
+        """
+        batch = {}
+        for service, password in rows:
+            if replace or (service not in batch and self._index_get(service) is None):
+                batch[service] = password
+        if batch:
+            self._append([(_PUT, service.encode(), password.encode()) for service, password in batch.items()])
+        return len(batch)
+
+    @instrumented
+    def update_password(self, service, password):
+        """Updates the password for a given service.
+
+        Args:
+            service (str): The service for which the password is updated.
+            password (str): The new password.
+        """
+        if self._index_get(service) is not None:
+            self._append([(_PUT, service.encode(), password.encode())])
+
+    @instrumented
+    def delete_password(self, service):
+        """Deletes a password for a given service.
+
+        Args:
+            service (str): The service for which the password is deleted.
+        """
+        if self._index_get(service) is not None:
+            self._append([(_DELETE, service.encode(), b'')])
+
+    @instrumented
+    def get_password(self, service):
+        """Gets the password for a given service.
+
+        Args:
+            service (str): The service for which the password is retrieved.
+
+        Return:
+            result (str): The password for the given service.
+        """
+        offset = self._index_get(service)
+        if offset is not None:
+            return self._value_at(offset)
+        else:
+            print("Password for the service not found!")
+
+    @instrumented
+    def get_many(self, services, chunk_size=500):
+        """Gets the passwords for many services.
+
+        Args:
+            services (iterable): The services for which the passwords are retrieved.
+            chunk_size (int): Unused, kept for compatibility with the DatabaseManager.
+
+        Return:
+            result (dict): The password of each requested service, None for the services not found.
+        """
+        result = dict.fromkeys(services)
+        for service in result:
+            offset = self._index_get(service)
+            if offset is not None:
+                result[service] = self._value_at(offset)
+        return result
+
+    @instrumented
+    def get_all_passwords(self):
+        """Gets all the passwords from the vault.
+
+        Return:
+            result (list): A list of tuples containing the service and the password.
+        """
+        return [(self._key_at(offset), self._value_at(offset)) for offset in sorted(self._offsets())]
+
+    def iter_passwords(self, chunk_size=1000, after=None, updated_at=False):
+        """Iterates over all the passwords in the vault, ordered by service.
+
+        Args:
+            chunk_size (int): The number of rows per chunk.
+            after (str): Only services sorted after this one are returned.
+            updated_at (bool): If True a None update time is added to each row, the log store keeps no timestamps.
+
+        Return:
+            result (generator): Lists of (service, password) tuples, one list per chunk, or of
+                (service, password, None) tuples with ``updated_at``.
+        """
+        entries = sorted((self._key_at(offset), offset) for offset in self._offsets())
+        entries = [entry for entry in entries if after is None or entry[0] > after]
+        for start in range(0, len(entries), chunk_size):
+            rows = [(service, self._value_at(offset)) for service, offset in entries[start:start + chunk_size]]
+            yield [row + (None,) for row in rows] if updated_at else rows
+
+    @instrumented
+    def get_services(self):
+        """Gets all the services from the vault.
+
+        Return:
+            results (list): A list of tuples containing the service.
+        """
+        return [(self._key_at(offset),) for offset in sorted(self._offsets())]
+
+    @instrumented
+    def search_services(self, query, mode='prefix', limit=50, after=None):
+        """Searches the services with a scan of the index.
+
+        Args:
+            query (str): The text to look for.
+            mode (str): Either ``prefix`` or ``substring``.
+            limit (int): The maximum number of services returned, negative for no limit.
+            after (str): Only services sorted after this one are returned.
+
+        Return:
+            results (list): The matching services, ordered by name.
+        """
+        if mode == 'prefix':
+            matches = (service for service in map(self._key_at, self._offsets()) if service.startswith(query))
+        elif mode == 'substring':
+            query = query.casefold()
+            matches = (service for service in map(self._key_at, self._offsets()) if query in service.casefold())
+        else:
+            raise ValueError(f"Unknown search mode: {mode}")
+        services = sorted(service for service in matches if after is None or service > after)
+        return services if limit < 0 else services[:limit]
+
+    @instrumented
+    def set_master_key_hash_and_salt(self, hash_master_key, salt, kdf=None):
+        """Sets the hash of the master key and the salt, once.
+
+        Args:
+            hash_master_key (str): The hash of the master key.
+            salt (bytes): The salt.
+            kdf (tuple): The (algorithm, iterations, memory, parallelism) of the key derivation,
+                None for the legacy defaults.
+        """
+        if self._master_key is None:
+            self._append([(_MASTER_KEY, hash_master_key.encode(), bytes(salt)), _kdf_record(b'master', kdf)])
+
+    @instrumented
+    def get_master_key_hash(self):
+        """Gets the hash of the master key.
+
+        Return:
+            result (str): The hash of the master key.
+
+        Raise:
+            Exception: If no master key was set.
+        """
+        if self._master_key is None:
+            raise Exception("Master Key hash not found!")
+        return self._master_key[0]
+
+    @instrumented
+    def get_salt(self):
+        """Gets the salt.
+
+        Return:
+            result (bytes): The salt.
+        """
+        if self._master_key is not None:
+            return self._master_key[1]
+        else:
+            return print("Salt not found!")
+
+    @instrumented
+    def get_kdf_params(self, rotation=False):
+        """Gets the key derivation parameters of the master key.
+
+        Args:
+            rotation (bool): If True, the parameters of the rotation in progress are returned instead.
+
+        Return:
+            result (tuple): The (algorithm, iterations, memory, parallelism), or None for the legacy defaults.
+        """
+        return self._kdf.get(b'rotation' if rotation else b'master')
+
+    def get_kdf_seconds(self):
+        """Gets how long the last derivation of the master key took. The log store does not record it.
+
+        Return:
+            result (float): Always None.
+        """
+        return None
+
+    def set_kdf_seconds(self, seconds):
+        """Records how long a derivation of the master key took. The log store does not record it.
+
+        Args:
+            seconds (float): Unused, kept for the interface of the DatabaseManager.
+        """
+
+    @instrumented
+    def get_rotation_state(self):
+        """Gets the state of an interrupted master key rotation.
+
+        Return:
+            result (tuple): The (hash, salt, cursor) of the rotation in progress, or None.
+        """
+        return self._rotation
+
+    @instrumented
+    def begin_rotation(self, hash_master_key, salt, kdf=None):
+        """Records the start of a master key rotation.
+
+        Args:
+            hash_master_key (str): The hash of the new master key.
+            salt (bytes): The new salt.
+            kdf (tuple): The (algorithm, iterations, memory, parallelism) of the new key derivation,
+                None for the legacy defaults.
+        """
+        self._append([_rotation_record(hash_master_key, salt, None), _kdf_record(b'rotation', kdf)])
+
+    def get_change_seq(self):
+        """Gets the sequence number of the latest change. The log store tracks no changes.
+
+        Return:
+            result (int): Always 0.
+        """
+        return 0
+
+    def has_changed(self):
+        """Tells whether another process changed the vault. The log store is used by one process at a time.
+
+        Return:
+            result (bool): Always False.
+        """
+        return False
+
+    def set_metadata(self, service, username=None, url=None):
+        """Sets the username and URL of a service. The log store keeps no metadata.
+
+        Raise:
+            Exception: Always.
+        """
+        raise Exception(_NO_METADATA)
+
+    def set_tags(self, service, tags):
+        """Replaces the tags of a service. The log store keeps no metadata.
+
+        Raise:
+            Exception: Always.
+        """
+        raise Exception(_NO_METADATA)
+
+    def set_metadata_many(self, rows):
+        """Sets the metadata of many services. The log store keeps no metadata.
+
+        Raise:
+            Exception: Always.
+        """
+        raise Exception(_NO_METADATA)
+
+    def get_metadata(self, service):
+        """Gets the metadata of a service. The log store keeps no metadata, every field is empty.
+
+        Args:
+            service (str): The service for which the metadata is retrieved.
+
+        Return:
+            result (dict): The empty username, url, tags, created_at and updated_at, or None if it is not found.
+        """
+        return self.get_metadata_many([service])[service]
+
+    def get_metadata_many(self, services, chunk_size=500):
+        """Gets the metadata of many services. The log store keeps no metadata, every field is empty.
+
+        Args:
+            services (iterable): The services for which the metadata is retrieved.
+            chunk_size (int): Unused, kept for the interface of the DatabaseManager.
+
+        Return:
+            result (dict): The empty metadata of each requested service, None for the services not found.
+        """
+        return {service: None if self._index_get(service) is None else
+                {'username': None, 'url': None, 'tags': [], 'created_at': None, 'updated_at': None}
+                for service in services}
+
+    def get_tags(self):
+        """Gets every tag with the number of services carrying it. The log store keeps no tags.
+
+        Return:
+            results (list): Always empty.
+        """
+        return []
+
+    def get_services_tagged(self, tag, limit=-1, after=None):
+        """Gets the services carrying a tag. The log store keeps no tags.
+
+        Return:
+            results (list): Always empty.
+        """
+        return []
+
+    def get_services_modified_since(self, since, limit=-1):
+        """Gets the services changed since a point in time. The log store keeps no timestamps.
+
+        Return:
+            results (list): Always empty.
+        """
+        return []
+
+    def get_history(self, service, limit=-1):
+        """Gets the previous passwords of a service. The log store keeps no history.
+
+        Return:
+            results (list): Always empty.
+        """
+        return []
+
+    def prune_history(self, keep):
+        """Deletes the oldest previous passwords. The log store keeps no history.
+
+        Return:
+            result (int): Always 0.
+        """
+        return 0
+
+    def get_history_many(self, services, chunk_size=500):
+        """Gets the previous passwords of many services. The log store keeps no history.
+
+        Args:
+            services (list): The services for which the history is retrieved.
+            chunk_size (int): Unused, kept for the interface of the DatabaseManager.
+
+        Return:
+            results (list): Always empty.
+        """
+        return []
+
+    @instrumented
+    def rotate_chunk(self, rows, last_service, history=()):
+        """Appends a re-encrypted chunk and the rotation cursor in one batch record.
+
+        Args:
+            rows (list): The (service, password) tuples encrypted with the new key.
+            last_service (str): The last service of the chunk.
+            history (list): Unused, the log store keeps no history.
+        """
+        hash_master_key, salt, _ = self._rotation
+        records = [(_PUT, service.encode(), password.encode()) for service, password in rows]
+        self._append(records + [_rotation_record(hash_master_key, salt, last_service)])
+
+    @instrumented
+    def finish_rotation(self):
+        """Replaces the master key hash, salt and KDF parameters by the rotated ones and clears the rotation state."""
+        hash_master_key, salt, _ = self._rotation
+        self._append([(_MASTER_KEY, hash_master_key.encode(), bytes(salt)),
+                      _kdf_record(b'master', self._kdf.get(b'rotation')), (_ROTATION_END, b'', b'')])
+
+    @instrumented
+    def compact(self):
+        """Rewrites the vault with only its live records, reclaiming superseded ones.
+
+        Must run while no other process has the vault open.
+
+        Return:
+            result (tuple): The file size before and after compaction, in bytes.
+        """
+        before = os.path.getsize(self.path)
+        temporary_path = self.path + '.compact'
+        with open(temporary_path, 'wb') as file:
+            file.write(_MAGIC)
+            if self._master_key is not None:
+                file.write(_encode(_MASTER_KEY, self._master_key[0].encode(), bytes(self._master_key[1])))
+                file.write(_encode(*_kdf_record(b'master', self._kdf.get(b'master'))))
+            for rows in self.iter_passwords(chunk_size=10000):
+                file.write(b''.join(_encode(_PUT, service.encode(), password.encode()) for service, password in rows))
+            if self._rotation is not None:
+                file.write(_encode(*_rotation_record(*self._rotation)))
+                file.write(_encode(*_kdf_record(b'rotation', self._kdf.get(b'rotation'))))
+            file.flush()
+            os.fsync(file.fileno())
+        self.close_connection()
+        os.replace(temporary_path, self.path)
+        self._open()
+        return before, os.path.getsize(self.path)
+
+
+def _encode(kind, key, value):
+    return _HEADER.pack(kind, len(key), len(value), zlib.crc32(key + value)) + key + value
+
+
+def _rotation_record(hash_master_key, salt, cursor):
+    salt = bytes(salt)
+    return _ROTATION, hash_master_key.encode(), bytes([len(salt)]) + salt + (cursor or '').encode()
+
+
+def _kdf_record(name, kdf):
+    return _KDF, name, b'' if kdf is None else ','.join(map(str, kdf)).encode()
+
+
+def _decode_kdf(value):
+    if not value:
+        return None
+    algorithm, iterations, memory, parallelism = bytes(value).decode().split(',')
+    return algorithm, int(iterations), int(memory), int(parallelism)
+
+
+def sqlite_to_log(db_manager, log_store, chunk_size=5000):
+    """Copies a SQLite vault into a log store vault, ciphertexts are copied as they are.
+
+    Args:
+        db_manager (DatabaseManager): The source vault.
+        log_store (LogStoreManager): The destination vault.
+        chunk_size (int): The number of rows copied per batch record.
+
+    Returns:
+        int: The number of passwords copied.
+
+    Raise:
+        Exception: If the destination already holds a vault.
+    """
+    _check_empty(log_store, log_store.path)
+    log_store.set_master_key_hash_and_salt(db_manager.get_master_key_hash(), db_manager.get_salt(),
+                                           db_manager.get_kdf_params())
+    count = 0
+    for rows in db_manager.iter_passwords(chunk_size):
+        log_store.set_passwords_many(rows, replace=True)
+        count += len(rows)
+    return count
+
+
+def log_to_sqlite(log_store, db_manager, chunk_size=5000):
+    """Copies a log store vault into a SQLite vault, ciphertexts are copied as they are.
+
+    Args:
+        log_store (LogStoreManager): The source vault.
+        db_manager (DatabaseManager): The destination vault.
+        chunk_size (int): The number of rows copied per transaction.
+
+    Returns:
+        int: The number of passwords copied.
+
+    Raise:
+        Exception: If the destination already holds a vault.
+    """
+    _check_empty(db_manager, db_manager.db_path)
+    db_manager.set_master_key_hash_and_salt(log_store.get_master_key_hash(), log_store.get_salt(),
+                                            log_store.get_kdf_params())
+    count = 0
+    for rows in log_store.iter_passwords(chunk_size):
+        db_manager.set_passwords_many(rows, replace=True)
+        count += len(rows)
+    return count
+
+
+def _check_empty(destination, path):
+    """Refuses a destination holding a master key or passwords, they would not match the copied key."""
+    try:
+        destination.get_master_key_hash()
+        holds_vault = True
+    except Exception:
+        holds_vault = next(iter(destination.iter_passwords(1)), None) is not None
+    if holds_vault:
+        raise Exception(f"{path} already holds a vault, use --force to replace it!")
+
+
+def _remove_vault(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from model.database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description='Maintenance of log store vault files.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('compact', help='reclaim superseded records').add_argument('vault')
+    for name, help_text in (('import', 'convert a SQLite vault to a log store'),
+                            ('export', 'convert a log store to a SQLite vault')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('source')
+        command.add_argument('destination')
+        command.add_argument('--force', action='store_true', help='delete the destination first if it holds a vault')
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        store = LogStoreManager(args.vault)
+        print("%d -> %d bytes" % store.compact())
+        store.close_connection()
+    else:
+        if not os.path.exists(args.source):
+            raise SystemExit(f"Vault not found: {args.source}")
+        if args.force and os.path.abspath(args.source) != os.path.abspath(args.destination):
+            _remove_vault(args.destination)
+        try:
+            if args.command == 'import':
+                count = sqlite_to_log(DatabaseManager(args.source), LogStoreManager(args.destination))
+            else:
+                count = log_to_sqlite(LogStoreManager(args.source), DatabaseManager(args.destination))
+        except Exception as e:
+            raise SystemExit(str(e))
+        print(f"{count} passwords copied")
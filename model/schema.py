@@ -0,0 +1,387 @@
+import sqlite3
+from contextlib import contextmanager
+
+from model.concurrency import BUSY_TIMEOUT, retry_busy
+
+TUNED_PRAGMAS = {
+    'busy_timeout': BUSY_TIMEOUT,  # first, so switching to WAL waits for other processes' locks too
+    'journal_mode': 'WAL',  # readers no longer block on the writer
+    'synchronous': 'NORMAL',  # safe with WAL, syncs on checkpoints instead of every commit
+    'mmap_size': 268435456,  # 256 MiB of the file read through mmap instead of read()
+    'cache_size': -65536,  # 64 MiB page cache, negative values are KiB
+    'temp_store': 'MEMORY',
+}
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'mmap_size': 0,
+    'cache_size': -2000,
+    'temp_store': 'DEFAULT',
+}
+
+# The current Unix time in SQL, to the millisecond.
+NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
+# Triggers kept during bulk loads, so deleting an entry still drops its tags and history.
+_BULK_LOAD_KEPT = ('passwords_metadata_delete',)
+
+# Changes kept in the log of a vault no backup chain follows, for the caches of other processes.
+CHANGES_KEPT = 1000
+
+
+class SchemaManager:
+    """Creates and migrates the database schema.
+
+    The schema version is stored in ``PRAGMA user_version``. Each migration runs in its
+    own transaction together with the version bump, so a crash never leaves a migration
+    half applied. Databases created before versioning start at version 0 and are brought
+    up to date without touching their data. The transactions take the write lock before
+    reading the version, so processes opening the same vault migrate it one at a time.
+
+    Atributes:
+        conn: The connection object to the database.
+    """
+
+    def __init__(self, conn):
+        """Initializes the instance based on the connection.
+
+        Args:
+            conn: The connection object to the database.
+        """
+        self.conn = conn
+
+    @property
+    def version(self):
+        """int: The current schema version."""
+        return self.conn.execute('PRAGMA user_version;').fetchone()[0]
+
+    @retry_busy
+    def migrate(self):
+        """Applies the pending migrations.
+
+        Return:
+            result (int): The number of migrations applied.
+
+        Raise:
+            Exception: If a migration fails, after rolling it back.
+        """
+        applied = 0
+        for version, migration in MIGRATIONS:
+            if version <= self.version:
+                continue
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE;')
+                if version <= self.version:  # applied by another process while this one waited
+                    self.conn.rollback()
+                    continue
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {version};')
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            applied += 1
+        return applied
+
+    @contextmanager
+    def bulk_load(self):
+        """Suspends the triggers of the passwords and tags tables while a vault is loaded in bulk.
+
+        Maintaining the trigram index and the change log row by row makes bulk loads
+        about ten times slower. The triggers are created again when the block exits and
+        the search index is rebuilt in one pass; the changes made meanwhile are not
+        tracked, nor are the timestamps and history, so this is only meant for a vault
+        nobody else uses, e.g. a restore, which writes the timestamps itself.
+        """
+        triggers = [(name, sql) for name, sql in self.conn.execute("""
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'trigger' AND tbl_name IN ('passwords', 'password_tags');
+        """).fetchall() if name not in _BULK_LOAD_KEPT]
+        for name, _ in triggers:
+            self.conn.execute(f'DROP TRIGGER {name};')
+        try:
+            yield
+        finally:
+            for _, sql in triggers:
+                self.conn.execute(sql)
+            if self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'passwords_fts';").fetchone():
+                self.conn.execute("INSERT INTO passwords_fts (passwords_fts) VALUES ('rebuild');")
+            self.conn.commit()
+
+    @retry_busy
+    def apply_pragmas(self, pragmas=None):
+        """Applies connection pragmas, the tuned ones by default.
+
+        Args:
+            pragmas (dict): The pragma values, by name.
+        """
+        for name, value in (TUNED_PRAGMAS if pragmas is None else pragmas).items():
+            self.conn.execute(f'PRAGMA {name} = {value};')
+
+
+def _create_base_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS master_key (
+            id integer primary key autoincrement,
+            hash text not null,
+            salt text not null
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS passwords (
+            service text primary key not null,
+            password text not null
+        );
+    """)
+
+
+def _create_service_index(cursor):
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS passwords_service_idx ON passwords (service);
+    """)
+
+
+def _create_key_rotation(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS key_rotation (
+            id integer primary key check (id = 1),
+            hash text not null,
+            salt blob not null,
+            cursor text
+        );
+    """)
+
+
+def _create_service_search(cursor):
+    cursor.execute("""
+        SELECT 1 FROM sqlite_master WHERE name = 'passwords_fts';
+    """)
+    if cursor.fetchone() is not None:
+        return
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE passwords_fts USING fts5(
+                service, content='passwords', content_rowid='rowid', tokenize='trigram'
+            );
+        """)
+    except sqlite3.OperationalError as e:  # SQLite built without FTS5 or the trigram tokenizer
+        print(e)
+        return
+    cursor.execute("""
+        CREATE TRIGGER passwords_fts_insert AFTER INSERT ON passwords BEGIN
+            INSERT INTO passwords_fts (rowid, service) VALUES (new.rowid, new.service);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER passwords_fts_delete AFTER DELETE ON passwords BEGIN
+            INSERT INTO passwords_fts (passwords_fts, rowid, service) VALUES ('delete', old.rowid, old.service);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER passwords_fts_update AFTER UPDATE OF service ON passwords BEGIN
+            INSERT INTO passwords_fts (passwords_fts, rowid, service) VALUES ('delete', old.rowid, old.service);
+            INSERT INTO passwords_fts (rowid, service) VALUES (new.rowid, new.service);
+        END;
+    """)
+    cursor.execute("""
+        INSERT INTO passwords_fts (passwords_fts) VALUES ('rebuild');
+    """)
+
+
+def _add_kdf_params(cursor):
+    # NULL parameters mean the vault predates them and uses the legacy PBKDF2 defaults.
+    for table in ('master_key', 'key_rotation'):
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD COLUMN kdf_algorithm text;
+        """)
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD COLUMN kdf_iterations integer;
+        """)
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD COLUMN kdf_memory integer;
+        """)
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD COLUMN kdf_parallelism integer;
+        """)
+
+
+def _create_change_tracking(cursor):
+    # One row per change, pruned once a backup has saved it; the seq orders the changes.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS passwords_changes (
+            seq integer primary key autoincrement,
+            service text not null
+        );
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS passwords_changes_service_idx ON passwords_changes (service, seq);
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS backup_state (
+            id integer primary key check (id = 1),
+            chain text,
+            seq integer not null
+        );
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS passwords_changes_insert AFTER INSERT ON passwords BEGIN
+            INSERT INTO passwords_changes (service) VALUES (new.service);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS passwords_changes_update AFTER UPDATE ON passwords BEGIN
+            INSERT INTO passwords_changes (service) SELECT old.service WHERE old.service != new.service;
+            INSERT INTO passwords_changes (service) VALUES (new.service);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS passwords_changes_delete AFTER DELETE ON passwords BEGIN
+            INSERT INTO passwords_changes (service) VALUES (old.service);
+        END;
+    """)
+
+
+def _create_metadata(cursor):
+    # The table is rebuilt: a column added by ALTER TABLE cannot default to the current time.
+    # Rowids are kept, the search index refers to them. Existing entries get no timestamps.
+    cursor.execute("""
+        SELECT sql FROM sqlite_master
+        WHERE type IN ('trigger', 'index') AND tbl_name = 'passwords' AND sql IS NOT NULL;
+    """)
+    definitions = [sql for sql, in cursor.fetchall()]
+    cursor.execute(f"""
+        CREATE TABLE passwords_metadata (
+            service text primary key not null,
+            password text not null,
+            username text,
+            url text,
+            created_at real default {NOW},
+            updated_at real default {NOW}
+        );
+    """)
+    cursor.execute("""
+        INSERT INTO passwords_metadata (rowid, service, password, created_at, updated_at)
+        SELECT rowid, service, password, NULL, NULL FROM passwords;
+    """)
+    cursor.execute("""
+        DROP TABLE passwords;
+    """)
+    cursor.execute("""
+        ALTER TABLE passwords_metadata RENAME TO passwords;
+    """)
+    for sql in definitions:
+        cursor.execute(sql)
+    cursor.execute("""
+        CREATE INDEX passwords_updated_idx ON passwords (updated_at);
+    """)
+    cursor.execute("""
+        CREATE TABLE password_tags (
+            tag text not null,
+            service text not null,
+            primary key (tag, service)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("""
+        CREATE INDEX password_tags_service_idx ON password_tags (service);
+    """)
+    cursor.execute("""
+        CREATE TABLE password_history (
+            id integer primary key autoincrement,
+            service text not null,
+            password text not null,
+            created_at real,
+            replaced_at real not null
+        );
+    """)
+    cursor.execute("""
+        CREATE INDEX password_history_service_idx ON password_history (service, id);
+    """)
+    # A rotation re-encrypts the passwords, that is neither a new version nor a change of the entry.
+    cursor.execute(f"""
+        CREATE TRIGGER passwords_history AFTER UPDATE OF password ON passwords
+        WHEN NOT EXISTS (SELECT 1 FROM key_rotation) BEGIN
+            INSERT INTO password_history (service, password, created_at, replaced_at)
+            VALUES (old.service, old.password, old.updated_at, {NOW});
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER passwords_touch AFTER UPDATE OF password, username, url ON passwords
+        WHEN NOT EXISTS (SELECT 1 FROM key_rotation) BEGIN
+            UPDATE passwords SET updated_at = {NOW} WHERE rowid = new.rowid;
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER passwords_metadata_delete AFTER DELETE ON passwords BEGIN
+            DELETE FROM password_tags WHERE service = old.service;
+            DELETE FROM password_history WHERE service = old.service;
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER password_tags_insert AFTER INSERT ON password_tags BEGIN
+            UPDATE passwords SET updated_at = {NOW} WHERE service = new.service;
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER password_tags_delete AFTER DELETE ON password_tags BEGIN
+            UPDATE passwords SET updated_at = {NOW} WHERE service = old.service;
+        END;
+    """)
+
+
+def _bound_change_tracking(cursor):
+    # Setting updated_at alone is the work of the touch triggers, the change behind it is logged already.
+    cursor.execute("""
+        DROP TRIGGER IF EXISTS passwords_changes_update;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER passwords_changes_update AFTER UPDATE OF service, password, username, url ON passwords BEGIN
+            INSERT INTO passwords_changes (service) SELECT old.service WHERE old.service != new.service;
+            INSERT INTO passwords_changes (service) VALUES (new.service);
+        END;
+    """)
+    # Tags are part of the entry, their changes are logged here now that touching updated_at is not.
+    # Tags dropped together with their entry are not, the delete is logged already.
+    for name, row in (('password_tags_insert', 'new'), ('password_tags_delete', 'old')):
+        cursor.execute(f"""
+            DROP TRIGGER IF EXISTS {name};
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {name} AFTER {name.rsplit('_', 1)[1].upper()} ON password_tags BEGIN
+                UPDATE passwords SET updated_at = {NOW} WHERE service = {row}.service;
+                INSERT INTO passwords_changes (service)
+                SELECT {row}.service WHERE EXISTS (SELECT 1 FROM passwords WHERE service = {row}.service);
+            END;
+        """)
+    # Without a backup chain nothing prunes the log, so it is cut every CHANGES_KEPT changes. The
+    # pruned range is recorded like a backup would, the caches reading the log then reload instead.
+    cursor.execute(f"""
+        CREATE TRIGGER passwords_changes_prune AFTER INSERT ON passwords_changes
+        WHEN new.seq % {CHANGES_KEPT} = 0
+            AND NOT EXISTS (SELECT 1 FROM backup_state WHERE chain IS NOT NULL) BEGIN
+            INSERT INTO backup_state (id, chain, seq) VALUES (1, NULL, new.seq - {CHANGES_KEPT})
+            ON CONFLICT (id) DO UPDATE SET seq = excluded.seq;
+            DELETE FROM passwords_changes WHERE seq <= new.seq - {CHANGES_KEPT};
+        END;
+    """)
+
+
+def _add_kdf_seconds(cursor):
+    # How long the last unlock derived the key, NULL until measured. A new master key row starts over.
+    cursor.execute("""
+        ALTER TABLE master_key ADD COLUMN kdf_seconds real;
+    """)
+
+
+MIGRATIONS = [
+    (1, _create_base_tables),
+    (2, _create_service_index),
+    (3, _create_key_rotation),
+    (4, _create_service_search),
+    (5, _add_kdf_params),
+    (6, _create_change_tracking),
+    (7, _create_metadata),
+    (8, _bound_change_tracking),
+    (9, _add_kdf_seconds),
+]
@@ -0,0 +1,82 @@
+_PREFIX_END = '\U0010ffff'  # sorts after any character, closes the prefix range
+
+
+class ServiceSearch:
+    """Indexed service lookups with keyset pagination.
+
+    Prefix queries are range scans on a unique index over ``passwords.service``.
+    Substring queries use an FTS5 trigram table kept in sync by triggers, and fall back
+    to a ``LIKE`` scan for queries shorter than a trigram or when FTS5 is not available.
+
+    Atributes:
+        conn: The connection object to the database.
+        has_fts (bool): True if the trigram table is available.
+    """
+
+    def __init__(self, conn):
+        """Initializes the instance based on the connection.
+
+        The index and the trigram table are created by the schema migrations.
+
+        Args:
+            conn: The connection object to the database.
+        """
+        self.conn = conn
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT 1 FROM sqlite_master WHERE name = 'passwords_fts';
+        """)
+        self.has_fts = cursor.fetchone() is not None
+
+    def search(self, query, mode='prefix', limit=50, after=None):
+        """Searches the services.
+
+        Prefix queries are case sensitive, substring queries are not.
+
+        Args:
+            query (str): The text to look for.
+            mode (str): Either ``prefix`` or ``substring``.
+            limit (int): The maximum number of services returned.
+            after (str): Only services sorted after this one are returned, pass the last
+                service of the previous page to get the next one.
+
+        Return:
+            result (list): The matching services, ordered by name.
+        """
+        if mode == 'prefix':
+            rows = self._search_prefix(query, limit, after)
+        elif mode == 'substring':
+            rows = self._search_substring(query, limit, after)
+        else:
+            raise ValueError(f"Unknown search mode: {mode}")
+        return [row[0] for row in rows]
+
+    def _search_prefix(self, query, limit, after):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT service FROM passwords
+            WHERE service >= ? AND service < ? AND service > ?
+            ORDER BY service
+            LIMIT ?;
+        """, (query, query + _PREFIX_END, after or '', limit))
+        return cursor.fetchall()
+
+    def _search_substring(self, query, limit, after):
+        cursor = self.conn.cursor()
+        if self.has_fts and len(query) >= 3:
+            cursor.execute("""
+                SELECT passwords.service FROM passwords_fts
+                JOIN passwords ON passwords.rowid = passwords_fts.rowid
+                WHERE passwords_fts MATCH ? AND passwords.service > ?
+                ORDER BY passwords.service
+                LIMIT ?;
+            """, ('"' + query.replace('"', '""') + '"', after or '', limit))
+        else:
+            pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            cursor.execute("""
+                SELECT service FROM passwords
+                WHERE service LIKE ? ESCAPE '\\' AND service > ?
+                ORDER BY service
+                LIMIT ?;
+            """, ('%' + pattern + '%', after or '', limit))
+        return cursor.fetchall()
@@ -0,0 +1,369 @@
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+
+from instrumentation import instrumented
+from model.concurrency import backoff_delays, is_busy
+from model.schema import SchemaManager
+
+DURABILITY_MODES = ('async', 'commit', 'fsync')
+
+_SET = 'set'
+_UPDATE = 'update'
+_DELETE = 'delete'
+
+_STATEMENTS = {
+    _SET: """
+        INSERT INTO passwords (service, password)
+        VALUES (?, ?)
+        ON CONFLICT (service) DO NOTHING
+    """,
+    _UPDATE: """
+        UPDATE passwords
+        SET password = ?
+        WHERE service = ?;
+    """,
+    _DELETE: """
+        DELETE FROM passwords WHERE service = ?
+    """,
+}
+
+
+class WriteQueue:
+    """A write-behind queue in front of a DatabaseManager, committing writes in groups.
+
+    ``set_password``, ``update_password`` and ``delete_password`` are queued and a
+    flusher thread writes them, in order, in one transaction once ``max_batch`` writes
+    are pending or the oldest one has waited ``max_delay`` seconds. The flusher uses its
+    own connection, so the vault must be a file in WAL mode.
+
+    The durability mode decides when a write returns:
+
+        async   at once; a crash loses the writes of the last ``max_delay`` seconds
+        commit  once its group is committed, which survives a crash of the process
+        fsync   once its group is committed and synced, which survives a power loss
+
+    With ``commit`` and ``fsync`` concurrent writers share one transaction and one sync.
+    A write the database rejects fails alone: its group is written again one write at a
+    time, each under a savepoint, so the other writes of the group are kept.
+    ``get_password`` and ``get_many`` see the queued writes. Every other method of the
+    DatabaseManager is passed through after a ``flush``, so it sees them too.
+
+    Atributes:
+        db_manager (DatabaseManager): The database manager the reads go to.
+        max_batch (int): The number of pending writes that triggers a flush.
+        max_delay (float): The number of seconds a write may wait before it is flushed.
+        durability (str): One of ``async``, ``commit`` or ``fsync``.
+    """
+
+    def __init__(self, db_manager, max_batch=1000, max_delay=0.05, durability='async'):
+        """Initializes the instance based on the database manager and starts the flusher.
+
+        Args:
+            db_manager (DatabaseManager): The database manager the reads go to.
+            max_batch (int): The number of pending writes that triggers a flush.
+            max_delay (float): The number of seconds a write may wait before it is flushed.
+            durability (str): One of ``async``, ``commit`` or ``fsync``.
+
+        Raise:
+            ValueError: If the durability mode is unknown.
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.db_manager = db_manager
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.durability = durability
+        self._pending = deque()  # (seq, op, service, password) in the order they were queued
+        self._by_service = defaultdict(list)  # service -> its pending (seq, op, password)
+        self._queued_seq = 0
+        self._committed_seq = 0
+        self._flush_requested = 0
+        self._oldest = None
+        self._error = None
+        self._failures = []  # [first seq, last seq, error, writers yet to be told] of the groups that could not be written
+        self._closed = False
+        self._condition = threading.Condition()
+        self._commit_lock = threading.Lock()  # held while a group is committed and dropped from the queue
+        self._flusher = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self._ready = threading.Event()
+        self._flusher.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def __getattr__(self, name):
+        attribute = getattr(self.db_manager, name)
+        if not callable(attribute):
+            return attribute
+
+        def flushed(*args, **kwargs):
+            self.flush()
+            return attribute(*args, **kwargs)
+
+        return flushed
+
+    @instrumented
+    def set_password(self, service, password):
+        """Queues setting a password for a given service, kept as is if the service exists.
+
+        Args:
+            service (str): The service for which the password is set.
+            password (str): The password to be set.
+        """
+        self._queue(_SET, service, password)
+
+    @instrumented
+    def update_password(self, service, password):
+        """Queues updating the password for a given service.
+
+        Args:
+            service (str): The service for which the password is updated.
+            password (str): The new password.
+        """
+        self._queue(_UPDATE, service, password)
+
+    @instrumented
+    def delete_password(self, service):
+        """Queues deleting the password for a given service.
+
+        Args:
+            service (str): The service for which the password is deleted.
+        """
+        self._queue(_DELETE, service, None)
+
+    @instrumented
+    def get_password(self, service):
+        """Gets the password for a given service, queued writes included.
+
+        Args:
+            service (str): The service for which the password is retrieved.
+
+        Return:
+            result (str): The password for the given service, or None if it is not found.
+        """
+        return self.get_many([service])[service]
+
+    @instrumented
+    def get_many(self, services, chunk_size=500):
+        """Gets the passwords for many services, queued writes included.
+
+        Args:
+            services (iterable): The services for which the passwords are retrieved.
+            chunk_size (int): The number of services bound per query.
+
+        Return:
+            result (dict): The password of each requested service, None for the services not found.
+        """
+        services = list(services)
+        with self._condition:
+            queued = [service for service in services if service in self._by_service]
+        if not queued:
+            return self.db_manager.get_many(services, chunk_size)
+        # The committed state and the queued writes must come from the same side of a commit.
+        with self._commit_lock:
+            result = self.db_manager.get_many(services, chunk_size)
+            with self._condition:
+                for service in queued:
+                    for _, op, password in self._by_service.get(service, ()):
+                        result[service] = _replay(op, result[service], password)
+        return result
+
+    @instrumented
+    def flush(self):
+        """Waits until every write queued so far is committed.
+
+        Raise:
+            Exception: In ``async`` mode, if a group of these writes could not be written, they are dropped.
+                In the other modes each writer is told about its own write instead.
+        """
+        with self._condition:
+            target = self._queued_seq
+            if self._committed_seq < target:
+                self._flush_requested = max(self._flush_requested, target)
+                self._condition.notify_all()
+            while self._committed_seq < target:
+                self._condition.wait()
+            if self.durability == 'async':
+                failed = [failure for failure in self._failures if failure[0] <= target]
+                if failed:
+                    self._failures = [failure for failure in self._failures if failure[0] > target]
+                    raise failed[0][2]
+
+    def close_connection(self):
+        """Flushes the queue, stops the flusher and closes both connections."""
+        if not self._closed:
+            self.flush()
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            self._flusher.join()
+        self.db_manager.close_connection()
+
+    def has_changed(self):
+        """Tells whether another connection committed since the last call, without flushing the queue.
+
+        The commits of the flusher count as changes too, invalidating a few cached entries for nothing.
+
+        Return:
+            result (bool): True if the vault may have changed.
+        """
+        return self.db_manager.has_changed()
+
+    def stats(self):
+        """Gets the queue counters.
+
+        Returns:
+            dict: The number of queued and committed writes, and the writes still pending.
+        """
+        with self._condition:
+            return {'queued': self._queued_seq, 'committed': self._committed_seq, 'pending': len(self._pending)}
+
+    def _queue(self, op, service, password):
+        with self._condition:
+            if self._closed:
+                raise Exception("The write queue is closed!")
+            self._queued_seq += 1
+            seq = self._queued_seq
+            self._pending.append((seq, op, service, password))
+            self._by_service[service].append((seq, op, password))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if len(self._pending) >= self.max_batch or self.durability != 'async':
+                self._condition.notify_all()
+            if self.durability != 'async':
+                self._wait_for(seq)
+
+    def _wait_for(self, seq):
+        while self._committed_seq < seq:
+            self._condition.wait()
+        for failure in self._failures:
+            first, last, error, untold = failure
+            if first <= seq <= last:
+                # Every writer of the group gets the error, the failure is dropped once they all have.
+                if untold == 1:
+                    self._failures.remove(failure)
+                else:
+                    failure[3] = untold - 1
+                raise error
+
+    def _run(self):
+        try:
+            conn = sqlite3.connect(self.db_manager.db_path)
+            SchemaManager(conn).apply_pragmas()
+            conn.execute(f"PRAGMA synchronous = {'FULL' if self.durability == 'fsync' else 'NORMAL'};")
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        while True:
+            with self._condition:
+                while not self._due():
+                    if self._closed and not self._pending:
+                        conn.close()
+                        return
+                    timeout = None
+                    if self._oldest is not None:
+                        timeout = max(self._oldest + self.max_delay - time.monotonic(), 0)
+                    self._condition.wait(timeout)
+                batch = list(self._pending)
+            self._commit(conn, batch)
+
+    def _due(self):
+        if not self._pending:
+            return False
+        return (len(self._pending) >= self.max_batch or self._flush_requested > self._committed_seq
+                or self.durability != 'async' or self._closed
+                or time.monotonic() - self._oldest >= self.max_delay)
+
+    def _commit(self, conn, batch):
+        failures = []
+        one_by_one = False
+        with self._commit_lock:
+            delays = backoff_delays()
+            while True:
+                cursor = conn.cursor()
+                try:
+                    if one_by_one:
+                        failures = _write_one_by_one(cursor, batch)
+                    else:
+                        for op, params in _runs(batch):
+                            cursor.executemany(_STATEMENTS[op], params)
+                    conn.commit()
+                    break
+                except Exception as e:
+                    conn.rollback()
+                    if not one_by_one and not is_busy(e):
+                        one_by_one = True  # a rejected write fails the whole group, find it
+                        continue
+                    delay = next(delays, None) if is_busy(e) else None
+                    if delay is None:  # not a lock held by another process, or it was held for too long
+                        print(e)
+                        failures = [[batch[0][0], batch[-1][0], e, len(batch)]]
+                        break
+                    time.sleep(delay)
+            with self._condition:
+                for _ in batch:
+                    self._pending.popleft()
+                for seq, _, service, _ in batch:
+                    writes = self._by_service[service]
+                    writes.pop(0)
+                    if not writes:
+                        del self._by_service[service]
+                self._oldest = time.monotonic() if self._pending else None
+                self._committed_seq = batch[-1][0]
+                self._failures.extend(failures)
+                self._condition.notify_all()
+
+
+def _runs(batch):
+    """Groups consecutive writes of the same kind, each group becomes one executemany."""
+    op, params = None, []
+    for _, next_op, service, password in batch:
+        if next_op != op and params:
+            yield op, params
+            params = []
+        op = next_op
+        params.append(_params(op, service, password))
+    if params:
+        yield op, params
+
+
+def _write_one_by_one(cursor, batch):
+    """Writes a group in one transaction, undoing only the writes the database rejects.
+
+    Returns:
+        list: The failures of the rejected writes, one per write.
+    """
+    failures = []
+    cursor.execute('BEGIN;')  # the savepoints must nest in the transaction, not start their own
+    for seq, op, service, password in batch:
+        cursor.execute('SAVEPOINT queued_write;')
+        try:
+            cursor.execute(_STATEMENTS[op], _params(op, service, password))
+        except sqlite3.Error as e:
+            if is_busy(e):
+                raise
+            cursor.execute('ROLLBACK TO queued_write;')
+            print(e)
+            failures.append([seq, seq, e, 1])
+        cursor.execute('RELEASE queued_write;')
+    return failures
+
+
+def _params(op, service, password):
+    if op == _SET:
+        return service, password
+    if op == _UPDATE:
+        return password, service
+    return (service,)
+
+
+def _replay(op, password, new_password):
+    if op == _SET:
+        return password if password is not None else new_password
+    if op == _UPDATE:
+        return new_password if password is not None else None
+    return None
@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import getpass
+import os
+import sys
+import tempfile
+
+from controller.password_manager import PasswordManager
+from controller.secret_server import SecretServer
+from model.async_database import AsyncDatabaseManager
+from model.database import DatabaseManager
+
+# Per-user runtime directory when there is one, readable by its owner only.
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                              f'passwords-{os.getuid()}.sock')
+
+
+async def serve(password_manager, db_path, socket_path, port, readers):
+    """Serves the secrets of the unlocked password manager until interrupted."""
+    async with AsyncDatabaseManager(db_path, readers) as async_db_manager:
+        secret_server = SecretServer(password_manager, async_db_manager)
+        server = await secret_server.start(path=socket_path, port=port)
+        address = socket_path or '127.0.0.1:%d' % server.sockets[0].getsockname()[1]
+        print(f"Serving secrets on {address}")
+        if secret_server.token is not None:
+            print(f"Token: {secret_server.token}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await secret_server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves the secrets of an unlocked vault to local scripts.')
+    parser.add_argument('--db', default='passwords_db', help='path to the vault')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='Unix socket path, only its owner can connect')
+    parser.add_argument('--tcp', action='store_true',
+                        help='serve on a localhost TCP port instead, clients must send the printed token')
+    parser.add_argument('--port', type=int, default=0, help='localhost TCP port, 0 picks a free one')
+    parser.add_argument('--readers', type=int, default=4, help='number of pooled reader connections')
+    args = parser.parse_args()
+
+    master_key = os.environ.get('PM_MASTER_KEY') or getpass.getpass('Master Key: ')
+    password_manager = PasswordManager(master_key, DatabaseManager(args.db))
+    if not password_manager.verify_master_key():
+        sys.exit('Wrong master key!')
+    password_manager.set_key_fernat()  # unlocked once, the cipher is reused by every request
+
+    if args.tcp:
+        args.socket = None
+    if args.socket and os.path.exists(args.socket):
+        os.remove(args.socket)
+    try:
+        asyncio.run(serve(password_manager, args.db, args.socket, args.port, args.readers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
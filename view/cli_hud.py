@@ -1,5 +1,6 @@
-from controller.password_manager import PasswordManager
-from model.database import DatabaseManager
+from controller.kdf import DEFAULT_KDF, configured_kdf
+from controller.unlock import BackgroundUnlock
+from controller.vault_registry import VaultRegistry
 
 import os
 import npyscreen
@@ -9,11 +10,18 @@ import pyperclip
 # TODO: Add the logic for the first time the user runs the application.
 # Master key is 12345
 
+SERVICES_PAGE_SIZE = 50
+
 class MasterKeyForm(npyscreen.ActionFormMinimal):
     """The form to enter the master key."""
 
     def create(self):
         """Creates the applications objects."""
+        vault_names = self.parentApp.vaults.names()
+        self.vault = None
+        if len(vault_names) > 1:  # the vault is only asked for when there is a choice
+            self.vault = self.add(npyscreen.TitleSelectOne, name='Vault', values=vault_names, value=[0],
+                                  max_height=min(len(vault_names), 5), scroll_exit=True)
         self.master_key = self.add(npyscreen.TitlePassword, name='Master Key')
         self.exit_bt = self.add(npyscreen.ButtonPress, name='Exit')
         self.exit_bt.whenPressed = self.exit
@@ -21,6 +29,8 @@ class MasterKeyForm(npyscreen.ActionFormMinimal):
     def on_ok(self):
         """Checks if the master key is correct when the user presses the OK button."""
         master_key = self.master_key.value
+        if self.vault is not None:
+            self.parentApp.password_manager = self.parentApp.vaults.open(self.vault.get_selected_objects()[0])
 
         master_key_check = self.parentApp.password_manager.db_manager.get_master_key_hash()
         if master_key_check is None:
@@ -29,8 +39,10 @@ class MasterKeyForm(npyscreen.ActionFormMinimal):
         self.parentApp.password_manager.master_key = master_key
 
         if self.parentApp.password_manager.verify_master_key():
-            self.parentApp.password_manager.set_key_fernat()
-            self.parentApp.switchForm('PasswordManagerMenu')
+            self.parentApp.password_manager.reload_key_params()
+            self.parentApp.unlock = BackgroundUnlock(self.parentApp.password_manager)
+            self.parentApp.unlock.start()
+            self.parentApp.switchForm('UnlockForm')
         else:
             npyscreen.notify_confirm("Wrong master key!", title='Error')
 
@@ -40,13 +52,67 @@ class MasterKeyForm(npyscreen.ActionFormMinimal):
         self.parentApp.switchForm(None)
 
 
+class UnlockForm(npyscreen.ActionFormMinimal):
+    """The form shown while the vault key is derived in the background."""
+
+    OK_BUTTON_TEXT = 'Cancel'
+
+    def create(self):
+        """Creates the applications objects."""
+        self.keypress_timeout = 1  # tenths of a second between progress updates
+        self.add(npyscreen.FixedText, value='Unlocking the vault...', editable=False)
+        self.progress = self.add(npyscreen.Slider, out_of=100, editable=False)
+
+    def beforeEditing(self):
+        """Resets the progress indicator."""
+        self.progress.value = 0
+
+    def while_waiting(self):
+        """Updates the progress, switching to the menu as soon as the key is ready."""
+        unlock = self.parentApp.unlock
+        if unlock is None:
+            return
+        if unlock.done():
+            self.parentApp.unlock = None
+            try:
+                unlock.finish()
+            except Exception as e:  # the worker failed, or the unlock was cancelled meanwhile
+                unlock.cancel()
+                npyscreen.notify_confirm(f"Unlocking failed: {e}", title='Error')
+                self.parentApp.switchForm('MAIN')
+                return
+            target = configured_kdf()
+            if target is not None and self.parentApp.password_manager.kdf.needs_upgrade_to(target):
+                # Re-encrypting the whole vault would freeze the interface, the command line does it.
+                npyscreen.notify_confirm(f'The vault uses a weaker key derivation than {target}.\n'
+                                         'Run "python cli.py kdf --upgrade" to upgrade it.', title='Key derivation')
+            self.parentApp.switchForm('PasswordManagerMenu')
+        else:
+            self.progress.value = int(unlock.progress * 100)
+            self.progress.display()
+
+    def on_ok(self):
+        """Cancels the unlock when the user presses the Cancel button."""
+        if self.parentApp.unlock is not None:
+            self.parentApp.unlock.cancel()
+            self.parentApp.unlock = None
+        self.parentApp.switchForm('MAIN')
+
+
 class PasswordManagerApp(npyscreen.NPSAppManaged):
     """Initializes the application."""
 
     def onStart(self):
         """Starts the forms of the application."""
-        self.password_manager = PasswordManager('none', DatabaseManager('passwords_db'))
+        self.vaults = VaultRegistry()
+        if os.environ.get('PM_VAULT_DIR'):
+            self.vaults.register_directory(os.environ['PM_VAULT_DIR'])
+        if not self.vaults.names():
+            self.vaults.register('passwords_db', 'passwords_db')
+        self.password_manager = self.vaults.open(self.vaults.names()[0])
+        self.unlock = None
         self.addForm('MAIN', MasterKeyForm, name='Password Manager')
+        self.addForm('UnlockForm', UnlockForm, name='Unlocking')
         self.addForm('PasswordManagerMenu', PasswordManagerMenu, name='Password Manager Menu')
         self.addForm('PasswordManagerForm', PasswordManagerForm, name='Password Manager')
         self.addForm('CreateMasterKeyForm', CreateMasterKeyForm, name='Create Master Key')
@@ -55,6 +121,7 @@ class PasswordManagerApp(npyscreen.NPSAppManaged):
         self.addForm('DeletePasswordForm', DeletePasswordForm, name='Delete Password')
 
     def onCleanExit(self):
+        self.vaults.close_all()  # drops the derived keys and closes the connections
         self.switchForm('CheckMasterKeyForm')
 
 
@@ -163,26 +230,99 @@ class CreateMasterKeyForm(npyscreen.ActionFormMinimal):
             npyscreen.notify_confirm('Master Key create with success!')
             hash_master_key = self.parentApp.password_manager.hash_string(master_key)
             salt = os.urandom(32)
-            self.parentApp.password_manager.db_manager.set_master_key_hash_and_salt(hash_master_key, salt)
+            kdf = configured_kdf() or DEFAULT_KDF
+            self.parentApp.password_manager.db_manager.set_master_key_hash_and_salt(hash_master_key, salt,
+                                                                                    kdf.as_row())
             self.parentApp.switchForm('MAIN')
         else:
             npyscreen.notify_confirm('Master Key must be identical!', title='Error')
 
 
+class ServiceBrowser(npyscreen.MultiLineAction):
+    """A scrollable list of services holding a single page at a time.
+
+    Pages are fetched with keyset pagination as the cursor moves past the first or last
+    line, so rendering and memory stay the same whatever the size of the vault. Each page
+    is one query of the trigram index, never a scan of the services.
+    """
+
+    def __init__(self, *args, **keywords):
+        super(ServiceBrowser, self).__init__(*args, **keywords)
+        self.query = ''
+        self.page_starts = [None]  # the service each visited page starts after, to go back
+
+    def set_query(self, query):
+        """Shows the first page of the services matching the query."""
+        self.query = query
+        self.page_starts = [None]
+        self.load_page()
+        self.cursor_line = 0
+        self.start_display_at = 0
+        self.display()
+
+    def load_page(self):
+        """Fetches the current page of services."""
+        self.values = self.parent.parentApp.password_manager.search_services(
+            self.query, mode='substring', limit=SERVICES_PAGE_SIZE, after=self.page_starts[-1])
+
+    def h_cursor_line_down(self, ch):
+        """Moves down, fetching the next page when the cursor leaves the last line."""
+        if self.values and self.cursor_line >= len(self.values) - 1 and len(self.values) == SERVICES_PAGE_SIZE:
+            self.page_starts.append(self.values[-1])
+            self.load_page()
+            if self.values:
+                self.cursor_line = 0
+                self.start_display_at = 0
+            else:  # the last page was exactly full
+                self.page_starts.pop()
+                self.load_page()
+            return
+        return super(ServiceBrowser, self).h_cursor_line_down(ch)
+
+    def h_cursor_line_up(self, ch):
+        """Moves up, fetching the previous page when the cursor leaves the first line."""
+        if self.cursor_line == 0 and len(self.page_starts) > 1:
+            self.page_starts.pop()
+            self.load_page()
+            self.cursor_line = len(self.values) - 1
+            self.start_display_at = max(0, len(self.values) - (len(self._my_widgets) - 1))
+            return
+        return super(ServiceBrowser, self).h_cursor_line_up(ch)
+
+    def actionHighlighted(self, act_on_this, key_press):
+        """Copies the password of the selected service."""
+        self.parent.copy_password(act_on_this)
+
+
 class DisplayPasswordsForm(npyscreen.ActionFormMinimal):
-    """The form to display the passwords."""
+    """The form to browse the services and copy their passwords."""
 
     def create(self):
         """Creates the applications objects."""
-        self.service_search = self.add(npyscreen.TitleText, name='Service')
-        self.show_services_bt = self.add(npyscreen.ButtonPress, name='Show Available Services')
-        self.show_services_bt.whenPressed = self.show_services
+        self.keypress_timeout = 2  # tenths of a second without typing before the filter is applied
+        self.pending_query = None
+        self.service_search = self.add(npyscreen.TitleText, name='Service',
+                                       value_changed_callback=self.filter_services)
         self.cancel_bt = self.add(npyscreen.ButtonPress, name='Back')
         self.cancel_bt.whenPressed = self.on_cancel
+        self.browser = self.add(ServiceBrowser, max_height=-2, scroll_exit=True)
 
-    def on_ok(self):
-        """Copies the password to the clipboard when the user presses the OK button."""
-        service = self.service_search.value
+    def beforeEditing(self):
+        """Loads the first page of services every time the form is shown."""
+        self.browser.set_query(self.service_search.value or '')
+
+    def filter_services(self, widget=None):
+        """Notes the query typed in the Service field, it is applied once the user pauses."""
+        self.pending_query = self.service_search.value or ''
+
+    def while_waiting(self):
+        """Filters the services with the query typed last, once per pause instead of once per keystroke."""
+        query, self.pending_query = self.pending_query, None
+        if query is not None and query != self.browser.query:
+            self.browser.set_query(query)
+
+    def copy_password(self, service):
+        """Copies the password of a service to the clipboard."""
         password_result = self.parentApp.password_manager.get_decrypted_password(service)
 
         if password_result:  # Checks if the password is found.
@@ -190,17 +330,14 @@ class DisplayPasswordsForm(npyscreen.ActionFormMinimal):
             npyscreen.notify_confirm('Password copied to clipboard!')
 
             self.service_search.value = ''
+            self.pending_query = None
+            self.browser.set_query('')
         else:
             npyscreen.notify_confirm('Password not found!', title='Error')
 
-    def show_services(self):
-        """Shows the available services when the user presses the Show Available Services button."""
-        services = self.parentApp.password_manager.get_services()
-        if services:  # Checks if the services list is found.
-            services_str = '\n'.join(service[0] for service in services)
-            npyscreen.notify_confirm(f"Available services: {services_str}")
-        else:
-            npyscreen.notify_confirm("No services found!")
+    def on_ok(self):
+        """Copies the password of the typed service to the clipboard when the user presses the OK button."""
+        self.copy_password(self.service_search.value)
 
     def on_cancel(self):
         """Switches to the PasswordManagerMenu when the user presses the Cancel button."""